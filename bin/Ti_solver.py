@@ -7,10 +7,13 @@ from fabry.tools.file_io import h5_2_dict, dict_2_h5, prep_folder, read_Ld_resul
 from fabry.tools.plotting import ringsum_click, my_hist, tableau20_colors
 import matplotlib.pyplot as plt
 from fabry.core.models import forward_model
+from fabry.core.likelihood import CalibrationMarginalizer
+from fabry.core.predictive import PredictiveBands, batched_forward_model, posterior_predictive
+from fabry.solvers import samplers
+from fabry.solvers.priors import PriorSpec, UniformPrior
+import fabry
 from os.path import join,isfile,abspath
 from mpi4py import MPI
-import pymultinest
-import multiprocessing as mp
 import random 
 
 def get_fitting_region(r,s,error,plotit=True):
@@ -35,14 +38,13 @@ def get_fitting_region(r,s,error,plotit=True):
 
 
 def Ti_solver(r, sig, sig_error, Ld_dir, finesse_dir, Ti_lim, V_lim, A_lim, basename, resume=False, 
-        w0=487.98634, mu=39.948, livepoints=1000):
+        w0=487.98634, mu=39.948, livepoints=1000, calibration=None, sampler='multinest'):
 
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0]*(Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
-        cube[1] = 1000.0*(cube[1]*(V_lim[1] - V_lim[0]) + V_lim[0]) # need to convert to m/s from km/s
-        cube[2] = cube[2]*(A_lim[1] - A_lim[0]) + A_lim[0]
+    def log_likelihood(cube):
+        if calibration is not None:
+            return calibration.log_likelihood(lambda L, d, F: forward_model(r, L, d, 21.0, w0, mu, cube[2], cube[0],
+                cube[1], nlambda=1024), sig, sig_error)
 
-    def log_likelihood(cube, ndim, nparams):
         i = np.random.choice(nL)
         #j = np.random.choice(nF)
 
@@ -60,7 +62,9 @@ def Ti_solver(r, sig, sig_error, Ld_dir, finesse_dir, Ti_lim, V_lim, A_lim, base
     r = r[::3]
     sig = sig[::3]
     sig_error = sig_error[::3]
-    nparams = 3
+    # V_lim is in km/s, the model wants m/s
+    priors = PriorSpec(['Ti', 'V', 'A'], [UniformPrior(*Ti_lim), UniformPrior(1000.0*V_lim[0], 1000.0*V_lim[1]),
+                                         UniformPrior(*A_lim)])
 
     Lpost, dpost = read_Ld_results(Ld_dir)
     Fpost, _, _, _ = read_finesse_results(finesse_dir)
@@ -68,14 +72,16 @@ def Ti_solver(r, sig, sig_error, Ld_dir, finesse_dir, Ti_lim, V_lim, A_lim, base
     nL = len(Lpost)
     nF = len(Fpost)
 
+    if calibration is not None:
+        calibration = CalibrationMarginalizer(Lpost, dpost, method=calibration)
+
     #L = 0.380173301412519577E+05
     #d = 0.883628502371783142E+00
     #F = 21.0
     #npts = 200
     #test_sig = np.zeros((npts, len(r)))
     #for i in xrange(npts):
-    #    cube = [random.random() for _ in xrange(3)]
-    #    log_prior(cube, None, None)
+    #    cube = priors.transform(np.random.rand(3))
     #    test_sig[i, :] = forward_model(r, L, d, F, w0, mu, cube[2], cube[0], cube[1], sm_ang=False, nlambda=1024)
     #fig, ax = plt.subplots()
     #for i in xrange(npts):
@@ -85,9 +91,9 @@ def Ti_solver(r, sig, sig_error, Ld_dir, finesse_dir, Ti_lim, V_lim, A_lim, base
 
 
 
-    pymultinest.run(log_likelihood, log_prior, nparams, importance_nested_sampling=False,
-            resume=resume, verbose=True, sampling_efficiency='q', n_live_points=livepoints,
-            outputfiles_basename=basename)
+    kwargs = {'sampling_efficiency': 'q'} if sampler == 'multinest' else {}
+    samplers.run_likelihood(log_likelihood, priors, basename, sampler=sampler, resume=resume, nlive=livepoints,
+            **kwargs)
 
 
 def check_solution(folder, Ld_dir, finesse_dir, recover=False, w0=487.98634, mu=39.948):
@@ -109,37 +115,29 @@ def check_solution(folder, Ld_dir, finesse_dir, recover=False, w0=487.98634, mu=
     d = dpost[i]
     F = Fpost[j]
 
-    Lstep = 100
-    Fstep = 100
-    Tistep = 100
-    analyzer = pymultinest.Analyzer(3, outputfiles_basename=join(folder, "Ti_"))
-    modes = analyzer.get_mode_stats()
-    Ti, V, A = modes['modes'][0]['mean']
-    print(modes['modes'][0]['sigma'])
+    # the equally weighted posterior is written by every sampler backend, unlike the MultiNest mode
+    # statistics. The posterior mean and standard deviation stand in for those of the (single) mode.
+    post = samplers.read_equal_weights(join(folder, "Ti_"))
+    Ti, V, A = np.mean(post[:, 0:3], axis=0)
+    print(np.std(post[:, 0:3], axis=0))
     print(Ti, V, A)
-    post = analyzer.get_equal_weighted_posterior()
 
     Tipost = post[::, 0]
     Vpost = post[::, 1]
     Apost = post[::, 2]
 
+    bands = None
     if recover:
         try:
-            post_dict = h5_2_dict(join(folder, "Ti_solver_model_post.h5"))
-            sig_post = post_dict["signal post"]
-        except:
+            bands = PredictiveBands.from_dict(h5_2_dict(join(folder, "Ti_solver_model_post.h5")))
+        except (IOError, KeyError):
             print("Can't recover Ti solver q posterior.  Calculating from scratch.")
-            sig_post = calculate_signal_post(r[ix], Lpost[::Lstep], dpost[::Lstep], Fpost[::Fstep],
-                Tipost[::Tistep], Vpost[::Tistep], Apost[::Tistep], w0, mu, nprocs=32)
-            dict_2_h5(join(folder, "Ti_solver_model_post.h5"), {"signal post": sig_post})
-    else:
-        sig_post = calculate_signal_post(r[ix], Lpost[::Lstep], dpost[::Lstep], Fpost[::Fstep],
-             Tipost[::Tistep], Vpost[::Tistep], Apost[::Tistep], w0, mu, nprocs=32)
-        dict_2_h5(join(folder, "Ti_solver_model_post.h5"), {"signal post": sig_post})
-
+    if bands is None:
+        bands = calculate_signal_post(r[ix], Lpost, dpost, Fpost, Tipost, Vpost, Apost, w0, mu)
+        dict_2_h5(join(folder, "Ti_solver_model_post.h5"), bands.to_dict())
 
-    sig_mean = np.mean(sig_post, axis=1)
-    percentiles = calculate_percentile_ranges(sig_post)
+    sig_mean = bands.mean
+    percentiles = bands.percentiles
     #vals = forward_model(r[ix], L, d, F, w0, mu, A, Ti, V, sm_ang=False, nlambda=1024)
 
     fig, ax = plt.subplots(figsize=(3.5, 3.5/1.61))
@@ -178,79 +176,14 @@ def check_solution(folder, Ld_dir, finesse_dir, recover=False, w0=487.98634, mu=
     plt.show()
 
 
-def calculate_percentile_ranges(data):
-    levels = [68, 95, 99]
-    lower_levels = [50.0 - x/2.0 for x in levels]
-    upper_levels = [50.0 + x/2.0 for x in levels]
-
-    percentiles = {}
-    for level, LL, UL in zip(levels, lower_levels, upper_levels):
-        lower = np.percentile(data, LL, axis=1)
-        upper = np.percentile(data, UL, axis=1)
-        percentiles[level] = (lower, upper)
-
-    return percentiles
-
-
-def calculate_signal_post(r, Lpost, dpost, Fpost, Tipost, Vpost, Apost, w0, mu, nprocs=16):
-    Lp, Fp, Tip = np.meshgrid(Lpost, Fpost, Tipost)
-    dp, _, Vp = np.meshgrid(dpost, Fpost, Vpost)
-    _, _, Ap = np.meshgrid(Lpost, Fpost, Apost)
-
-    Lp = Lp.flatten()
-    dp = dp.flatten()
-    Fp = Fp.flatten()
-    Tip = Tip.flatten()
-    Vp = Vp.flatten()
-    Ap = Ap.flatten()
-    print(len(Lp))
-
-    Lps = np.array_split(Lp, nprocs)
-    dps = np.array_split(dp, nprocs)
-    Fps = np.array_split(Fp, nprocs)
-    Tips = np.array_split(Tip, nprocs)
-    Vps = np.array_split(Vp, nprocs)
-    Aps = np.array_split(Ap, nprocs)
-
-    procs = []
-    sigs = {}
-    out = mp.Queue()
-    labels = ["{0}".format(proc) for proc in range(nprocs)]
-
-    for k in range(nprocs):
-        p = mp.Process(target=_forward_model, args=(r, Lps[k], dps[k], Fps[k], Aps[k], Tips[k], Vps[k], w0, mu),
-                kwargs={'out': out, 'label': labels[k]})
-        procs.append(p)
-        p.start()
-
-    for i in range(nprocs):
-        tup = out.get()
-        sigs[tup[0]] = tup[1]
-
-    for p in procs:
-        p.join()
-
-    sig_post = None
-    for k in labels:
-        if sig_post is None:
-            sig_post = sigs[k]
-        else:
-            sig_post = np.hstack((sig_post, sigs[k]))
-    return sig_post
-
-
-def _forward_model(r, Lpost, dpost, Fpost, Apost, Tipost, Vpost, w0, mu, out=None, label=None):
-    n = len(Lpost)
-    sig = np.zeros((len(r), n))
-    for i in range(n):
-        sig[:, i] = forward_model(r, Lpost[i], dpost[i], Fpost[i], w0, mu, Apost[i], 
-                Tipost[i], Vpost[i], sm_ang=False, nlambda=1024) 
-
-    if out and label:
-        out.put((label, sig))
-    else:
-        return sig
+def calculate_signal_post(r, Lpost, dpost, Fpost, Tipost, Vpost, Apost, w0, mu, nsamples=20000, batch_size=256):
+    # the L/d, F and plasma posteriors are independent, draw joint rows instead of their full product
+    def model(params):
+        L, d, F, Ti, V, A = params.T
+        return batched_forward_model(r, L, d, F, w0, mu, A, Ti, V)
 
+    posteriors = [np.column_stack((Lpost, dpost)), Fpost, np.column_stack((Tipost, Vpost, Apost))]
+    return posterior_predictive(model, posteriors, nsamples=nsamples, batch_size=batch_size)
 
 
 if __name__ == "__main__":
@@ -285,6 +218,12 @@ if __name__ == "__main__":
         parser.add_argument('--livepoints', type=int, default=1000,
                 help='number of livepoints to use in multinest. Default is 500.')
 
+        parser.add_argument('--sampler', type=str, default='multinest', choices=sorted(samplers.samplers),
+                help='sampling backend. Default is multinest')
+
+        parser.add_argument('--calibration', type=str, default=None, choices=['samples', 'moment'],
+                help='deterministic marginalization over the L and d posterior. Default is a random draw per call')
+
         parser.add_argument('--recover', action='store_true',
                 help=("Recover finesse solver q posterior written to an h5 file because "
                       "calculation takes a long time"))
@@ -330,17 +269,23 @@ if __name__ == "__main__":
             solver_in = {'r':rr,'sig':ss,'basename':basename, 'error':ss_sd, 
                     "Ld_dir": abspath(args.ld_folder), 'finesse_dir': abspath(args.finesse_folder),
                     "Ti_lim": args.Ti_lim, "V_lim": args.V_lim, "A_lim": amp_lim, 'w0': 487.98634,
-                    "mu": 39.948, 'livepoints': args.livepoints}
+                    "mu": 39.948, 'livepoints': args.livepoints, 'calibration': args.calibration,
+                    'sampler': args.sampler}
     else:
         solver_in = None
 
     solver_in = Comm.bcast(solver_in, root=0)
+
+    # compile the numba kernels once (rank 0 fills the on-disk cache) before sampling
+    fabry.warmup(comm=Comm)
+
     if solver_in is not None:
         print('im cheating!')
         Ti_solver(solver_in['r'], solver_in['sig']-3000.0, solver_in['error'], solver_in['Ld_dir'],
                 solver_in['finesse_dir'], solver_in['Ti_lim'], solver_in['V_lim'], solver_in['A_lim'],
                 solver_in['basename'], resume=True, w0=solver_in['w0'], mu=solver_in['mu'], 
-                livepoints=solver_in['livepoints'],)
+                livepoints=solver_in['livepoints'], calibration=solver_in['calibration'],
+                sampler=solver_in['sampler'])
 
 
     if rank == 0:
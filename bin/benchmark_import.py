@@ -0,0 +1,73 @@
+from __future__ import division, print_function
+import argparse
+import subprocess
+import sys
+import numpy as np
+
+# optional dependencies that must stay deferred until first use
+heavy_modules = ('matplotlib', 'scipy.integrate', 'scipy.optimize', 'scipy.odr', 'scipy.special', 'rawpy',
+                 'exifread', 'skimage', 'pymultinest', 'h5py', 'mpi4py')
+
+probe = """
+import sys, time
+t0 = time.time()
+import {module}
+dt = time.time() - t0
+print(dt)
+print(','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def time_import(module):
+    """Imports module in a fresh interpreter
+
+    Args:
+        module (str): module to import
+
+    Returns:
+        tuple (float, list): import time in seconds, heavy modules loaded by the import
+    """
+    code = probe.format(module=module, heavy=heavy_modules)
+    output = subprocess.check_output([sys.executable, '-W', 'ignore', '-c', code])
+    lines = output.decode().strip().splitlines()
+    loaded = [name for name in lines[-1].split(',') if name] if len(lines) > 1 else []
+    return float(lines[0]), loaded
+
+
+def main(module='fabry.core.models', budget=0.6, repeats=5):
+    """Checks the import time of module against a budget
+
+    The first import is discarded since it also pays for the byte code and numba caches.
+
+    Args:
+        module (str): module to import, default is fabry.core.models
+        budget (float): allowed median import time in seconds
+        repeats (int): number of timed imports
+
+    Returns:
+        bool: True if the median import time is within budget and no heavy module was loaded
+    """
+    time_import(module)
+    results = [time_import(module) for _ in range(repeats)]
+    times = np.array([dt for dt, _ in results])
+    loaded = sorted(set(name for _, names in results for name in names))
+
+    print('import {}: median {:.3f} s, min {:.3f} s, max {:.3f} s (budget {:.3f} s)'.format(
+        module, np.median(times), times.min(), times.max(), budget))
+    if loaded:
+        print('heavy modules imported eagerly: {}'.format(', '.join(loaded)))
+
+    return np.median(times) <= budget and not loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='checks the import time of a fabry module against a budget')
+    parser.add_argument('module', type=str, nargs='?', default='fabry.core.models',
+                        help='module to import, default is fabry.core.models')
+    parser.add_argument('--budget', '-b', type=float, default=0.6,
+                        help='allowed median import time in seconds, default is 0.6')
+    parser.add_argument('--repeats', '-n', type=int, default=5, help='number of timed imports, default is 5')
+    args = parser.parse_args()
+
+    ok = main(module=args.module, budget=args.budget, repeats=args.repeats)
+    sys.exit(0 if ok else 1)
@@ -3,9 +3,9 @@ from __future__ import division, print_function
 #sys.path.append("../")
 from fabry.plasma import plasma
 from fabry.core import models, ringsum
+from fabry.core.synthetic import CameraModel, RadialProfile
 from fabry.tools import file_io, images
 import numpy as np
-import concurrent.futures
 import matplotlib.pyplot as plt
 import time
 from numba import jit
@@ -39,33 +39,14 @@ def main(w, mass, temp, v_outer, r_outer, impact_factor, Lnu, fname, rmax=42.0):
     nx = 6000
     ny = 4000
 
-    data = np.zeros((ny, nx))
-    x = np.arange(1, nx+1, 1)
-    y = np.arange(1, ny+1, 1)
-
     x0 = 3000
     y0 = 2000
+    rmax_pix = np.sqrt(max(x0 - 1, nx - x0) ** 2 + max(y0 - 1, ny - y0) ** 2) + 1.0
 
-    XX, YY = np.meshgrid(x, y)
-    R = np.sqrt((XX-x0)**2 + (YY-y0)**2)
-
-    nprocs = 32 
-
-    split_r = np.array_split(R.flatten(), nprocs)
-    results = [0.0 for _ in split_r]
     t0 = time.time()
-    with concurrent.futures.ProcessPoolExecutor() as executor:
-        fut_to_spl = dict()
-        for idx, split in enumerate(split_r):
-             future = executor.submit(models.general_model, split, L, d, F, warr, spectrum)
-             fut_to_spl[future] = idx
-        for future in concurrent.futures.as_completed(fut_to_spl):
-             current_idx = fut_to_spl[future]
-             output = future.result()
-             results[current_idx] = output
-
-    results = np.concatenate(results)
-    results.shape = (ny, nx)
+    profile = RadialProfile.from_function(lambda r: models.general_model(r, L, d, F, warr, spectrum), rmax_pix,
+                                          rtol=1e-5)
+    results = profile.render(nx, ny, x0, y0, integrate=True)
 
     results *= 1000.0 / results.max()
 
@@ -97,16 +78,9 @@ def main(w, mass, temp, v_outer, r_outer, impact_factor, Lnu, fname, rmax=42.0):
     file_io.dict_2_h5(fname, image_data) 
 
 
-def add_noise(input_data):
-    output_data = np.zeros_like(input_data)
-    n, m = input_data.shape
-    noise_scale = np.sqrt(input_data)
-    for i in range(n):
-        print(i)
-        for j in range(m):
-            output_data[i, j] = input_data[i, j] + np.random.normal(loc=0.0, scale=noise_scale[i, j], size=1)
+def add_noise(input_data, seed=None):
+    return CameraModel().expose(input_data, seed=seed)
 
-    return output_data # output_data.astype(np.int16)
 
 if __name__ == "__main__":
     w0 = 487.98634
@@ -9,7 +9,8 @@ import matplotlib.pyplot as plt
 from fabry.core.models import forward_model
 from os.path import join,isfile,abspath
 from mpi4py import MPI
-import pymultinest
+from fabry.solvers import samplers
+from fabry.solvers.priors import PriorSpec, UniformPrior
 import multiprocessing as mp
 from fabry.core.models import peak_calculator
 
@@ -45,17 +46,13 @@ def get_finesse_region(r,s,error,plotit=True):
 
 
 def finesse_solver(r, sig, sig_error, Lpost, dpost, basename, F_lim, A_lim, 
-        Arel_lim, Ar_Ti_lim, offset_lim, w0, mu, livepoints=500, resume=True):
+        Arel_lim, Ar_Ti_lim, offset_lim, w0, mu, livepoints=500, resume=True, sampler='multinest'):
         #Arel_lim, Ar_Ti_lim,  w0, mu, livepoints=500):
 
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0] * (F_lim[1] - F_lim[0]) + F_lim[0]
-        cube[1] = cube[1] * (A_lim[1] - A_lim[0]) + A_lim[0]
-        cube[2] = cube[2] * (Arel_lim[1] - Arel_lim[0]) + Arel_lim[0]
-        cube[3] = cube[3] * (Ar_Ti_lim[1] - Ar_Ti_lim[0]) + Ar_Ti_lim[0]
-        #cube[4] = 10**(cube[4]*(offset_log_lim[1] - offset_log_lim[0]) + offset_log_lim[0])
+    priors = PriorSpec(['F', 'A', 'Arel', 'Ti'], [UniformPrior(*F_lim), UniformPrior(*A_lim),
+                                                 UniformPrior(*Arel_lim), UniformPrior(*Ar_Ti_lim)])
 
-    def log_likelihood(cube, ndim, nparams):
+    def log_likelihood(cube):
         # forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024, sm_ang=True)
         i = np.random.choice(npost)
         L = Lpost[i]
@@ -79,11 +76,10 @@ def finesse_solver(r, sig, sig_error, Lpost, dpost, basename, F_lim, A_lim,
         return -chisq/2.0
 
     offset_log_lim = [np.log10(x) for x in offset_lim]
-    nparams = 4
     npost = len(Lpost)
-    pymultinest.run(log_likelihood, log_prior, nparams, importance_nested_sampling=False,
-            resume=resume, verbose=True, sampling_efficiency='q', n_live_points=livepoints,
-            outputfiles_basename=basename, max_modes=500)
+    kwargs = {'sampling_efficiency': 'q', 'max_modes': 500} if sampler == 'multinest' else {}
+    samplers.run_likelihood(log_likelihood, priors, basename, sampler=sampler, resume=resume, nlive=livepoints,
+            **kwargs)
 
 def check_finesse(folder, recover=False):
     data = h5_2_dict(join(folder, 'input_finesse.h5'))
@@ -96,11 +92,10 @@ def check_finesse(folder, recover=False):
     r = data['r']
     sig = data['sig']
 
-    analyzer = pymultinest.Analyzer(5, outputfiles_basename=join(folder, "finesse_"))
-    modes = analyzer.get_mode_stats()
-    #F, A, Arel, Ti, offset = modes['modes'][0]['mean']
-    F, A, Arel, Ti = modes['modes'][0]['mean']
-    post = analyzer.get_equal_weighted_posterior()
+    # the equally weighted posterior is written by every sampler backend, unlike the MultiNest mode
+    # statistics. The posterior mean stands in for the mean of the (single) mode.
+    post = samplers.read_equal_weights(join(folder, "finesse_"))
+    F, A, Arel, Ti = np.mean(post[:, 0:4], axis=0)
     w0 = [487.873302, 487.98634]
     mu = [232.03806, 39.948]
 
@@ -373,6 +368,8 @@ if __name__ == "__main__":
                 help='error percentage to use in fitting. default is 0.05')
         parser.add_argument('--livepoints', type=int, default=200, 
                 help='number of livepoints to use in multinest. Default is 200.')
+        parser.add_argument('--sampler', type=str, default='multinest', choices=sorted(samplers.samplers),
+                help='sampling backend. Default is multinest')
         parser.add_argument('--recover', action='store_true', 
                 help=("Recover finesse solver q posterior written to an h5 file because "
                       "calculation takes a long time"))
@@ -423,7 +420,8 @@ if __name__ == "__main__":
             solver_in = {'r':rr,'sig':ss,'basename':basename, 'error':ss_sd,
                     'F_lim':args.F_lim, 'livepoints':args.livepoints, 'Ti_lim': args.Ti_Ar_lim, 
                     'Arel_lim': args.Arel_lim, 'Amp_lim':amp_lim, 'w0':[487.873302, 487.98634], 
-                    'mu':[232.03806, 39.948], 'Lpost':Lpost, 'dpost':dpost, 'offset_lim': offset_lim}
+                    'mu':[232.03806, 39.948], 'Lpost':Lpost, 'dpost':dpost, 'offset_lim': offset_lim,
+                    'sampler': args.sampler}
     else:
         solver_in = None
 
@@ -432,7 +430,7 @@ if __name__ == "__main__":
         finesse_solver(solver_in['r'], solver_in['sig'], solver_in['error'], solver_in['Lpost'], 
                 solver_in['dpost'], solver_in['basename'], solver_in['F_lim'], solver_in['Amp_lim'], 
                 solver_in['Arel_lim'], solver_in['Ti_lim'], solver_in['offset_lim'], solver_in['w0'], 
-                solver_in['mu'], livepoints=solver_in['livepoints'], resume=True)
+                solver_in['mu'], livepoints=solver_in['livepoints'], resume=True, sampler=solver_in['sampler'])
                 #solver_in['mu'], livepoints=solver_in['livepoints'], resume=False)
 
 
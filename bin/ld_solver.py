@@ -9,9 +9,10 @@ from fabry.tools.plotting import ringsum_click, peak_plot, my_hist, tableau20_co
 from fabry.tools.images import get_data
 import matplotlib.pyplot as plt
 from fabry.core.models import peak_calculator
+from fabry.solvers import samplers
+from fabry.solvers.priors import PriorSpec, UniformPrior
 from os.path import join,isfile,abspath
 from mpi4py import MPI
-import pymultinest
 import subprocess
 from scipy.special import erf
 
@@ -93,7 +94,8 @@ def get_pk_locations(r, s, s_sd, w, folder, pkerr=1, names=None, pkthresh=0.20,
     print(peaks_sd)
     return peaks, peaks_sd, orders
 
-def ld_multinest_solver(peaks, peaks_sd, orders, basename, L_lim, d_lim, livepoints=1000, resume=True):
+def ld_multinest_solver(peaks, peaks_sd, orders, basename, L_lim, d_lim, livepoints=1000, resume=True,
+        sampler='multinest'):
 
     ## one pixel is px_size mm so we need to convert the L_lim
     L_lim = [x/px_size for x in L_lim]
@@ -102,12 +104,9 @@ def ld_multinest_solver(peaks, peaks_sd, orders, basename, L_lim, d_lim, livepoi
 
     wavelengths = peaks.keys()
 
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0]*(L_lim[1]-L_lim[0]) + L_lim[0]
-        #cube[1] = 10**(cube[1]*(log_d_lim[1] - log_d_lim[0]) + log_d_lim[0])
-        cube[1] = cube[1]*(d_lim[1] - d_lim[0]) + d_lim[0]
+    priors = PriorSpec(['L', 'd'], [UniformPrior(*L_lim), UniformPrior(*d_lim)])
 
-    def log_likelihood(cube, ndim, nparams):
+    def log_likelihood(cube):
         chisq = 0.0
         prob = 1
         log_prob = 0.0
@@ -175,10 +174,10 @@ def ld_multinest_solver(peaks, peaks_sd, orders, basename, L_lim, d_lim, livepoi
     #print(peaks, peaks_sd)
     # _ = tanh_distribution(xarr, x0, sigma, plotit=True)
 
-    nparams = 2
-    pymultinest.run(log_likelihood, log_prior, nparams, importance_nested_sampling=False,
-            resume=resume, verbose=True, sampling_efficiency='model', n_live_points=livepoints,
-            outputfiles_basename=basename, max_modes=500)
+    # the L-d posterior is a set of narrow ridges, multinest needs room for its modes
+    kwargs = {'sampling_efficiency': 'model', 'max_modes': 500} if sampler == 'multinest' else {}
+    samplers.run_likelihood(log_likelihood, priors, basename, sampler=sampler, resume=resume, nlive=livepoints,
+            **kwargs)
 
     # Lpost, dpost = read_Ld_results("/home/milhone/Research/python_FabryPerot/Data/2018_06_01/ArgonCalib/")
     # #idx = np.where(dpost > 0.8834)
@@ -323,6 +322,8 @@ if __name__ == "__main__":
                 for fitting d in units of mm. Default is 0.87-0.89')
         parser.add_argument('--livepoints', type=int, default=2000, help='number of livepoints\
                 for multinest to use. Default is 2000.')
+        parser.add_argument('--sampler', type=str, default='multinest', choices=sorted(samplers.samplers),
+                help='sampling backend. Default is multinest')
         parser.add_argument('--no_solve',action='store_true', help='only writes peak information')
         parser.add_argument('--bins',type=int, default=20, help='number of bins to plot in histograms')
         args = parser.parse_args()
@@ -362,7 +363,8 @@ if __name__ == "__main__":
             solver_in = None
         else:
             solver_in = {'peaks':peaks, 'orders':orders, 'basename':basename, 'peaks_sd':peaks_sd,
-                    'L_lim':args.L_lim, 'd_lim':args.d_lim, 'livepoints':args.livepoints, 'resume':resume}
+                    'L_lim':args.L_lim, 'd_lim':args.d_lim, 'livepoints':args.livepoints, 'resume':resume,
+                    'sampler':args.sampler}
     else:
         solver_in = None
 
@@ -370,7 +372,8 @@ if __name__ == "__main__":
     if solver_in is not None:
         ld_multinest_solver(solver_in['peaks'], solver_in['peaks_sd'], solver_in['orders'],
                 solver_in['basename'], solver_in['L_lim'], solver_in['d_lim'], 
-                livepoints=solver_in['livepoints'], resume=solver_in['resume'])
+                livepoints=solver_in['livepoints'], resume=solver_in['resume'],
+                sampler=solver_in['sampler'])
 
     if rank == 0:
         ld_check(args.folder,bins=args.bins)
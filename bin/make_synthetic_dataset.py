@@ -0,0 +1,21 @@
+from __future__ import division, print_function
+import argparse
+import os.path as path
+from fabry.core.dataset import DatasetFactory
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Renders a synthetic dataset for solver validation into an HDF5 store. '
+                                                 'Rerunning with the same configuration resumes an interrupted run.')
+    parser.add_argument('config', type=str, help='dataset configuration (.json or .yml), see fabry.core.dataset')
+    parser.add_argument('output', type=str, help='HDF5 store to write')
+    parser.add_argument('--nworkers', type=int, default=None, help='number of worker processes, default=all cpus')
+    parser.add_argument('--mode', type=str, default=None, choices=DatasetFactory.modes,
+                        help='overrides the mode in the configuration')
+    args = parser.parse_args()
+
+    factory = DatasetFactory.load(path.abspath(path.expanduser(args.config)))
+    if args.mode is not None:
+        factory.mode = args.mode
+
+    nrendered = factory.run(path.abspath(path.expanduser(args.output)), nworkers=args.nworkers, verbose=True)
+    print('rendered {0:d} cases'.format(nrendered))
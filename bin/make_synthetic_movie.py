@@ -0,0 +1,19 @@
+from __future__ import division, print_function
+import argparse
+import os.path as path
+from fabry.core.movie import SyntheticMovie
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Renders a time evolving synthetic camera movie for streaming '
+                                                 'benchmarks into a multi page TIFF or an HDF5 store.')
+    parser.add_argument('config', type=str, help='movie configuration (.json or .yml), see fabry.core.movie')
+    parser.add_argument('output', type=str, help='.tif or .h5 file to write')
+    parser.add_argument('--nframes', type=int, default=None, help='overrides the number of frames')
+    parser.add_argument('--chunk-frames', type=int, default=16, help='frames held in memory at once, default=16')
+    args = parser.parse_args()
+
+    movie = SyntheticMovie.load(path.abspath(path.expanduser(args.config)))
+    if args.nframes is not None:
+        movie.nframes = args.nframes
+
+    movie.write(path.abspath(path.expanduser(args.output)), chunk_frames=args.chunk_frames, verbose=True)
@@ -7,14 +7,13 @@ from fabry.tools.file_io import h5_2_dict, dict_2_h5
 from fabry.tools.plotting import ringsum_click
 import matplotlib.pyplot as plt
 from os.path import join, abspath
-from scipy.special import wofz
+from fabry.core import models
 from scipy.optimize import curve_fit
 
 
 def voigt(x, x0, sigma, gamma):
-    z = (x-x0 + 1j*gamma) / sigma / np.sqrt(2) 
-    w = wofz(z)
-    return np.real(w) / sigma / np.sqrt(2*np.pi)
+    # gamma is the Lorentzian half width here, models.voigt takes the full width
+    return models.voigt(x, x0, sigma, 2.0*gamma)
 
 def double_voigt(x, x1, x2, sigma1, sigma2, gamma, amp1, amp2):
     return voigt(x, x1, sigma1, gamma)*amp1 + voigt(x,x2,sigma2,gamma)*amp2
@@ -152,8 +152,10 @@ def main(fname, bgfname=None, color='b', binsize=0.1, xguess=None,
         sig,sig_sd = sig0,sig0_sd
 
 
+    redges = ringsum.get_bin_edges(data, x0, y0, binsize=binsize)
+
     dic = {'fname': abspath(fname), 'color': color, 'center': (x0, y0),
-           'binsize': binsize, 'r': r, 'sig': sig, 'sig_sd': sig_sd}
+           'binsize': binsize, 'r': r, 'redges': redges, 'sig': sig, 'sig_sd': sig_sd}
 
     if bgfname is not None:
         dic['bg_fname'] = abspath(bgfname)
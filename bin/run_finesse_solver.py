@@ -9,6 +9,7 @@ import numpy as np
 from fabry.tools.file_io import read_Ld_results
 from os.path import abspath, join
 from mpi4py import MPI
+from fabry.solvers import samplers
 
 if __name__ == "__main__":
     print('im here in the start of the run finesse solver script')
@@ -25,6 +26,8 @@ if __name__ == "__main__":
                             help='Name of filter (Ar, He, ar, he, ...)')
         parser.add_argument('--restart', action='store_true', default=False,
                             help="Set to True if you want MultiNest to start over instead of resuming")
+        parser.add_argument('--sampler', type=str, default='multinest', choices=sorted(samplers.samplers),
+                            help="Sampler backend (see fabry.solvers.samplers). Default is multinest")
         args = parser.parse_args()
 
         if args.filter_type.lower() in ['ar', 'argon', '488']:
@@ -70,6 +73,7 @@ if __name__ == "__main__":
                      'filter': filter_type,
                      'restart': restart,
                      'out_folder': folder,
+                     'sampler': args.sampler,
                      }
 
     else:
@@ -90,7 +94,7 @@ if __name__ == "__main__":
         #        solver_in['Lpost'], solver_in['dpost'], resume=resume, test_plot=False)
 
         full_solver(solver_in['out_folder'], solver_in['prior_fname'], solver_in['data_fname'],
-                resume=resume, test_plot=False)
+                resume=resume, test_plot=False, sampler=solver_in['sampler'])
         #full_solver(solver_in['out_folder'], solver_in['data_fname'],
         #            resume=resume, test_plot=False)
     if rank == 0:
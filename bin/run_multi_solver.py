@@ -3,8 +3,10 @@ from __future__ import division, print_function
 import os.path as path
 from distutils.util import strtobool
 from mpi4py import MPI
+from fabry.solvers import samplers
 #sys.path.append("../")
 from fabry.tools import file_io
+import fabry
 import numpy as np
 import argparse
 import ConfigParser
@@ -71,6 +73,12 @@ if __name__ == "__main__":
                             help='Name of filter (Ar, He, ar, he, ...)')
         parser.add_argument('--restart', action='store_true', default=False,
                             help="Set to True if you want MultiNest to start over instead of resuming")
+        parser.add_argument('--amplitudes', type=str, default='sample', choices=['sample', 'profile', 'marginalize'],
+                            help="How to handle the linear chord amplitudes. Default is sample")
+        parser.add_argument('--fit_offset', action='store_true', default=False,
+                            help="Fit a constant offset for each chord analytically (profile/marginalize only)")
+        parser.add_argument('--sampler', type=str, default='multinest', choices=sorted(samplers.samplers),
+                            help="Sampler backend (see fabry.solvers.samplers). Default is multinest")
         args = parser.parse_args()
 
         if args.filter_type.lower() in ['ar', 'argon', '488']:
@@ -103,12 +111,18 @@ if __name__ == "__main__":
                      'output_folder':output_folder,
                      'restart': restart,
                      'filter': filter_type,
+                     'amplitudes': args.amplitudes,
+                     'fit_offset': args.fit_offset,
+                     'sampler': args.sampler,
                      }
     else:
         solver_in = None
 
     solver_in = Comm.bcast(solver_in, root=0)
 
+    # compile the numba kernels once (rank 0 fills the on-disk cache) before sampling
+    fabry.warmup(comm=Comm)
+
     if solver_in is not None:
         # run everything
         import fabry.plasma.argon_plasma_solver as solver
@@ -121,7 +135,9 @@ if __name__ == "__main__":
         restart = solver_in['restart']
 
         if solver_in['filter'] == 'argon':
-            solver.multi_image_solver(output_folder, chord_locs, folders, Lpost, dpost, Fpost, test_plot=False, resume=not restart)
+            solver.multi_image_solver(output_folder, chord_locs, folders, Lpost, dpost, Fpost, test_plot=False, resume=not restart,
+                                      amplitudes=solver_in['amplitudes'], fit_offset=solver_in['fit_offset'],
+                                      sampler=solver_in['sampler'])
         elif solver_in['filter'] == 'helium':
             raise NotImplementedError("Helium is not implemented yet")
         else:
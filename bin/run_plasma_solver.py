@@ -6,8 +6,10 @@ import argparse
 import os.path as path
 #sys.path.append("../")
 from fabry.tools import file_io
+import fabry
 import numpy as np
 from mpi4py import MPI
+from fabry.solvers import samplers
 
 def verify_restart():
     a = raw_input("Are you sure you want to restart? ")
@@ -42,6 +44,10 @@ if __name__ == "__main__":
                             help='Name of filter (Ar, He, ar, he, ...)')
         parser.add_argument('--restart', action='store_true', default=False,
                             help="Set to True if you want MultiNest to start over instead of resuming")
+        parser.add_argument('--sampler', type=str, default='multinest', choices=sorted(samplers.samplers),
+                            help="Sampler backend (see fabry.solvers.samplers). Default is multinest")
+        parser.add_argument('--table', action='store_true', default=False,
+                            help="Fix the calibration at its posterior mean and interpolate a tabulated model")
         args = parser.parse_args()
 
         if args.filter_type.lower() in ['ar', 'argon', '488']:
@@ -71,6 +77,8 @@ if __name__ == "__main__":
                      'Fpost': F_posterior,
                      'restart': restart,
                      'filter': filter_type,
+                     'sampler': args.sampler,
+                     'table': args.table,
                      }
 
     else:
@@ -78,6 +86,9 @@ if __name__ == "__main__":
 
     solver_in = Comm.bcast(solver_in, root=0)
 
+    # compile the numba kernels once (rank 0 fills the on-disk cache) before sampling
+    fabry.warmup(comm=Comm)
+
     if solver_in is not None:
         # here is where we will call the solver
         if solver_in['filter'] == 'argon':
@@ -86,7 +97,8 @@ if __name__ == "__main__":
             solver_args = (solver_in['folder'], solver_in['Fpost'], solver_in['Lpost'], solver_in['dpost'])
 
             #solver.no_vel_solver(*solver_args, resume=not solver_in['restart'], test_plot=True)
-            solver.const_vel_solver(*solver_args, resume=not solver_in['restart'], test_plot=False)
+            solver.const_vel_solver(*solver_args, resume=not solver_in['restart'], test_plot=False,
+                                    sampler=solver_in['sampler'], table=solver_in['table'])
             #solver.profile_vel_solver(*solver_args, resume=not solver_in['restart'], test_plot=False)
 
         elif solver_in['filter'] == 'helium':
@@ -1,5 +1,59 @@
-
 __version__ = '0.1.0'
 __author__ = "Jason Milhone <jason.m.milhone@gmail.com>"
 
-__all__ = ["core", "finesse", "plasma", "tools"]
+__all__ = ["core", "finesse", "plasma", "solvers", "tools", "warmup"]
+
+
+def warmup(comm=None):
+    """Compiles (or loads from the on-disk numba cache) every jit kernel for the float64 signatures
+    used by the solvers
+
+    Call this once per process before the sampler starts so the first likelihood call is not
+    charged with compilation. With an MPI communicator, rank 0 compiles and writes the cache first
+    and the other ranks load it after a barrier instead of all compiling at once.
+
+    Args:
+        comm (mpi4py.MPI.Comm, optional): MPI communicator
+    """
+    if comm is not None and comm.Get_rank() != 0:
+        comm.Barrier()
+        _compile_kernels()
+    else:
+        _compile_kernels()
+        if comm is not None:
+            comm.Barrier()
+
+
+def _compile_kernels():
+    import numpy as np
+    from .core import instrument, models, ringsum, synthetic
+    from .plasma import plasma
+
+    r = np.linspace(0.0, 1.0, 4)
+    w = np.linspace(487.9, 488.0, 8)
+    spec = np.ones_like(w)
+
+    models.trapezoidal_integration(spec, w)
+    models.airy_func(w, 0.5, 1.0, 20.0)
+    models.airy_func(w[:, np.newaxis], r, 1.0, 20.0)
+    models.doppler_calc(488.0, 40.0, 1.0, 0.0)
+    models.doppler_shift(488.0, 0.0)
+    models.doppler_broadening(488.0, 40.0, 1.0)
+    models.gaussian(w, 488.0, 0.01, 1.0)
+    models.gaussian(w, 488.0, 0.01, 1.0, False)
+    models.peak_calculator(1.0, 1.0, 488.0, 0)
+    models.general_model(r, 1.0, 1.0, 20.0, w, spec)
+    instrument.instrument_general_model(r, 1.0, 1.0, 20.0, w, spec, instrument.EtalonDefects(gaussian=1.0))
+
+    image = np.ones((4, 4))
+    ringsum.calculate_weighted_mean(r + 1.0, r + 1.0)
+    ringsum.super_pixelate(image, npix=2)
+
+    profile = synthetic.RadialProfile(1.0, spec)
+    profile.evaluate_r2(r)
+    profile.render(4, 4, 2.0, 2.0, out=image)
+    profile.render(4, 4, 2.0, 2.0, out=image, integrate=True)
+    profile.annulus_mean(r)
+    ringsum.annulus_pixel_counts(r + 1.0, 4, 4, 2.0, 2.0)
+
+    plasma.ChordModel(1.0, 488.0, 40.0, rmax=2.0, nr=4, nlambda=8)(1.0, 1.0, 0.0)
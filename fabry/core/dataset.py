@@ -0,0 +1,378 @@
+"""Synthetic dataset factory for solver validation campaigns
+
+A design lists cases as flat dicts of dotted parameter names, e.g.
+{'etalon.F': 21.0, 'light_source.temperature': 0.5, 'camera.read_noise': 5.0}, applied on top
+of a base configuration::
+
+    {"sensor": {"nx": 6000, "ny": 4000, "px_size": 0.004},
+     "etalon": {"L": 150.0, "d": 0.88, "F": 21.0},
+     "light_source": {"temperature": 0.5, "wavelength": 487.98634, "mu": 39.948, "velocity": 0.0},
+     "camera": {"gain": 1.0, "read_noise": 5.0, "bit_depth": 16},
+     "peak_counts": 2000.0}
+
+The sensor, etalon, light_source and camera entries are the to_dict layouts of the
+fabry.core.synthetic classes; light_source may name a 'class_name' (e.g. 'UniformPlasma', viewed
+along 'impact_factor') and camera may be left out for noiseless frames. peak_counts scales the
+emission so its peak is that many photoelectrons per pixel.
+
+Every case is rendered (fabry.core.synthetic.RadialProfile, pixel area integrated), exposed
+with its own seeded noise stream and stored as an image or as a ringsum in one HDF5 store.
+The 'direct_ringsum' mode skips the frame and generates the ringsum with the matching
+per-bin noise (fabry.core.synthetic.synthetic_ringsum):
+
+    /design/<name>    value of every design parameter for every case
+    /cases/<index>/   'image', or 'r', 'redges', 'sig', 'sig_sd' in the bin/process_image.py
+                      layout; attrs hold the design parameters, the full case configuration
+                      ('config', JSON) and the noise 'seed'
+
+A case group is only marked complete after all of its data is written, so an interrupted run
+resumes where it stopped and skips finished cases.
+
+Classes:
+    Design: base class for lists of cases
+    ParameterGrid: every combination of parameter values
+    RandomDesign: random cases drawn from a fabry.solvers.priors.PriorSpec
+    DatasetFactory: renders a design in parallel into an HDF5 store
+"""
+from __future__ import division, print_function
+import copy
+import itertools
+import json
+import multiprocessing
+import os.path as path
+import numpy as np
+from . import ringsum, synthetic
+from ..solvers.priors import PriorSpec, UniformPrior
+from ..tools.helpers import lazy_import
+
+h5py = lazy_import('h5py')
+yaml = lazy_import('yaml')
+
+try:
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+except ImportError:
+    ProcessPoolExecutor = None
+
+
+def _set_dotted(config, name, value):
+    keys = name.split('.')
+    for key in keys[:-1]:
+        config = config.setdefault(key, {})
+    config[keys[-1]] = value
+
+
+class Design(object):
+    """Base class for a list of cases
+
+    Attributes:
+        names (list): dotted parameter names
+        values (np.ndarray): (ncases, nparams) parameter values
+    """
+
+    def __init__(self, names, values):
+        super(Design, self).__init__()
+        self.names = list(names)
+        self.values = np.asarray(values, dtype=np.float64).reshape(-1, len(self.names))
+
+    def __len__(self):
+        return self.values.shape[0]
+
+    def __getitem__(self, index):
+        return dict(zip(self.names, self.values[index].tolist()))
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(names={!r}, ncases={!r})".format(class_name, self.names, len(self))
+
+
+class ParameterGrid(Design):
+    """Every combination of the listed parameter values
+
+    Attributes:
+        parameters (dict): dotted parameter name -> list of values
+    """
+
+    def __init__(self, parameters):
+        self.parameters = dict((name, list(np.atleast_1d(values))) for name, values in parameters.items())
+        names = sorted(self.parameters)
+        values = list(itertools.product(*[self.parameters[name] for name in names]))
+        super(ParameterGrid, self).__init__(names, values)
+
+    def to_dict(self):
+        """Returns a dict representation of the ParameterGrid"""
+        return {'grid': dict((name, [float(x) for x in values]) for name, values in self.parameters.items())}
+
+
+class RandomDesign(Design):
+    """Cases drawn at random from a prior spec
+
+    Attributes:
+        priors (PriorSpec): dotted parameter names and the distributions to draw them from
+        nsamples (int): number of cases
+        seed (int): seed of the draw
+    """
+
+    def __init__(self, priors, nsamples, seed=0):
+        if not isinstance(priors, PriorSpec):
+            names = sorted(priors)
+            priors = PriorSpec(names, [UniformPrior(*priors[name]) for name in names])
+        self.priors = priors
+        self.nsamples = int(nsamples)
+        self.seed = seed
+        cube = np.random.RandomState(seed).uniform(size=(self.nsamples, priors.ndim))
+        super(RandomDesign, self).__init__(priors.names, priors.transform(cube))
+
+    def to_dict(self):
+        """Returns a dict representation of the RandomDesign"""
+        random = {'nsamples': self.nsamples, 'seed': self.seed}
+        random.update(self.priors.to_dict())
+        return {'random': random}
+
+
+def build_case(config):
+    """Creates the synthetic objects of a case configuration
+
+    Args:
+        config (dict): case configuration, see the module docstring
+
+    Returns:
+        tuple (Sensor, Etalon, LightSource, CameraModel): camera is None if not configured
+    """
+    config = copy.deepcopy(config)
+    sensor = synthetic.Sensor.from_dict(config.get('sensor', {}))
+    etalon = synthetic.Etalon.from_dict(config.get('etalon', {}))
+
+    light_source = config.get('light_source', {})
+    light_cls = getattr(synthetic, light_source.pop('class_name', 'LightSource'))
+    light_source = light_cls.from_dict(light_source)
+
+    camera = config.get('camera', None)
+    if camera is not None:
+        camera = synthetic.CameraModel.from_dict(camera)
+
+    return sensor, etalon, light_source, camera
+
+
+def render_case(config, mode='image', seed=None):
+    """Renders one case of a dataset
+
+    Args:
+        config (dict): case configuration, see the module docstring
+        mode (str): 'image', 'ringsum' or 'direct_ringsum', default='image'
+        seed (np.random.SeedSequence, optional): seed for the camera noise
+
+    Returns:
+        dict: {'image': ...} or the ringsum dict with 'r', 'redges', 'sig', 'sig_sd', 'center', 'binsize'
+    """
+    sensor, etalon, light_source, camera = build_case(config)
+    profile = etalon.radial_profile(sensor, light_source, rtol=config.get('rtol', 1e-5),
+                                    impact_factor=config.get('impact_factor', None))
+
+    peak_counts = config.get('peak_counts', None)
+    if peak_counts is not None:
+        profile = synthetic.RadialProfile(profile.r2max, profile.values * (peak_counts / profile.values.max()))
+
+    binsize = config.get('binsize', 0.1)
+    if mode == 'direct_ringsum':
+        rs = synthetic.synthetic_ringsum(profile, sensor, binsize=binsize, camera=camera, seed=seed,
+                                         noise=camera is not None)
+        output = dict((key, rs[key]) for key in ('r', 'redges', 'sig', 'sig_sd', 'npix', 'binsize'))
+        output['center'] = np.array(rs['center'])
+        return output
+
+    image = profile.render(sensor.nx, sensor.ny, sensor.x0, sensor.y0, integrate=True)
+    if camera is not None:
+        image = camera.expose(image, seed=seed, nworkers=1)
+
+    if mode == 'image':
+        return {'image': image}
+
+    # ringsum counts pixels from 0, Sensor from 1
+    x0 = sensor.x0 - 1.0
+    y0 = sensor.y0 - 1.0
+    r, sig, sig_sd = ringsum.ringsum(image, x0, y0, binsize=binsize)
+    redges = ringsum.get_bin_edges(image, x0, y0, binsize=binsize)
+    return {'r': r, 'redges': redges, 'sig': sig, 'sig_sd': sig_sd, 'center': np.array([x0, y0]),
+            'binsize': binsize}
+
+
+def _render_indexed(index, config, mode, seed):
+    return index, render_case(config, mode=mode, seed=np.random.SeedSequence(entropy=seed, spawn_key=(index,)))
+
+
+class DatasetFactory(object):
+    """Renders every case of a design into one resumable, indexed HDF5 store
+
+    Attributes:
+        base (dict): base case configuration, see the module docstring
+        design (Design): cases to render
+        mode (str): 'image', 'ringsum' or 'direct_ringsum'
+        seed (int): campaign seed, case i draws its noise from SeedSequence(seed, spawn_key=(i,))
+    """
+    modes = ('image', 'ringsum', 'direct_ringsum')
+
+    def __init__(self, base, design, mode='image', seed=0):
+        super(DatasetFactory, self).__init__()
+        if mode not in self.modes:
+            raise ValueError("mode must be one of {}".format(self.modes))
+        self.base = base
+        self.design = design
+        self.mode = mode
+        self.seed = int(seed)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(design={!r}, mode={!r}, seed={!r})".format(class_name, self.design, self.mode, self.seed)
+
+    def case_config(self, index):
+        """Returns the full configuration of case index"""
+        config = copy.deepcopy(self.base)
+        for name, value in self.design[index].items():
+            _set_dotted(config, name, value)
+        return config
+
+    def _prepare_store(self, h5):
+        if 'design' in h5:
+            stored = h5['design']
+            same = sorted(stored.keys()) == sorted(self.design.names) and stored.attrs.get('mode') == self.mode
+            same = same and int(stored.attrs.get('seed')) == self.seed
+            for idx, name in enumerate(self.design.names):
+                same = same and np.array_equal(stored[name][()], self.design.values[:, idx])
+            if not same:
+                raise ValueError('{} holds a different design, mode or seed'.format(h5.filename))
+        else:
+            group = h5.create_group('design')
+            for idx, name in enumerate(self.design.names):
+                group.create_dataset(name, data=self.design.values[:, idx])
+            group.attrs['mode'] = self.mode
+            group.attrs['seed'] = self.seed
+            group.attrs['base'] = json.dumps(self.base)
+
+        cases = h5.require_group('cases')
+        done = set()
+        for key in list(cases.keys()):
+            if cases[key].attrs.get('complete', False):
+                done.add(int(key))
+            else:
+                del cases[key]
+        return done
+
+    def _write_case(self, h5, index, output):
+        group = h5['cases'].create_group('{0:06d}'.format(index))
+        for key, value in output.items():
+            if isinstance(value, np.ndarray) and value.size > 1:
+                group.create_dataset(key, data=value, compression='lzf')
+            else:
+                group.create_dataset(key, data=value)
+        for name, value in self.design[index].items():
+            group.attrs[name] = value
+        group.attrs['config'] = json.dumps(self.case_config(index))
+        group.attrs['seed'] = self.seed
+        group.attrs['complete'] = True
+        h5.flush()
+
+    def run(self, fname, nworkers=None, verbose=False):
+        """Renders every case that is not in the store yet
+
+        Args:
+            fname (str): HDF5 store, created if it does not exist
+            nworkers (int, optional): number of worker processes, defaults to the number of cpus
+            verbose (bool): print progress, default=False
+
+        Returns:
+            int: number of cases rendered by this call
+        """
+        nworkers = multiprocessing.cpu_count() if nworkers is None else max(1, int(nworkers))
+        with h5py.File(fname, 'a') as h5:
+            done = self._prepare_store(h5)
+            pending = [idx for idx in range(len(self.design)) if idx not in done]
+            if verbose:
+                print('{0:d} of {1:d} cases done, rendering {2:d}'.format(len(done), len(self.design), len(pending)))
+
+            if nworkers == 1 or ProcessPoolExecutor is None:
+                for idx in pending:
+                    self._write_case(h5, *_render_indexed(idx, self.case_config(idx), self.mode, self.seed))
+                    if verbose:
+                        print('case {0:d} done'.format(idx))
+                return len(pending)
+
+            # keep a bounded number of cases in flight so finished frames do not pile up in memory
+            queue = list(reversed(pending))
+            running = set()
+            with ProcessPoolExecutor(max_workers=nworkers) as executor:
+                while queue or running:
+                    while queue and len(running) < 2 * nworkers:
+                        idx = queue.pop()
+                        running.add(executor.submit(_render_indexed, idx, self.case_config(idx), self.mode,
+                                                    self.seed))
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        idx, output = future.result()
+                        self._write_case(h5, idx, output)
+                        if verbose:
+                            print('case {0:d} done'.format(idx))
+
+        return len(pending)
+
+    def to_dict(self):
+        """Returns a dict representation of the DatasetFactory"""
+        factory = {'base': self.base, 'mode': self.mode, 'seed': self.seed}
+        factory.update(self.design.to_dict())
+        return factory
+
+    @classmethod
+    def from_dict(cls, factory):
+        """Creates a DatasetFactory from a dict
+
+        Args:
+            factory (dict): {'base': {...}, 'grid': {name: values}} or
+                {'base': {...}, 'random': {'nsamples': n, 'seed': s, 'parameters': [...]}}
+                (a PriorSpec dict) with optional 'mode' and 'seed'
+
+        Returns:
+            DatasetFactory
+        """
+        if 'grid' in factory:
+            design = ParameterGrid(factory['grid'])
+        elif 'random' in factory:
+            random = factory['random']
+            design = RandomDesign(PriorSpec.from_dict(random), random['nsamples'], seed=random.get('seed', 0))
+        else:
+            raise ValueError("a dataset needs a 'grid' or a 'random' design")
+        return cls(factory.get('base', {}), design, mode=factory.get('mode', 'image'), seed=factory.get('seed', 0))
+
+    @classmethod
+    def load(cls, fname):
+        """Reads a DatasetFactory from a .json or .yml/.yaml file
+
+        Args:
+            fname (str): path to the dataset configuration
+
+        Returns:
+            DatasetFactory
+        """
+        with open(fname, 'r') as infile:
+            if path.splitext(fname)[-1].lower() in ('.yml', '.yaml'):
+                factory = yaml.safe_load(infile)
+            else:
+                factory = json.load(infile)
+        return cls.from_dict(factory)
+
+
+def read_case(fname, index):
+    """Reads one case of a dataset store
+
+    Args:
+        fname (str): HDF5 store written by DatasetFactory.run
+        index (int): case index
+
+    Returns:
+        dict: stored arrays plus 'truth' (the design parameters) and 'config' (full case configuration)
+    """
+    with h5py.File(fname, 'r') as h5:
+        group = h5['cases/{0:06d}'.format(index)]
+        case = dict((key, group[key][()]) for key in group.keys())
+        case['config'] = json.loads(group.attrs['config'])
+        names = h5['design'].keys()
+        case['truth'] = dict((name, float(group.attrs[name])) for name in names)
+    return case
@@ -1,13 +1,13 @@
 from __future__ import print_function
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.optimize import curve_fit
-from scipy.odr import ODR, Model, RealData
-from ..tools.plotting import my_hist
-try:
-    import pymultinest
-except ImportError:
-    pass
+from ..tools import plotting
+from ..tools.helpers import lazy_import
+from .models import forward_model_jacobian
+
+plt = lazy_import('matplotlib.pyplot')
+pymultinest = lazy_import('pymultinest')
+optimize = lazy_import('scipy.optimize')
+odr = lazy_import('scipy.odr')
 
 
 def determine_fit_range(r, signal, pkr, thres=0.15, plotit=False):
@@ -153,11 +153,11 @@ def find_peak(x, y, x_sd, y_sd, returnval=False, plotit=False):
         ax.set_title('initial guess')
         plt.show()
 
-    data = RealData(x, y, x_sd, y_sd)
-    model = Model(_gauss, fjacb=_gauss_fjacb, fjacd=_gauss_fjacd)
+    data = odr.RealData(x, y, x_sd, y_sd)
+    model = odr.Model(_gauss, fjacb=_gauss_fjacb, fjacd=_gauss_fjacd)
 
-    odr = ODR(data, model, beta0)
-    output = odr.run()
+    fit = odr.ODR(data, model, beta0)
+    output = fit.run()
 
     pk = output.beta[1]
     pk_err = output.sd_beta[1]
@@ -232,7 +232,7 @@ def find_maximum_3(x, y, y_sd, basename, plotit=False):
         f, ax = plt.subplots(1, 2)
         ax[0].errorbar(x, y, yerr=y_sd, fmt='.', color='C0')
         ax[0].axvspan(pk - pk_err, pk + pk_err, color='C1', alpha=0.3)
-        my_hist(ax[1], pks)
+        plotting.my_hist(ax[1], pks)
         plt.show()
 
     return pk, pk_err
@@ -258,7 +258,7 @@ def gaussian_fit(x, y):
     #ax.plot(xx, _gaussian(xx, *guess))
     #plt.show()
 
-    popt, pcov = curve_fit(_gaussian, x, yy, p0=guess, sigma=0.01 * yy, absolute_sigma=True)
+    popt, pcov = optimize.curve_fit(_gaussian, x, yy, p0=guess, sigma=0.01 * yy, absolute_sigma=True)
 
     #fig, ax = plt.subplots()
     #ax.plot(x, yy, 'o')
@@ -276,3 +276,192 @@ def gaussian_fit(x, y):
 
 def _gaussian(x, b, c):
     return np.exp(-0.5 * (x - b) ** 2 / c ** 2)
+
+
+def _map_parameter_names(nlines, fit):
+    """Expands the fit specification into parameter names, line parameters get an index suffix"""
+    names = []
+    for key in fit:
+        if key in ('L', 'd', 'F'):
+            names.append(key)
+        elif key in ('amp', 'temp', 'v'):
+            names += ['{0}{1:d}'.format(key, i) for i in range(nlines)]
+        else:
+            raise ValueError('unknown fit parameter {}'.format(key))
+    return names
+
+
+def _split_name(name):
+    """Splits an expanded line parameter name like 'temp1' into ('temp', 1)"""
+    key = name.rstrip('0123456789')
+    return key, int(name[len(key):])
+
+
+def map_fit(r, sig, error, L, d, F, w0, mu, amp, temp, v, fit=('amp', 'temp', 'v'), priors=None,
+            bounds=None, nlambda=1024, **kwargs):
+    """Levenberg-Marquardt MAP fit of forward_model with a Laplace approximation of the posterior
+
+    Uses the analytic Jacobian from models.forward_model_jacobian. The values passed for L, d, F,
+    amp, temp and v are the starting guess for the parameters in fit and held fixed otherwise.
+    Gaussian priors enter the least squares problem as extra residuals, so the minimum is the
+    MAP estimate and the inverse curvature at the minimum is the Laplace covariance.
+
+    Args:
+        r (np.ndarray): r values of the data
+        sig (np.ndarray): data
+        error (np.ndarray): standard deviation of the data
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w0 (Union[float, list]): central wavelength(s) in nm
+        mu (Union[float, list]): mass(es) in amu
+        amp (Union[float, list]): amplitude(s) for the lines
+        temp (Union[float, list]): temperature(s) in eV
+        v (Union[float, list]): velocities in m/s
+        fit (tuple): parameters to fit from 'L', 'd', 'F', 'amp', 'temp', 'v', the line
+            parameters are expanded to one per line (amp0, amp1, ...), default=('amp', 'temp', 'v')
+        priors (dict, optional): Gaussian priors as {name: (mean, sd)} using the expanded names
+        bounds (dict, optional): {name: (lower, upper)} using the expanded names, temperatures
+            are kept positive by default. Bounds switch scipy from 'lm' to the 'trf' method.
+        nlambda (int): number of points in wavelength array, default=1024
+        kwargs: passed to scipy.optimize.least_squares
+
+    Returns:
+        dict: 'names', 'params' (MAP values), 'sd', 'cov' (Laplace covariance), 'chisq',
+            'success', 'message', and 'values' with every forward model argument at the MAP
+    """
+    single = not isinstance(w0, (list, tuple, np.ndarray))
+    lines = {'amp': np.atleast_1d(np.array(amp, dtype=np.float64)),
+             'temp': np.atleast_1d(np.array(temp, dtype=np.float64)),
+             'v': np.atleast_1d(np.array(v, dtype=np.float64))}
+    etalon = {'L': float(L), 'd': float(d), 'F': float(F)}
+    nlines = len(lines['amp'])
+    names = _map_parameter_names(nlines, fit)
+
+    priors = {} if priors is None else priors
+    bounds = {} if bounds is None else dict(bounds)
+    for i in range(nlines):
+        if 'temp' in fit:
+            bounds.setdefault('temp{0:d}'.format(i), (1e-6, np.inf))
+
+    error = np.asarray(error, dtype=np.float64)
+    sig = np.asarray(sig, dtype=np.float64)
+    prior_names = [name for name in names if name in priors]
+    prior_mean = np.array([priors[name][0] for name in prior_names])
+    prior_sd = np.array([priors[name][1] for name in prior_names])
+    prior_idx = [names.index(name) for name in prior_names]
+
+    def unpack(p):
+        vals = dict(etalon)
+        vals.update({key: val.copy() for key, val in lines.items()})
+        for name, value in zip(names, p):
+            if name in etalon:
+                vals[name] = value
+            else:
+                key, i = _split_name(name)
+                vals[key][i] = value
+        return vals
+
+    def model_jacobian(p):
+        vals = unpack(p)
+        model, jac = forward_model_jacobian(r, vals['L'], vals['d'], vals['F'], np.atleast_1d(w0),
+                                            np.atleast_1d(mu), vals['amp'], vals['temp'], vals['v'],
+                                            nlambda=nlambda)
+        columns = []
+        for name in names:
+            if name in etalon:
+                columns.append(jac[name])
+            else:
+                key, i = _split_name(name)
+                columns.append(jac[key][i])
+        return model, np.array(columns).T
+
+    cache = {}
+
+    def evaluate(p):
+        key = tuple(p)
+        if key not in cache:
+            cache.clear()
+            cache[key] = model_jacobian(p)
+        return cache[key]
+
+    def residuals(p):
+        model, _ = evaluate(p)
+        res = (model - sig) / error
+        if prior_names:
+            res = np.concatenate((res, (p[prior_idx] - prior_mean) / prior_sd))
+        return res
+
+    def jacobian(p):
+        _, jac = evaluate(p)
+        jac = jac / error[:, np.newaxis]
+        if prior_names:
+            jac_prior = np.zeros((len(prior_names), len(names)))
+            jac_prior[np.arange(len(prior_names)), prior_idx] = 1.0 / prior_sd
+            jac = np.vstack((jac, jac_prior))
+        return jac
+
+    p0 = []
+    for name in names:
+        if name in etalon:
+            p0.append(etalon[name])
+        else:
+            key, i = _split_name(name)
+            p0.append(lines[key][i])
+    p0 = np.array(p0, dtype=np.float64)
+
+    lower = np.array([bounds.get(name, (-np.inf, np.inf))[0] for name in names])
+    upper = np.array([bounds.get(name, (-np.inf, np.inf))[1] for name in names])
+    p0 = np.clip(p0, lower, upper)
+    if np.all(np.isinf(lower)) and np.all(np.isinf(upper)):
+        kwargs.setdefault('method', 'lm')
+    else:
+        kwargs.setdefault('method', 'trf')
+        kwargs['bounds'] = (lower, upper)
+
+    # scale the steps by the parameter sizes, L and amplitudes are orders of magnitude apart from d
+    kwargs.setdefault('x_scale', 'jac')
+    result = optimize.least_squares(residuals, p0, jac=jacobian, **kwargs)
+
+    jac = jacobian(result.x)
+    try:
+        cov = np.linalg.inv(np.dot(jac.T, jac))
+    except np.linalg.LinAlgError:
+        cov = np.linalg.pinv(np.dot(jac.T, jac))
+
+    vals = unpack(result.x)
+    if single:
+        for key in ('amp', 'temp', 'v'):
+            vals[key] = vals[key][0]
+
+    return {'names': names,
+            'params': result.x,
+            'sd': np.sqrt(np.diag(cov)),
+            'cov': cov,
+            'chisq': np.sum(((evaluate(result.x)[0] - sig) / error) ** 2),
+            'success': result.success,
+            'message': result.message,
+            'values': vals,
+            }
+
+
+def laplace_prior_limits(fit_result, nsigma=5.0, limits=None):
+    """Narrowed uniform prior limits for nested sampling from a map_fit result
+
+    Args:
+        fit_result (dict): output of map_fit
+        nsigma (float): half width of the limits in Laplace standard deviations, default=5.0
+        limits (dict, optional): {name: (lower, upper)} original prior limits to clip to
+
+    Returns:
+        dict: {name: [lower, upper]} for every fitted parameter
+    """
+    limits = {} if limits is None else limits
+    out = {}
+    for name, p, sd in zip(fit_result['names'], fit_result['params'], fit_result['sd']):
+        lower, upper = p - nsigma * sd, p + nsigma * sd
+        if name in limits:
+            lower = max(lower, limits[name][0])
+            upper = min(upper, limits[name][1])
+        out[name] = [lower, upper]
+    return out
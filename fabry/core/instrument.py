@@ -0,0 +1,244 @@
+"""Non-ideal Fabry-Perot instrument function (plate defects, finite aperture)
+
+models.airy_func assumes perfectly flat, parallel plates and a point-like aperture. Real etalons
+have plate defects that spread the effective spacing and a finite aperture that spreads the
+angle of incidence. Both blur the Airy function in interference order m = 2d cos(theta) / lambda,
+where it is periodic with period 1. The Airy function is sampled on a uniform grid over one
+period and convolved with the defect kernels with an FFT. The result is cached per
+(F, kernel widths, grid size), so a model evaluation only interpolates the tabulated function
+(in a compiled loop like models.general_model).
+
+Classes:
+    EtalonDefects: plate defect and aperture broadening parameters
+
+Functions:
+    instrument_function: cached instrument function on a uniform phase grid
+    instrument_func: drop in replacement for models.airy_func
+    instrument_general_model: models.general_model with the non-ideal instrument function
+    instrument_forward_model: models.forward_model with the non-ideal instrument function
+"""
+from __future__ import division, print_function
+from collections import OrderedDict
+import numpy as np
+from numba import jit
+from .models import doppler_calc, gaussian, _trapezoid_weights
+
+_instrument_cache = OrderedDict()
+_max_cache_size = 256
+
+
+class EtalonDefects(object):
+    """Plate defect and aperture broadening parameters for the instrument function
+
+    Attributes:
+        gaussian (float): rms random plate defect (surface roughness) in nm, gives a Gaussian kernel
+        spherical (float): peak to valley spherical bowing of the plates in nm, gives a top hat kernel
+        aperture (float): spread in interference order from the finite aperture, gives a top hat kernel
+    """
+
+    def __init__(self, gaussian=0.0, spherical=0.0, aperture=0.0):
+        super(EtalonDefects, self).__init__()
+        self.gaussian = float(gaussian)
+        self.spherical = float(spherical)
+        self.aperture = float(aperture)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(gaussian={!r}, spherical={!r}, aperture={!r})".format(class_name, self.gaussian,
+                                                                         self.spherical, self.aperture)
+
+    def order_widths(self, wavelength):
+        """Kernel widths in interference order for a wavelength
+
+        A change in spacing delta changes the order by 2 delta / lambda.
+
+        Args:
+            wavelength (float): wavelength in nm
+
+        Returns:
+            tuple (float, float, float): Gaussian sigma, spherical width, aperture width (orders)
+        """
+        return 2.0 * self.gaussian / wavelength, 2.0 * self.spherical / wavelength, self.aperture
+
+    def is_ideal(self):
+        """True if every defect is zero"""
+        return self.gaussian == 0.0 and self.spherical == 0.0 and self.aperture == 0.0
+
+    def to_dict(self):
+        """Returns a dict representation of the EtalonDefects"""
+        return {'gaussian': self.gaussian, 'spherical': self.spherical, 'aperture': self.aperture}
+
+    @classmethod
+    def from_dict(cls, defects):
+        """Creates a new EtalonDefects from a dict
+
+        Args:
+            defects (dict): dictionary representation of an EtalonDefects
+
+        Returns:
+            EtalonDefects
+        """
+        return cls(gaussian=defects.get('gaussian', 0.0), spherical=defects.get('spherical', 0.0),
+                   aperture=defects.get('aperture', 0.0))
+
+
+def _default_npts(F):
+    # at least ~100 points across the ideal fringe width 1/F
+    return int(2 ** np.ceil(np.log2(max(128.0 * F, 1024.0))))
+
+
+def instrument_function(F, defects, wavelength, npts=None):
+    """Instrument function over one period of interference order
+
+    Args:
+        F (float): etalon finesse
+        defects (EtalonDefects): plate defect and aperture parameters
+        wavelength (float): wavelength in nm used to convert the plate defects to orders
+        npts (int, optional): number of grid points over one order, defaults to a power of 2
+            with about 100 points across the fringe
+
+    Returns:
+        tuple (np.ndarray, np.ndarray): fractional order grid in [0, 1), instrument function on the grid
+    """
+    if npts is None:
+        npts = _default_npts(F)
+
+    widths = defects.order_widths(wavelength)
+    key = (float(F), npts) + tuple(round(x, 12) for x in widths)
+    if key in _instrument_cache:
+        return _instrument_cache[key]
+
+    phase = np.arange(npts) / npts
+    Q = (2. * F / np.pi) ** 2
+    airy = 1.0 / (1.0 + Q * np.sin(np.pi * phase) ** 2)
+
+    # the kernels have analytic transforms, only the Airy function goes through the FFT
+    k = np.fft.rfftfreq(npts, d=1.0 / npts)
+    sigma_m, spherical_m, aperture_m = widths
+    transfer = np.exp(-2.0 * np.pi ** 2 * k ** 2 * sigma_m ** 2)
+    transfer *= np.sinc(k * spherical_m)
+    transfer *= np.sinc(k * aperture_m)
+
+    # the kernels are centered, their mean shift of the order is absorbed by d (and L)
+    values = np.fft.irfft(np.fft.rfft(airy) * transfer, n=npts)
+
+    if len(_instrument_cache) >= _max_cache_size:
+        _instrument_cache.popitem(last=False)
+    _instrument_cache[key] = (phase, values)
+
+    return phase, values
+
+
+def instrument_func(wavelength, cos_th, d, F, defects, npts=None, reference_wavelength=None):
+    """Non-ideal instrument function as a drop in replacement for models.airy_func
+
+    Args:
+        wavelength (np.ndarray): wavelength array in nm
+        cos_th (np.ndarray): cos(theta) array (broadcast against wavelength)
+        d (float): etalon spacing in mm
+        F (float): etalon finesse
+        defects (EtalonDefects): plate defect and aperture parameters
+        npts (int, optional): number of grid points over one order
+        reference_wavelength (float, optional): wavelength for the defect kernels, defaults to
+            the mean of wavelength
+
+    Returns:
+        np.ndarray: evaluated instrument function
+    """
+    if reference_wavelength is None:
+        reference_wavelength = np.mean(wavelength)
+    phase, values = instrument_function(F, defects, reference_wavelength, npts=npts)
+    order = 2.e6 * d * cos_th / wavelength
+    return np.interp(np.mod(order, 1.0), phase, values, period=1.0)
+
+
+@jit(nopython=True, cache=True)
+def _instrument_integral(r, L, d, F, wavelength, weights, values):
+    """Integrates weights against the tabulated instrument function, shaped like models.general_model
+
+    values holds the instrument function on npts uniform points over one order, it is linearly
+    interpolated with period 1 like np.interp(..., period=1.0).
+    """
+    npts = len(values)
+    scale = 2.e6 * d / wavelength
+    model = np.zeros(len(r))
+    for idx in range(len(r)):
+        cos = L / np.sqrt(L ** 2 + r[idx] ** 2)
+        total = 0.0
+        for j in range(len(wavelength)):
+            order = scale[j] * cos
+            s = (order - np.floor(order)) * npts
+            i = int(s)
+            t = s - i
+            if i >= npts:
+                i = 0
+                t = 0.0
+            total += weights[j] * ((1.0 - t) * values[i] + t * values[(i + 1) % npts])
+        model[idx] = total
+    return model
+
+
+def instrument_general_model(r, L, d, F, wavelength, emission, defects, npts=None):
+    """models.general_model with the non-ideal instrument function
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        wavelength (np.ndarray): wavelength array in nm
+        emission (np.ndarray): spectrum evaluated on wavelength
+        defects (EtalonDefects): plate defect and aperture parameters
+        npts (int, optional): number of grid points over one order
+
+    Returns:
+        np.ndarray: array length of r of the model
+    """
+    r = np.asarray(r, dtype=np.float64)
+    wavelength = np.asarray(wavelength, dtype=np.float64)
+    weights = _trapezoid_weights(wavelength) * emission
+    reference_wavelength = np.sum(weights * wavelength) / np.sum(weights)
+    _, values = instrument_function(F, defects, reference_wavelength, npts=npts)
+
+    # the compiled kernel does the interpolation and the loop over r
+    model = _instrument_integral(r.ravel(), float(L), float(d), float(F), wavelength, weights, values)
+    return model.reshape(r.shape)
+
+
+def instrument_forward_model(r, L, d, F, w0, mu, amp, temp, v, defects, nlambda=1024, npts=None):
+    """models.forward_model with the non-ideal instrument function
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w0 (Union[float, list]): central wavelength(s) in nm
+        mu (Union[float, list]): mass(es) in amu, a scalar is used for every line
+        amp (Union[float, list]): amplitude(s) for the lines, a scalar is used for every line
+        temp (Union[float, list]): temperature(s) in eV, a scalar is used for every line
+        v (Union[float, list]): velocities in m/s, a scalar is used for every line
+        defects (EtalonDefects): plate defect and aperture parameters
+        nlambda (int): number of points in wavelength array, default=1024
+        npts (int, optional): number of grid points over one order
+
+    Returns:
+        np.ndarray: array length of r of forward model
+
+    Raises:
+        ValueError: if a list of line parameters does not match the number of lines in w0
+    """
+    w0 = np.atleast_1d(np.asarray(w0, dtype=np.float64))
+    # scalar line parameters are shared by every line like in models.forward_model
+    try:
+        mu, amp, temp, v = (np.broadcast_to(np.asarray(x, dtype=np.float64), w0.shape) for x in (mu, amp, temp, v))
+    except ValueError:
+        raise ValueError("mu, amp, temp and v must be scalars or have one value per line in w0")
+
+    sigma, w = doppler_calc(w0, mu, temp, v)
+    wavelength = np.linspace(np.min(w) - 10. * np.max(sigma), np.max(w) + 10. * np.max(sigma), nlambda)
+    spec = 0.0
+    for ww, ss, aa in zip(w, sigma, amp):
+        spec = spec + gaussian(wavelength, ww, ss, aa)
+
+    return instrument_general_model(r, L, d, F, wavelength, spec, defects, npts=npts)
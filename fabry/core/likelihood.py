@@ -0,0 +1,242 @@
+"""Likelihood helpers shared by the MultiNest solvers.
+
+Functions:
+    fit_linear_parameters: weighted least squares for parameters that enter a model linearly
+    linear_log_likelihood: profiled or marginalized log likelihood over linear parameters
+
+Classes:
+    CalibrationMarginalizer: deterministic marginalization over the (L, d, F) calibration posterior
+"""
+from __future__ import division, print_function
+import numpy as np
+from ..tools.helpers import lazy_import
+
+special = lazy_import('scipy.special')
+
+
+def _design_matrix(basis, offset=False):
+    """Builds the (n_coefficients, n_points) design matrix from unit amplitude model(s)
+
+    Args:
+        basis (np.ndarray): model(s) evaluated with unit amplitude, shape (npts,) or (nbasis, npts)
+        offset (bool): append a constant column for an offset, default=False
+
+    Returns:
+        np.ndarray: design matrix with shape (ncoeff, npts)
+    """
+    design = np.atleast_2d(np.asarray(basis, dtype=np.float64))
+    if offset:
+        design = np.vstack((design, np.ones(design.shape[1])))
+    return design
+
+
+def fit_linear_parameters(basis, sig, error, offset=False):
+    """Solves for the best fit amplitudes (and optional offset) that enter the model linearly
+
+    The model is sig ~ sum_k c_k basis_k (+ c_offset).  The minimum chi squared and the
+    curvature matrix are computed in closed form from the normal equations.
+
+    Args:
+        basis (np.ndarray): model(s) evaluated with unit amplitude, shape (npts,) or (nbasis, npts)
+        sig (np.ndarray): data
+        error (np.ndarray): standard deviation of the data
+        offset (bool): fit a constant offset as well, default=False
+
+    Returns:
+        tuple (np.ndarray, float, float): best fit coefficients (offset last if requested),
+            minimum chi squared, log determinant of the curvature matrix
+    """
+    design = _design_matrix(basis, offset=offset)
+    weights = 1.0 / np.asarray(error) ** 2
+    y = np.asarray(sig)
+
+    wdesign = design * weights
+    curvature = np.dot(wdesign, design.T)
+    projection = np.dot(wdesign, y)
+
+    coeffs = np.linalg.solve(curvature, projection)
+
+    # chi^2_min = y^T W y - c^T M c
+    chisq = np.sum(weights * y ** 2) - np.dot(coeffs, projection)
+    chisq = max(chisq, 0.0)
+
+    sign, logdet = np.linalg.slogdet(curvature)
+    if sign <= 0:
+        logdet = np.inf
+
+    return coeffs, chisq, logdet
+
+
+def linear_log_likelihood(basis, sig, error, offset=False, marginalize=False, prior_lim=None):
+    """Gaussian log likelihood with the linear parameters profiled or marginalized out analytically
+
+    With marginalize=False the linear parameters are set to their best fit values (profile
+    likelihood).  With marginalize=True they are integrated over assuming a flat prior that
+    is wide compared to the likelihood, which adds the Gaussian volume term
+
+    .. math::
+        \\frac{k}{2}\\ln 2\\pi - \\frac{1}{2}\\ln\\det M - \\sum_k \\ln \\Delta c_k
+
+    Args:
+        basis (np.ndarray): model(s) evaluated with unit amplitude, shape (npts,) or (nbasis, npts)
+        sig (np.ndarray): data
+        error (np.ndarray): standard deviation of the data
+        offset (bool): include a constant offset as a linear parameter, default=False
+        marginalize (bool): marginalize instead of profile, default=False
+        prior_lim (list, optional): (lower, upper) flat prior limits for each coefficient, used
+            for the prior volume when marginalizing. If None, the volume term is dropped.
+
+    Returns:
+        tuple (float, np.ndarray): log likelihood, best fit coefficients
+    """
+    coeffs, chisq, logdet = fit_linear_parameters(basis, sig, error, offset=offset)
+    loglike = -chisq / 2.0
+
+    if marginalize:
+        ncoeff = len(coeffs)
+        loglike += 0.5 * ncoeff * np.log(2.0 * np.pi) - 0.5 * logdet
+        if prior_lim is not None:
+            loglike -= sum(np.log(upper - lower) for (lower, upper) in prior_lim)
+
+    return loglike, coeffs
+
+
+class CalibrationMarginalizer(object):
+    """Deterministic marginalization over the (L, d, F) calibration posterior
+
+    The solvers used to draw a random calibration sample on every likelihood call, which makes
+    the likelihood surface noisy for MultiNest. This class fixes the calibration nodes once so
+    the likelihood is a deterministic function of the plasma parameters.
+
+    Two methods are supported:
+        'samples': a fixed, thinned set of equally weighted posterior samples. The likelihood is
+            the log of the mean likelihood over the samples (log-sum-exp).
+        'moment': a Gaussian approximation of the calibration posterior. The model is evaluated
+            at 2n+1 sigma points (n=2 or 3 calibration parameters) and the model spread is added
+            in quadrature to the data error.
+
+    Attributes:
+        method (str): 'samples' or 'moment'
+        nodes (np.ndarray): calibration nodes with shape (nnodes, 3), columns are L, d, F (F is nan
+            if no finesse posterior was given)
+        weights (np.ndarray): weights for the nodes
+    """
+
+    def __init__(self, Lpost, dpost, Fpost=None, method='samples', nsamples=32, independent_F=False, seed=0):
+        super(CalibrationMarginalizer, self).__init__()
+        if method not in ('samples', 'moment'):
+            raise ValueError("method must be 'samples' or 'moment'")
+
+        self.method = method
+
+        Lpost = np.asarray(Lpost, dtype=np.float64)
+        dpost = np.asarray(dpost, dtype=np.float64)
+        nL = len(Lpost)
+
+        rng = np.random.RandomState(seed)
+        if Fpost is None:
+            Fpost = np.nan * np.ones(nL)
+            has_F = False
+        else:
+            Fpost = np.asarray(Fpost, dtype=np.float64)
+            has_F = True
+            if independent_F:
+                # pair each L, d sample with an independent (but fixed) F sample
+                Fpost = Fpost[rng.randint(len(Fpost), size=nL)]
+            elif len(Fpost) != nL:
+                raise ValueError('Fpost must be the same length as Lpost unless independent_F is True')
+
+        posterior = np.vstack((Lpost, dpost, Fpost)).T
+
+        if method == 'samples':
+            n = min(nsamples, nL)
+            idx = np.sort(rng.choice(nL, size=n, replace=False))
+            self.nodes = posterior[idx, :]
+            self.weights = np.ones(n) / n
+        else:
+            ndim = 3 if has_F else 2
+            self.nodes, self.weights = _sigma_points(posterior[:, 0:ndim])
+            if not has_F:
+                self.nodes = np.hstack((self.nodes, np.nan * np.ones((len(self.nodes), 1))))
+
+        self._log_weights = np.log(self.weights)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __iter__(self):
+        for L, d, F in self.nodes:
+            yield L, d, (None if np.isnan(F) else F)
+
+    def marginal_log_likelihood(self, loglike_func):
+        """Averages the likelihood over the calibration samples
+
+        Only valid for method='samples'.
+
+        Args:
+            loglike_func (callable): loglike_func(L, d, F) returns the log likelihood for a single
+                calibration sample. F is None if no finesse posterior was provided.
+
+        Returns:
+            float: log of the calibration averaged likelihood
+        """
+        if self.method != 'samples':
+            raise ValueError("marginal_log_likelihood requires method='samples'")
+        loglikes = np.array([loglike_func(L, d, F) for (L, d, F) in self])
+        return special.logsumexp(loglikes + self._log_weights)
+
+    def log_likelihood(self, model_func, sig, error):
+        """Gaussian log likelihood of the data marginalized over the calibration
+
+        Args:
+            model_func (callable): model_func(L, d, F) returns the model evaluated at the data
+                locations for a single calibration sample. F is None if no finesse posterior was
+                provided.
+            sig (np.ndarray): data
+            error (np.ndarray): standard deviation of the data
+
+        Returns:
+            float: log likelihood
+        """
+        vals = np.array([model_func(L, d, F) for (L, d, F) in self])
+
+        if self.method == 'samples':
+            chisq = np.sum((vals - sig) ** 2 / error ** 2, axis=1)
+            return special.logsumexp(-chisq / 2.0 + self._log_weights)
+
+        mean = np.dot(self.weights, vals)
+        var = np.dot(self.weights, (vals - mean) ** 2)
+        variance = error ** 2 + var
+        chisq = np.sum((mean - sig) ** 2 / variance)
+        # the effective errors depend on the parameters, keep the normalization relative to error
+        return -chisq / 2.0 - 0.5 * np.sum(np.log(variance / error ** 2))
+
+
+def _sigma_points(samples, kappa=1.0):
+    """Symmetric sigma points and weights for the mean and covariance of samples
+
+    Args:
+        samples (np.ndarray): posterior samples with shape (nsamples, ndim)
+        kappa (float): scaling parameter, default=1.0
+
+    Returns:
+        tuple (np.ndarray, np.ndarray): nodes with shape (2*ndim+1, ndim), weights
+    """
+    mean = np.mean(samples, axis=0)
+    cov = np.atleast_2d(np.cov(samples, rowvar=False))
+    ndim = len(mean)
+
+    # jitter keeps the Cholesky factorization happy for (nearly) degenerate posteriors
+    jitter = 1e-12 * np.diag(np.diag(cov) + (np.diag(cov) == 0.0))
+    sqrt_cov = np.linalg.cholesky((ndim + kappa) * (cov + jitter))
+
+    nodes = [mean]
+    for col in sqrt_cov.T:
+        nodes.append(mean + col)
+        nodes.append(mean - col)
+    nodes = np.array(nodes)
+
+    weights = np.ones(2 * ndim + 1) / (2.0 * (ndim + kappa))
+    weights[0] = kappa / (ndim + kappa)
+
+    return nodes, weights
@@ -0,0 +1,295 @@
+"""Struct-of-arrays line list for many-line spectra (Th calibration lamps, impurity lines, ...)
+
+Classes:
+    LineList: wavelengths, masses, relative amplitudes and temperature/velocity groups for a set of lines
+
+Functions:
+    linelist_forward_model: vectorized version of models.forward_model for a LineList
+"""
+from __future__ import division, print_function
+import numpy as np
+from .models import general_model
+from .quadrature import hermite_line_model, fourier_line_model
+from ..tools.helpers import lazy_import
+
+special = lazy_import('scipy.special')
+
+
+class LineList(object):
+    """Struct-of-arrays representation of a many-line spectrum
+
+    Lines share temperatures and velocities through integer group indices so that, for example,
+    every Th line can use the lamp temperature while the Ar II line has a free temperature.
+
+    Attributes:
+        wavelength (np.ndarray): unshifted wavelengths in nm
+        mu (np.ndarray): relative masses in amu
+        relative_amplitude (np.ndarray): relative amplitudes of the lines
+        temperature_group (np.ndarray): index into the temperature array for each line
+        velocity_group (np.ndarray): index into the velocity array for each line
+        band (tuple): (min, max) wavelength in nm of the filter band or None
+    """
+
+    def __init__(self, wavelength, mu, relative_amplitude=1.0, temperature_group=0, velocity_group=0, band=None):
+        super(LineList, self).__init__()
+        self.wavelength = np.atleast_1d(np.asarray(wavelength, dtype=np.float64))
+        n = len(self.wavelength)
+
+        self.mu = self._broadcast(mu, n, np.float64)
+        self.relative_amplitude = self._broadcast(relative_amplitude, n, np.float64)
+        self.temperature_group = self._broadcast(temperature_group, n, np.intp)
+        self.velocity_group = self._broadcast(velocity_group, n, np.intp)
+        self.band = band
+
+        if band is not None:
+            # lines outside of the filter band never make it to the camera
+            keep = np.logical_and(self.wavelength >= band[0], self.wavelength <= band[1])
+            self._select(keep)
+
+    @staticmethod
+    def _broadcast(values, n, dtype):
+        values = np.asarray(values, dtype=dtype)
+        if values.ndim == 0:
+            return values * np.ones(n, dtype=dtype)
+        if len(values) != n:
+            raise ValueError('line parameters are not all the same length')
+        return values.copy()
+
+    def _select(self, keep):
+        self.wavelength = self.wavelength[keep]
+        self.mu = self.mu[keep]
+        self.relative_amplitude = self.relative_amplitude[keep]
+        self.temperature_group = self.temperature_group[keep]
+        self.velocity_group = self.velocity_group[keep]
+
+    def __len__(self):
+        return len(self.wavelength)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}({!r}, {!r}, relative_amplitude={!r}, temperature_group={!r}, velocity_group={!r}, band={!r})".format(
+            class_name, self.wavelength, self.mu, self.relative_amplitude, self.temperature_group,
+            self.velocity_group, self.band)
+
+    def copy(self):
+        """Returns a copy of the LineList"""
+        return LineList(self.wavelength, self.mu, relative_amplitude=self.relative_amplitude,
+                        temperature_group=self.temperature_group, velocity_group=self.velocity_group,
+                        band=self.band)
+
+    def subset(self, keep):
+        """Returns a new LineList with only the selected lines
+
+        Args:
+            keep (np.ndarray): boolean mask or integer indices of lines to keep
+
+        Returns:
+            LineList
+        """
+        lines = self.copy()
+        lines._select(keep)
+        return lines
+
+    def doppler(self, temperatures, velocities):
+        """Calculates the Doppler width and shifted wavelength of every line
+
+        Args:
+            temperatures (Union[float, np.ndarray]): temperature in eV for each temperature group
+            velocities (Union[float, np.ndarray]): velocity in m/s for each velocity group
+
+        Returns:
+            tuple (np.ndarray, np.ndarray): sigma in nm, shifted wavelength in nm
+        """
+        temp = np.atleast_1d(np.asarray(temperatures, dtype=np.float64))[self.temperature_group]
+        vel = np.atleast_1d(np.asarray(velocities, dtype=np.float64))[self.velocity_group]
+        sigma = self.wavelength * 3.2765e-5 * np.sqrt(temp / self.mu)
+        w = self.wavelength * (1.0 - 3.336e-9 * vel)
+        return sigma, w
+
+    def amplitudes(self, amplitude=1.0):
+        """Line amplitudes: relative amplitudes times amplitude (scalar or one per line)"""
+        return self.relative_amplitude * np.asarray(amplitude, dtype=np.float64)
+
+    def spectrum(self, wavelength, temperatures, velocities, amplitude=1.0, gamma=None):
+        """Evaluates the sum of normalized line profiles for every line in one broadcast
+
+        Lines are Gaussian unless gamma is given, then they are Voigt profiles (Faddeeva function)
+        or Lorentzian where the temperature is zero.
+
+        Args:
+            wavelength (np.ndarray): wavelength array in nm
+            temperatures (Union[float, np.ndarray]): temperature in eV for each temperature group
+            velocities (Union[float, np.ndarray]): velocity in m/s for each velocity group
+            amplitude (Union[float, np.ndarray]): overall amplitude or one per line, default=1.0
+            gamma (Union[float, np.ndarray], optional): Lorentzian full width at half maximum in nm,
+                scalar or one per line
+
+        Returns:
+            np.ndarray: spectrum evaluated on wavelength
+        """
+        sigma, w = self.doppler(temperatures, velocities)
+        dx = wavelength[np.newaxis, :] - w[:, np.newaxis]
+
+        if gamma is None:
+            amps = self.amplitudes(amplitude) / (sigma * np.sqrt(2.0 * np.pi))
+            x = dx / sigma[:, np.newaxis]
+            return np.dot(amps, np.exp(-0.5 * x ** 2))
+
+        gamma = np.asarray(gamma, dtype=np.float64) * np.ones_like(w)
+        amps = self.amplitudes(amplitude) * np.ones_like(w)
+        # a tiny Gaussian width keeps the Faddeeva argument finite for pure Lorentzians
+        sigma = np.maximum(sigma, 1e-6 * np.maximum(gamma, 1e-12))
+        z = (dx + 0.5j * gamma[:, np.newaxis]) / (sigma[:, np.newaxis] * np.sqrt(2.0))
+        return np.dot(amps / (sigma * np.sqrt(2.0 * np.pi)), special.wofz(z).real)
+
+    def window_weights(self, r, L, d, F, velocities=0.0):
+        """Largest Airy transmission of each line over the radii r (narrow line approximation)
+
+        Args:
+            r (np.ndarray): radii of the fit window, same units as L
+            L (float): camera focal length
+            d (float): etalon spacing in mm
+            F (float): etalon finesse
+            velocities (Union[float, np.ndarray]): velocity in m/s for each velocity group, default=0.0
+
+        Returns:
+            np.ndarray: maximum Airy transmission for each line inside the window
+        """
+        r = np.asarray(r, dtype=np.float64)
+        vel = np.atleast_1d(np.asarray(velocities, dtype=np.float64))[self.velocity_group]
+        w = self.wavelength * (1.0 - 3.336e-9 * vel)
+
+        cos_th = L / np.sqrt(L ** 2 + r ** 2)
+        Q = (2. * F / np.pi) ** 2
+        phase = np.pi * 2.e6 * d * cos_th[np.newaxis, :] / w[:, np.newaxis]
+        airy = 1.0 / (1.0 + Q * np.sin(phase) ** 2)
+
+        # a window narrower than the ring spacing may miss the peak between samples, the
+        # phase spanned by the window tells us if a peak is inside
+        order = 2.e6 * d * cos_th[np.newaxis, :] / w[:, np.newaxis]
+        has_peak = np.floor(order.max(axis=1)) > np.floor(order.min(axis=1))
+
+        weights = airy.max(axis=1)
+        weights[has_peak] = 1.0
+        return weights
+
+    def cull(self, amplitude=1.0, rtol=1e-3, r=None, L=None, d=None, F=None, velocities=0.0):
+        """Returns a new LineList without the lines that contribute negligibly
+
+        A line is kept if its amplitude (times its largest Airy transmission inside the fit window
+        when r, L, d, and F are given) is at least rtol times that of the brightest line.
+
+        Args:
+            amplitude (Union[float, np.ndarray]): overall amplitude or one per line, default=1.0
+            rtol (float): relative contribution threshold, default=1e-3
+            r (np.ndarray, optional): radii of the fit window
+            L (float, optional): camera focal length
+            d (float, optional): etalon spacing in mm
+            F (float, optional): etalon finesse
+            velocities (Union[float, np.ndarray]): velocity in m/s for each velocity group, default=0.0
+
+        Returns:
+            LineList
+        """
+        return self.subset(self._keep(amplitude, rtol, r, L, d, F, velocities))
+
+    def _keep(self, amplitude, rtol, r=None, L=None, d=None, F=None, velocities=0.0):
+        contribution = np.abs(self.amplitudes(amplitude))
+        if r is not None:
+            contribution = contribution * self.window_weights(r, L, d, F, velocities=velocities)
+        return contribution >= rtol * contribution.max()
+
+    def to_dict(self):
+        """Returns a dict representation of the LineList"""
+        return {'wavelength': self.wavelength,
+                'mu': self.mu,
+                'relative_amplitude': self.relative_amplitude,
+                'temperature_group': self.temperature_group,
+                'velocity_group': self.velocity_group,
+                'band': self.band,
+                }
+
+    @classmethod
+    def from_dict(cls, lines):
+        """Creates a new LineList from a dict
+
+        Args:
+            lines (dict): dictionary representation of a LineList
+
+        Returns:
+            LineList
+        """
+        return cls(lines['wavelength'], lines['mu'],
+                   relative_amplitude=lines.get('relative_amplitude', 1.0),
+                   temperature_group=lines.get('temperature_group', 0),
+                   velocity_group=lines.get('velocity_group', 0),
+                   band=lines.get('band', None))
+
+
+def linelist_forward_model(r, L, d, F, lines, temperatures, velocities, amplitude=1.0, nlambda=1024, rtol=1e-4,
+                           quadrature='trapezoid', qtol=1e-4, gamma=None):
+    """Convolves a many-line Doppler spectrum with the ideal Fabry-Perot Airy function
+
+    This is the LineList equivalent of models.forward_model. The spectrum is built in a single
+    broadcast over (lines x wavelength) and lines that contribute less than rtol (relative to the
+    brightest line inside the fit window) are dropped before the wavelength grid is chosen.
+
+    With quadrature='hermite' the wavelength grid is replaced by per line Gauss-Hermite rules
+    sized for the accuracy qtol (see fabry.core.quadrature) and nlambda is ignored. With
+    quadrature='fourier' the Airy convolution is done analytically with its Fourier series, which
+    handles Lorentzian and Voigt lines (gamma) exactly and truncates the harmonics at qtol.
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        lines (LineList): lines to include
+        temperatures (Union[float, np.ndarray]): temperature in eV for each temperature group
+        velocities (Union[float, np.ndarray]): velocity in m/s for each velocity group
+        amplitude (Union[float, np.ndarray]): overall amplitude or one per line, default=1.0
+        nlambda (int): number of points in wavelength array, default=1024
+        rtol (float): culling threshold, set to 0 to keep every line, default=1e-4
+        quadrature (str): 'trapezoid' for the fixed wavelength grid, 'hermite' for adaptive
+            Gauss-Hermite quadrature or 'fourier' for the analytic series, default='trapezoid'
+        qtol (float): relative accuracy for quadrature='hermite' or 'fourier', default=1e-4
+        gamma (Union[float, np.ndarray], optional): Lorentzian full width at half maximum in nm
+            (Stark, instrument, ...), scalar or one per line. Not supported by 'hermite'.
+
+    Returns:
+        np.ndarray: array length of r of forward model
+    """
+    r = np.asarray(r, dtype=np.float64)
+    amplitude = np.asarray(amplitude, dtype=np.float64)
+
+    if gamma is not None:
+        gamma = np.asarray(gamma, dtype=np.float64)
+
+    if rtol > 0.0 and len(lines) > 1:
+        keep = lines._keep(amplitude, rtol, r=r, L=L, d=d, F=F, velocities=velocities)
+        if not np.all(keep):
+            lines = lines.subset(keep)
+            if amplitude.ndim > 0:
+                amplitude = amplitude[keep]
+            if gamma is not None and gamma.ndim > 0:
+                gamma = gamma[keep]
+
+    sigma, w = lines.doppler(temperatures, velocities)
+
+    if quadrature == 'hermite':
+        if gamma is not None:
+            raise ValueError("quadrature='hermite' only supports Gaussian lines, use 'fourier' with gamma")
+        return hermite_line_model(r, L, d, F, w, sigma, lines.amplitudes(amplitude), rtol=qtol)
+    elif quadrature == 'fourier':
+        return fourier_line_model(r, L, d, F, w, sigma, lines.amplitudes(amplitude),
+                                  gamma=0.0 if gamma is None else gamma, tol=qtol)
+    elif quadrature != 'trapezoid':
+        raise ValueError("quadrature must be 'trapezoid', 'hermite' or 'fourier'")
+
+    wing = 10. * np.max(sigma)
+    if gamma is not None:
+        wing += 25. * np.max(gamma)
+    wavelength = np.linspace(np.min(w) - wing, np.max(w) + wing, nlambda)
+    spec = lines.spectrum(wavelength, temperatures, velocities, amplitude=amplitude, gamma=gamma)
+
+    return general_model(r, L, d, F, wavelength, spec)
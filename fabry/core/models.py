@@ -1,17 +1,19 @@
 from __future__ import absolute_import, division, print_function
-from collections import Iterable
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
 import numpy as np
-from scipy.integrate import trapz
 from .zeeman import zeeman_lambda
+from ..tools.helpers import lazy_import
 from numba import jit
 import os.path as path
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    pass
+
+plt = lazy_import('matplotlib.pyplot')
+special = lazy_import('scipy.special')
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def trapezoidal_integration(y, x):
     """Performs trapezoidal intergration
 
@@ -24,12 +26,12 @@ def trapezoidal_integration(y, x):
     """
     n = len(x)
     area = 0.0
-    for i in xrange(n - 1):
+    for i in range(n - 1):
         area += (x[i + 1] - x[i]) * (y[i + 1] + y[i])
     return area / 2.0
 
 
-@jit
+@jit(nopython=True, cache=True)
 def peak_calculator(L, d, w, order):
     """
     Simple peak calculator for ideal Fabry-Perot.
@@ -53,7 +55,7 @@ def peak_calculator(L, d, w, order):
     return L * np.sqrt(m ** 2 / (m0 - order) ** 2 - 1.0)
 
 
-@jit
+@jit(nopython=True, cache=True)
 def airy_func(wavelength, cos_th, d, F):
     """
     Computes the Airy function (ideal Fabry-Perot instument function)
@@ -79,7 +81,7 @@ def airy_func(wavelength, cos_th, d, F):
     return airy
 
 
-@jit
+@jit(nopython=True, cache=True)
 def doppler_calc(w0, mu, temp, v):
     """
     Computes the doppler broadening sigma and the new central wavelength
@@ -105,17 +107,17 @@ def doppler_calc(w0, mu, temp, v):
     return sigma, w
 
 
-@jit
+@jit(nopython=True, cache=True)
 def doppler_shift(w0, v):
     return w0 * (1.0 - 3.336e-9 * v)
 
 
-@jit
+@jit(nopython=True, cache=True)
 def doppler_broadening(w0, mu, temp):
     return w0 * 3.2765e-5 * np.sqrt(temp / mu)
 
 
-@jit
+@jit(nopython=True, cache=True)
 def gaussian(wavelength, w, sigma, amp=1., norm=True):
     """
     Computes a gaussian for a given central wavelength, sigma and amp
@@ -135,11 +137,11 @@ def gaussian(wavelength, w, sigma, amp=1., norm=True):
         np.ndarray: spectrum evaluated on wavelength array
     """
     if norm:
-        norm = 1. / (sigma * np.sqrt(2. * np.pi))
+        scale = 1. / (sigma * np.sqrt(2. * np.pi))
     else:
-        norm = 1.
+        scale = 1.
     exp = np.exp(-0.5 * (wavelength - w) ** 2 / sigma ** 2)
-    return amp * norm * exp
+    return amp * scale * exp
 
 
 def lorentzian(wavelength, w, gamma, amp=1.):
@@ -163,6 +165,32 @@ def lorentzian(wavelength, w, gamma, amp=1.):
     return A / ((wavelength - w) ** 2 + (0.5 * gamma) ** 2)
 
 
+def voigt(wavelength, w, sigma, gamma, amp=1.):
+    """
+    Computes a normalized Voigt profile (Gaussian sigma convolved with a Lorentzian of full width gamma)
+    from the Faddeeva function
+
+    .. math::
+        V = \\frac{A}{\sigma \sqrt{2 \pi}} \\rm{Re}\\left[w\\left(\\frac{\\lambda - w_0 + i \\gamma/2}{\\sigma \\sqrt{2}}\\right)\\right]
+
+    Args:
+        wavelength (np.ndarray): wavelength array to calculate spec on
+        w (float): central wavelength (same units as wavelength array)
+        sigma (float): Gaussian sigma (same units as w)
+        gamma (float): Lorentzian full width at half maximum (same units as w)
+        amp (float): amplitude of spectrum, default=1.0
+
+    Returns:
+        np.ndarray: spectrum evaluated on wavelength array
+    """
+    if sigma <= 0.0:
+        return lorentzian(wavelength, w, gamma, amp=amp)
+    if gamma <= 0.0:
+        return gaussian(wavelength, w, sigma, amp=amp)
+    z = ((wavelength - w) + 0.5j * gamma) / (sigma * np.sqrt(2.))
+    return amp * special.wofz(z).real / (sigma * np.sqrt(2. * np.pi))
+
+
 def offset_forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024, sm_ang=False, coeff=0.15, Ip=None, Id=None):
     """Forward q with an attempt to q the 'offset' from nuissance lines
 
@@ -200,11 +228,15 @@ def offset_forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024, sm_ang=
     return vals
 
 
-@jit
-def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024):
+def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024, gamma=None):
     """
     Convolves the Doppler spectrum with the ideal Fabry-Perot Airy function.
 
+    If gamma is given, each line is a Voigt profile (Doppler Gaussian convolved with a Lorentzian
+    of full width gamma). The wavelength grid then extends 25 gamma past the Gaussian core, the
+    Lorentzian wings beyond that are dropped (see quadrature.fourier_forward_model for an exact
+    treatment).
+
     Args:
         r (np.ndarray): array of r values to compute q on
         L (float): camera lens focal length, same units as r (pixels or mm)
@@ -216,6 +248,8 @@ def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024):
         temp (Union[float, list]): temperature(s) in eV
         v (Union[float, list]): velocities in m/s
         nlambda (int): number of points in wavelength array, default=1024
+        gamma (Union[float, list], optional): Lorentzian full width(s) at half maximum in nm, with
+            several lines a scalar (like mu, amp, temp and v) is shared by all of them
 
     Returns:
         np.ndarray: array length of r of forward q
@@ -231,17 +265,33 @@ def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024):
         # if not all(len(x) == len(w0) for x in [mu, amp, temp, v]):
         #     raise ValueError('spec params are not all the same length')
 
+        # scalar line parameters are shared by every line
+        nlines = len(w0)
+        mu = np.broadcast_to(np.asarray(mu, dtype=np.float64), (nlines,))
+        amp = np.broadcast_to(np.asarray(amp, dtype=np.float64), (nlines,))
+        temp = np.broadcast_to(np.asarray(temp, dtype=np.float64), (nlines,))
+        v = np.broadcast_to(np.asarray(v, dtype=np.float64), (nlines,))
+        if gamma is not None:
+            gamma = np.broadcast_to(np.asarray(gamma, dtype=np.float64), (nlines,))
+
         sigma = []
         w = []
         for i, ww in enumerate(w0):
             width, new_w = doppler_calc(ww, mu[i], temp[i], v[i])
             sigma.append(width)
             w.append(new_w)
-        # wavelength = np.linspace(min(w) - 10.*max(sigma), max(w) + 10.*max(sigma), nlambda)[:,np.newaxis]
-        wavelength = np.linspace(min(w) - 10. * max(sigma), max(w) + 10. * max(sigma), nlambda)  # .reshape(nlambda, 1)
-        spec = 0.0
-        for idx, ww in enumerate(w):
-            spec += gaussian(wavelength, ww, sigma[idx], amp[idx])
+        if gamma is None:
+            # wavelength = np.linspace(min(w) - 10.*max(sigma), max(w) + 10.*max(sigma), nlambda)[:,np.newaxis]
+            wavelength = np.linspace(min(w) - 10. * max(sigma), max(w) + 10. * max(sigma), nlambda)  # .reshape(nlambda, 1)
+            spec = 0.0
+            for idx, ww in enumerate(w):
+                spec += gaussian(wavelength, ww, sigma[idx], amp[idx])
+        else:
+            wing = 10. * max(sigma) + 25. * max(gamma)
+            wavelength = np.linspace(min(w) - wing, max(w) + wing, nlambda)
+            spec = 0.0
+            for idx, ww in enumerate(w):
+                spec += voigt(wavelength, ww, sigma[idx], gamma[idx], amp[idx])
 
     else:
         # if not all([type(x) not in [list,tuple] for x in [mu, amp, temp, v]]):
@@ -250,9 +300,14 @@ def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024):
         #     raise ValueError('all spec params must be an instance of Iterable or not an instance, no mixing')
 
         sigma, w = doppler_calc(w0, mu, temp, v)
-        wavelength = np.linspace(w - 10. * sigma, w + 10. * sigma, nlambda)  # [:,np.newaxis]
-        # wavelength = np.linspace(w - 10.*sigma, w + 10.*sigma, nlambda).reshape(nlambda, 1)
-        spec = gaussian(wavelength, w, sigma, amp)
+        if gamma is None:
+            wavelength = np.linspace(w - 10. * sigma, w + 10. * sigma, nlambda)  # [:,np.newaxis]
+            # wavelength = np.linspace(w - 10.*sigma, w + 10.*sigma, nlambda).reshape(nlambda, 1)
+            spec = gaussian(wavelength, w, sigma, amp)
+        else:
+            wing = 10. * sigma + 25. * gamma
+            wavelength = np.linspace(w - wing, w + wing, nlambda)
+            spec = voigt(wavelength, w, sigma, gamma, amp)
 
     # sigma, w = doppler_calc(w0, mu, temp, v)
     # wavelength = np.linspace(w - 10.*sigma, w + 10.*sigma, nlambda)#[:,np.newaxis]
@@ -261,19 +316,13 @@ def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024):
     #    cos_th = 1.0 - 0.5 * (r/L)**2
     # else:
     #    cos_th = L / np.sqrt(L**2 + r**2)
-    cos_th = L / np.sqrt(L ** 2 + r ** 2)
-
     # cos_th = cos_th.reshape((1,len(r)))
     # cos_th = cos_th[np.newaxis, :]
 
     # q = trapz(spec*airy_func(wavelength, cos_th, d, F), wavelength, axis=0)
-    model = np.zeros_like(cos_th)
-
-    for idx, cos in enumerate(cos_th):
-        # print(trapz(spec*airy_func(wavelength, cos, d, F), wavelength).shape)
-        # q[idx] = trapz(spec*airy_func(wavelength, cos, d, F), wavelength)
-        model[idx] = trapezoidal_integration(spec * airy_func(wavelength, cos, d, F), wavelength)
-    return model
+    # the compiled kernel does the loop over r
+    return general_model(np.asarray(r, dtype=np.float64), float(L), float(d), float(F), wavelength,
+                         np.asarray(spec, dtype=np.float64))
 
 
 def match_finesse_forward(r, L, d, F, temp, v, errtemp=None, w0=487.98634, mu=39.948):
@@ -285,7 +334,7 @@ def match_finesse_forward(r, L, d, F, temp, v, errtemp=None, w0=487.98634, mu=39
     spec = gaussian(wavelength, w, sigma, norm=False)
 
     cos_th = 1.0 - 0.5 * (r / L) ** 2
-    model = trapz(spec * airy_func(wavelength, cos_th, d, F), wavelength, axis=0)
+    model = np.trapz(spec * airy_func(wavelength, cos_th, d, F), wavelength, axis=0)
     return model
 
 
@@ -319,7 +368,7 @@ def lyon_temp_forward(r, L, d, F, current, T, V, E=None):
         spec += gaussian(wavelength, l, sigma, amp=a, norm=False)
 
     cos_th = 1.0 - 0.5 * (r / L) ** 2
-    model = trapz(spec * airy_func(wavelength, cos_th, d, F), wavelength, axis=0)
+    model = np.trapz(spec * airy_func(wavelength, cos_th, d, F), wavelength, axis=0)
     return model
 
 
@@ -376,32 +425,101 @@ def model_with_velocity_profile(r, L, d, F, T, vel_profile, dens_profile=None, z
     plt.show()
 
 
-def zeeman_with_arb_nv(r, L, d, F, current, temp, vbulk, vincrease, extra_temp=None):
-    w0 = 487.98634
-    mu = 39.948
+# Victor's calculation of the Ar II 488 nm Zeeman components ###
+_zeeman_fac = np.array([-1., -17. / 15., -19. / 15., -1.4, 1.4, 19. / 15., 17. / 15., 1.])
+_zeeman_amp = np.array([20., 12., 6., 2., 2., 6., 12., 20.])
 
-    # Victor's calculation ###
-    zeeman_fac = [-1., -17. / 15., -19. / 15., -1.4, 1.4, 19. / 15., 17. / 15., 1.]
-    zeeman_amp = [20., 12., 6., 2., 2., 6., 12., 20.]
+_lyon_field_cache = {}
+
+
+def lyon_magnetic_field():
+    """Loads the on axis magnetic field for 80 A in the Lyon coil (cached after the first call)
+
+    Returns:
+        tuple (np.ndarray, np.ndarray): z locations, B_z in Gauss (read only)
+    """
+    if 'field' not in _lyon_field_cache:
+        current_dir = path.abspath(path.join(__file__, ".."))
+        b_data = np.genfromtxt(path.join(current_dir, "lyon_magnetic_field.csv"), delimiter=",")
+        z = b_data[:, 0].copy()
+        bz = b_data[:, 1].copy()
+        z.flags.writeable = False
+        bz.flags.writeable = False
+        _lyon_field_cache['field'] = (z, bz)
+    return _lyon_field_cache['field']
+
+
+def _lyon_field_window(current, zbounds):
+    """Lyon field in T scaled to the coil current restricted to zbounds (same slicing as the original csv loop)"""
+    z, bz = lyon_magnetic_field()
+    i_lower = np.abs(z - zbounds[0]).argmin()
+    i_higher = np.abs(z - zbounds[1]).argmin()
+    sl = slice(i_lower, i_higher)
+
+    # Covert G to T and adjust bz for the current in the coil
+    return z[sl], bz[sl] / 10000.0 * (current / 80.0)
+
+
+def zeeman_los_spectrum(wavelength, z, w, B, weight, mu, temp, sigma_extra=0.0, sigma=None,
+                        factors=_zeeman_fac, amps=_zeeman_amp):
+    """Zeeman split line of sight spectrum integrated over z in one broadcast
+
+    Builds the (z x component x wavelength) sum of Gaussians in blocks of z and integrates over z
+    with the trapezoidal rule.
+
+    Args:
+        wavelength (np.ndarray): wavelength array in nm
+        z (np.ndarray): positions along the line of sight
+        w (Union[float, np.ndarray]): Doppler shifted line center for each z in nm
+        B (np.ndarray): magnetic field in T for each z
+        weight (Union[float, np.ndarray]): emission weight for each z (e.g. n_e^2)
+        mu (float): atomic mass in amu
+        temp (float): temperature in eV
+        sigma_extra (float): extra Gaussian width added in quadrature in nm, default=0.0
+        sigma (float, optional): use this Gaussian width in nm for every component instead of the
+            Doppler width (plus sigma_extra) at each component wavelength
+        factors (np.ndarray): Zeeman factors
+        amps (np.ndarray): relative amplitudes of the Zeeman components (normalized here)
+
+    Returns:
+        np.ndarray: spectrum evaluated on wavelength
+    """
+    z = np.asarray(z, dtype=np.float64)
+    nz = len(z)
+    w = np.asarray(w, dtype=np.float64) * np.ones(nz)
+    B = np.asarray(B, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64) * np.ones(nz)
+    amps = np.asarray(amps, dtype=np.float64)
+    amps = amps / amps.sum()
+
+    beta = 9.274e-24  # Bohr magnetron J/Tesla
+    lam_hc = 5.034117e15 * w ** 2  # lambda^2/hc in nm/J
+    components = w[:, np.newaxis] + np.asarray(factors)[np.newaxis, :] * (beta * lam_hc * B)[:, np.newaxis]
+
+    if sigma is None:
+        sigma = np.sqrt(doppler_broadening(components, mu, temp) ** 2 + sigma_extra ** 2)
+    else:
+        sigma = sigma * np.ones_like(components)
+
+    coeffs = _trapezoid_weights(z)[:, np.newaxis] * weight[:, np.newaxis] * amps[np.newaxis, :]
 
-    current_dir = path.abspath(path.join(__file__, ".."))
-    b_data = np.genfromtxt(path.join(current_dir, "lyon_magnetic_field.csv"), delimiter=",")
+    spectrum = np.zeros_like(wavelength)
+    block = max(1, 2 ** 20 // (len(amps) * len(wavelength)))
+    for start in range(0, nz, block):
+        sl = slice(start, start + block)
+        x = (wavelength[np.newaxis, np.newaxis, :] - components[sl, :, np.newaxis]) / sigma[sl, :, np.newaxis]
+        spectrum += np.tensordot(coeffs[sl], np.exp(-0.5 * x ** 2), axes=([0, 1], [0, 1]))
 
-    z = b_data[:, 0]
-    bz = b_data[:, 1]
+    return spectrum
 
-    bz /= 10000.0  # Covert G to T
 
-    # Adjust bz for the current in the coil
-    bz *= current / 80.0
+def zeeman_with_arb_nv(r, L, d, F, current, temp, vbulk, vincrease, extra_temp=None):
+    w0 = 487.98634
+    mu = 39.948
 
     # I only want to deal with the array where the plasma is emitting
     zbounds = [-30.0, 80.0]  # Victor says that plasma exists here
-    i_lower = np.abs(z-zbounds[0]).argmin()
-    i_higher = np.abs(z-zbounds[1]).argmin()
-    sl = slice(i_lower, i_higher)
-    z = z[sl]
-    bz = bz[sl]
+    z, bz = _lyon_field_window(current, zbounds)
 
     density = 0.25 * (np.tanh(0.25*z)+1) + 0.5
     vel = vbulk * np.ones_like(z)
@@ -409,11 +527,8 @@ def zeeman_with_arb_nv(r, L, d, F, current, temp, vbulk, vincrease, extra_temp=N
 
     vel[idx] = vbulk - vincrease * z[idx] / 30.0
 
-    nz = len(z)
     nw = 2048
 
-    spectrum = np.zeros((nz, nw))
-
     sigma_Ti = doppler_broadening(w0, mu, temp)
     wshift = doppler_shift(w0, np.max(vel))
 
@@ -424,60 +539,21 @@ def zeeman_with_arb_nv(r, L, d, F, current, temp, vbulk, vincrease, extra_temp=N
 
     warr = np.linspace(wshift-10*sigma_Ti, wshift+10*sigma_Ti, nw)
 
-    for idx, (zz, bb, vv, ne) in enumerate(zip(z, bz, vel, density)):
-        w_main_shift = doppler_shift(w0, vv)
-        w_zee, a_zee = zeeman_lambda(w_main_shift, bb, zeeman_fac, amps=zeeman_amp)
-
-        for wz, az in zip(w_zee, a_zee):
-            # calculate sigma_Ti
-            sigma_Ti = doppler_broadening(wz, mu, temp)
-            sigma_Ti = np.sqrt(sigma_Ti**2 + sigma_extra**2)
-
-            spectrum[idx, :] += gaussian(warr, wz, sigma_Ti, amp=az, norm=False) * ne**2
-    final_spectrum = np.trapz(spectrum, z, axis=0)
-    cos_theta = L / np.sqrt(L**2 + r**2)
-    cos_theta.shape = (1, len(r))
-
-    final_spectrum.shape = (nw, 1)
-    warr.shape = (nw, 1)
+    final_spectrum = zeeman_los_spectrum(warr, z, doppler_shift(w0, vel), bz, density**2, mu, temp,
+                                         sigma_extra=sigma_extra)
 
-    airy = airy_func(warr, cos_theta, d, F)
-
-    zee_model = np.trapz(final_spectrum * airy, warr, axis=0)
-
-    return zee_model
+    return general_model(r, L, d, F, warr, final_spectrum)
 
 
 def zeeman_with_lyon_profile(r, L, d, F, current, temp, vel, extra_temp=None):
     w0 = 487.98634
     mu = 39.948
 
-    # Victor's calculation ###
-    zeeman_fac = [-1., -17. / 15., -19. / 15., -1.4, 1.4, 19. / 15., 17. / 15., 1.]
-    zeeman_amp = [20., 12., 6., 2., 2., 6., 12., 20.]
-
-    current_dir = path.abspath(path.join(__file__, ".."))
-    b_data = np.genfromtxt(path.join(current_dir, "lyon_magnetic_field.csv"), delimiter=",")
-
-    z = b_data[:, 0]
-    bz = b_data[:, 1]
-
     # I only want to deal with the array where the plasma is emitting
     zbounds = [0.0, 80.0]  # Victor says that plasma exists here
-    i_lower = np.abs(z-zbounds[0]).argmin()
-    i_higher = np.abs(z-zbounds[1]).argmin()
-    sl = slice(i_lower, i_higher)
-    z = z[sl]
-    bz = bz[sl]
-
-    bz /= 10000.0  # Covert G to T
-
-    # Adjust bz for the current in the coil
-    bz *= current / 80.0
+    z, bz = _lyon_field_window(current, zbounds)
 
-    nz = len(z)
     nw = 2048
-    spectrum = np.zeros((nz, nw))
 
     sigma_Ti = doppler_broadening(w0, mu, temp)
     w = doppler_shift(w0, vel)
@@ -489,30 +565,13 @@ def zeeman_with_lyon_profile(r, L, d, F, current, temp, vel, extra_temp=None):
 
     w_arr = np.linspace(w - 10*sigma_Ti, w + 10*sigma_Ti, nw)
 
-    # Need to loop over reach z location
-    for idx, (zz, bb) in enumerate(zip(z, bz)):
-        # calculate the spectrum here
-
-        w_zee, a_zee = zeeman_lambda(w, bb, zeeman_fac, amps=zeeman_amp)
-        for wz, az in zip(w_zee, a_zee):
-            spectrum[idx, :] += gaussian(w_arr, wz, sigma_Ti, amp=az, norm=False)
-
-    final_spectrum = np.trapz(spectrum, z, axis=0)
-
-    cos_theta = L / np.sqrt(L**2 + r**2)
-    cos_theta.shape = (1, len(r))
-
-    final_spectrum.shape = (nw, 1)
-    w_arr.shape = (nw, 1)
+    # every component has the (unsplit) line width
+    final_spectrum = zeeman_los_spectrum(w_arr, z, w, bz, 1.0, mu, temp, sigma=sigma_Ti)
 
-    airy = airy_func(w_arr, cos_theta, d, F)
+    return general_model(r, L, d, F, w_arr, final_spectrum)
 
-    zee_model = np.trapz(final_spectrum * airy, w_arr, axis=0)
 
-    return zee_model
-
-
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def general_model(r, L, d, F, wavelength, emission):
     cos_th = L / np.sqrt(L ** 2 + r ** 2)
 
@@ -534,3 +593,216 @@ def general_model(r, L, d, F, wavelength, emission):
     # model = trapz(emis * airy, w, axis=0)
 
     return model
+
+
+def _trapezoid_weights(x):
+    """Trapezoidal rule weights for the (possibly non-uniform) grid x"""
+    dx = np.diff(x)
+    weights = np.zeros_like(x)
+    weights[:-1] += 0.5 * dx
+    weights[1:] += 0.5 * dx
+    return weights
+
+
+def _airy_partials(wavelength, cos_th, d, F):
+    """Airy function and its partial derivatives on a (cos_th x wavelength) grid
+
+    Args:
+        wavelength (np.ndarray): wavelength array in nm
+        cos_th (np.ndarray): cos(theta) array
+        d (float): etalon spacing in mm
+        F (float): etalon finesse
+
+    Returns:
+        tuple (np.ndarray, np.ndarray, np.ndarray): airy function, phi * dA/dphi, dA/dF all with shape
+            (len(cos_th), len(wavelength))
+    """
+    Q = (2. * F / np.pi) ** 2
+    phase = np.pi * 2.e6 * d * cos_th[:, np.newaxis] / wavelength[np.newaxis, :]
+    sin2 = np.sin(phase) ** 2
+    airy = 1.0 / (1.0 + Q * sin2)
+    airy2 = airy ** 2
+    phi_dphi = -Q * np.sin(2.0 * phase) * phase * airy2
+    dF = -2.0 * Q / F * sin2 * airy2
+    return airy, phi_dphi, dF
+
+
+def general_model_jacobian(r, L, d, F, wavelength, emission):
+    """Computes general_model and its analytic derivatives with respect to L, d and F
+
+    The derivatives are taken under the integral on the fixed wavelength grid. The model is
+    linear in emission, so the derivative with respect to an overall amplitude is model / amplitude.
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        wavelength (np.ndarray): wavelength array in nm
+        emission (np.ndarray): spectrum evaluated on wavelength
+
+    Returns:
+        tuple (np.ndarray, dict): model, dictionary of derivatives with keys 'L', 'd', 'F'
+    """
+    model, jac, _ = _airy_integrals(r, L, d, F, wavelength, emission[np.newaxis, :])
+    return model, jac
+
+
+def _airy_integrals(r, L, d, F, wavelength, emission, line_partials=()):
+    """Integrates emission (and optional spectral partials) against the Airy function
+
+    Args:
+        r (np.ndarray): array of r values
+        L (float): camera lens focal length
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        wavelength (np.ndarray): wavelength array in nm
+        emission (np.ndarray): spectra on wavelength with shape (nlines, nlambda), summed for the model
+        line_partials (tuple): arrays with shape (nlines, nlambda) to integrate against the Airy function
+
+    Returns:
+        tuple (np.ndarray, dict, list): model, derivatives with respect to L, d, F, integrals of
+            line_partials each with shape (nlines, len(r))
+    """
+    r = np.asarray(r, dtype=np.float64)
+    cos_th = L / np.sqrt(L ** 2 + r ** 2)
+    # d(phi)/dL / phi
+    dlogphi_dL = r ** 2 / (L * (L ** 2 + r ** 2))
+
+    weights = _trapezoid_weights(wavelength)
+    spec = np.sum(emission, axis=0) * weights
+    partials = [p * weights for p in line_partials]
+
+    model = np.zeros_like(cos_th)
+    jac = {'L': np.zeros_like(cos_th), 'd': np.zeros_like(cos_th), 'F': np.zeros_like(cos_th)}
+    integrals = [np.zeros((p.shape[0], len(cos_th))) for p in partials]
+
+    # keep the (r x wavelength) temporaries to a few MB
+    chunk = max(1, 2 ** 18 // len(wavelength))
+    for start in range(0, len(cos_th), chunk):
+        sl = slice(start, start + chunk)
+        airy, phi_dphi, dF = _airy_partials(wavelength, cos_th[sl], d, F)
+        model[sl] = np.dot(airy, spec)
+        phi_term = np.dot(phi_dphi, spec)
+        jac['d'][sl] = phi_term / d
+        jac['L'][sl] = phi_term * dlogphi_dL[sl]
+        jac['F'][sl] = np.dot(dF, spec)
+        for p, integral in zip(partials, integrals):
+            integral[:, sl] = np.dot(p, airy.T)
+
+    return model, jac, integrals
+
+
+def forward_model_jacobian(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024):
+    """Computes forward_model and its analytic derivatives
+
+    The wavelength grid is the same one forward_model uses. Derivatives with respect to the
+    line parameters are taken analytically under the integral on that (fixed) grid.
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w0 (Union[float, list]): central wavelength(s) in nm
+        mu (Union[float, list]): mass(es) in amu
+        amp (Union[float, list]): amplitude(s) for the lines
+        temp (Union[float, list]): temperature(s) in eV
+        v (Union[float, list]): velocities in m/s
+        nlambda (int): number of points in wavelength array, default=1024
+
+    Returns:
+        tuple (np.ndarray, dict): model, dictionary of derivatives with keys 'L', 'd', 'F' (arrays
+            length of r) and 'amp', 'temp', 'v' (arrays length of r for a single line, otherwise
+            shape (nlines, len(r)))
+    """
+    single = not isinstance(w0, Iterable)
+    w0 = np.atleast_1d(np.asarray(w0, dtype=np.float64))
+    mu = np.atleast_1d(np.asarray(mu, dtype=np.float64))
+    amp = np.atleast_1d(np.asarray(amp, dtype=np.float64))
+    temp = np.atleast_1d(np.asarray(temp, dtype=np.float64))
+    v = np.atleast_1d(np.asarray(v, dtype=np.float64))
+
+    sigma = w0 * 3.2765e-5 * np.sqrt(temp / mu)
+    w = w0 * (1.0 - 3.336e-9 * v)
+
+    wavelength = np.linspace(np.min(w) - 10. * np.max(sigma), np.max(w) + 10. * np.max(sigma), nlambda)
+
+    x = (wavelength[np.newaxis, :] - w[:, np.newaxis]) / sigma[:, np.newaxis]
+    unit = np.exp(-0.5 * x ** 2) / (sigma[:, np.newaxis] * np.sqrt(2. * np.pi))
+    emission = amp[:, np.newaxis] * unit
+
+    # dg/dT = g (x^2 - 1) / (2 T) and dg/dv = g x / sigma * dw/dv
+    dtemp = emission * (x ** 2 - 1.0) / (2.0 * temp[:, np.newaxis])
+    dv = emission * x / sigma[:, np.newaxis] * (-3.336e-9 * w0[:, np.newaxis])
+
+    model, jac, (damp, dT, dV) = _airy_integrals(r, L, d, F, wavelength, emission,
+                                                  line_partials=(unit, dtemp, dv))
+    jac['amp'] = damp
+    jac['temp'] = dT
+    jac['v'] = dV
+
+    if single:
+        for key in ('amp', 'temp', 'v'):
+            jac[key] = jac[key][0]
+
+    return model, jac
+
+
+def annulus_nodes(redges, nnodes=3):
+    """Gauss-Legendre nodes in r^2 for averaging a model over ringsum annuli
+
+    The ringsum bin value is the mean over the pixels in an annulus, i.e. the average of the
+    model over r^2 between the bin edges. An nnodes point Gauss-Legendre rule in r^2 is exact for
+    polynomials in r^2 of degree 2*nnodes - 1 across each bin.
+
+    Args:
+        redges (np.ndarray): bin edges (length nbins + 1)
+        nnodes (int): number of nodes per annulus, default=3
+
+    Returns:
+        tuple (np.ndarray, np.ndarray): radii to evaluate the model at with shape (nbins * nnodes,)
+            ordered by bin, weights (length nnodes, sum to 1)
+    """
+    redges = np.asarray(redges, dtype=np.float64)
+    x, w = np.polynomial.legendre.leggauss(nnodes)
+    r2_lo = redges[:-1, np.newaxis] ** 2
+    r2_hi = redges[1:, np.newaxis] ** 2
+    r2 = 0.5 * (r2_hi + r2_lo) + 0.5 * (r2_hi - r2_lo) * x[np.newaxis, :]
+    return np.sqrt(r2).ravel(), 0.5 * w
+
+
+def annulus_average(values, weights):
+    """Combines model values at annulus_nodes radii into annulus averages
+
+    Args:
+        values (np.ndarray): model evaluated at the radii from annulus_nodes
+        weights (np.ndarray): weights from annulus_nodes
+
+    Returns:
+        np.ndarray: annulus averaged model (length nbins)
+    """
+    return np.dot(np.reshape(values, (-1, len(weights))), weights)
+
+
+def annulus_forward_model(redges, L, d, F, w0, mu, amp, temp, v, nlambda=1024, nnodes=3):
+    """forward_model averaged over the ringsum annuli defined by redges
+
+    Args:
+        redges (np.ndarray): bin edges (length nbins + 1), same units as L
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w0 (Union[float, list]): central wavelength(s) in nm
+        mu (Union[float, list]): mass(es) in amu
+        amp (Union[float, list]): amplitude(s) for the lines
+        temp (Union[float, list]): temperature(s) in eV
+        v (Union[float, list]): velocities in m/s
+        nlambda (int): number of points in wavelength array, default=1024
+        nnodes (int): number of nodes per annulus, default=3
+
+    Returns:
+        np.ndarray: annulus averaged model (length nbins)
+    """
+    r, weights = annulus_nodes(redges, nnodes=nnodes)
+    return annulus_average(forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=nlambda), weights)
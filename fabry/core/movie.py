@@ -0,0 +1,348 @@
+"""Time series of synthetic camera frames for streaming benchmarks
+
+A SyntheticMovie renders frame k at time t = k / frame_rate with the ion temperature, velocity,
+amplitude and ring center of that time, adds cosmic ray hits and exposes it with a CameraModel.
+Each time dependent quantity is a number (constant), a callable f(t) or a pair of sequences
+(times, values) that is linearly interpolated::
+
+    {"sensor": {"nx": 1024, "ny": 1024, "px_size": 0.004},
+     "etalon": {"L": 150.0, "d": 0.88, "F": 21.0},
+     "light_source": {"temperature": 0.5, "wavelength": 487.98634, "mu": 39.948, "velocity": 0.0},
+     "camera": {"gain": 1.0, "read_noise": 5.0, "bit_depth": 16},
+     "nframes": 500, "frame_rate": 1000.0, "peak_counts": 2000.0,
+     "temperature": [[0.0, 0.5], [0.5, 3.0]],
+     "velocity": [[0.0, 0.25, 0.5], [0.0, 2000.0, 0.0]],
+     "amplitude": [[0.0, 0.05, 0.5], [0.1, 1.0, 1.0]],
+     "x_drift": [[0.0, 0.5], [0.0, 3.0]], "y_drift": 0.0,
+     "cosmic_ray_rate": 2.0, "seed": 0}
+
+The sensor, etalon, light_source and camera entries follow fabry.core.dataset. Frames are
+written in blocks of chunk_frames to a multi page TIFF (tifffile) or to an HDF5 store, so only
+one block is held in memory no matter how long the movie is. Frame k draws its cosmic rays and
+camera noise from SeedSequence(seed, spawn_key=(k,)) and does not depend on the block size.
+
+Classes:
+    SyntheticMovie: renders and streams a time evolving stack of frames
+"""
+from __future__ import division, print_function
+import copy
+import json
+import os.path as path
+import numpy as np
+from . import synthetic
+from .dataset import build_case
+from ..tools.helpers import lazy_import
+
+h5py = lazy_import('h5py')
+yaml = lazy_import('yaml')
+tifffile = lazy_import('tifffile')
+
+
+def time_function(spec):
+    """Turns a time dependence specification into a callable
+
+    Args:
+        spec (Union[float, callable, tuple]): constant, f(t) or (times, values) for linear
+            interpolation (held constant outside of times)
+
+    Returns:
+        callable: f(t) for a float or array t
+    """
+    if callable(spec):
+        return spec
+    if np.ndim(spec) == 0:
+        value = float(spec)
+        return lambda t: value + 0.0 * np.asarray(t, dtype=np.float64)
+    times, values = (np.asarray(x, dtype=np.float64) for x in spec)
+    return lambda t: np.interp(t, times, values)
+
+
+def _spec_to_dict(spec):
+    if callable(spec):
+        raise ValueError('time functions given as callables can not be written to a dict')
+    if np.ndim(spec) == 0:
+        return float(spec)
+    return [np.asarray(x, dtype=np.float64).tolist() for x in spec]
+
+
+class SyntheticMovie(object):
+    """Renders and streams a time evolving stack of synthetic frames
+
+    The radial profile of the last (temperature, velocity) is kept, so flat stretches of a time
+    series only pay for the pixel mapping. The profile is tabulated out to the farthest corner over the
+    whole center drift, and the amplitude only rescales the frame.
+
+    Attributes:
+        sensor (Sensor): camera sensor, the ring center drifts around sensor.x0, sensor.y0
+        etalon (Etalon): Fabry Perot etalon
+        light_source (LightSource): light source at t = 0, temperature and velocity are
+            replaced by the time functions
+        camera (CameraModel): noise model, None for noiseless floating point frames
+        nframes (int): number of frames
+        frame_rate (float): frames per second
+        temperature (callable): Ti(t) in eV
+        velocity (callable): V(t) in m/s, None keeps the velocity (or VelocityProfile) of
+            light_source
+        amplitude (callable): multiplier of the emission
+        x_drift (callable): center offset in x (pixels)
+        y_drift (callable): center offset in y (pixels)
+        cosmic_ray_rate (float): mean number of cosmic ray hits per frame
+        cosmic_ray_electrons (float): mean electrons deposited by a hit
+        cosmic_ray_length (int): longest track in pixels
+        peak_counts (float): peak of the emission in photoelectrons at amplitude 1, None to use
+            the light source amplitude as is
+        impact_factor (float): chord impact factor for a UniformPlasma light source
+        rtol (float): profile interpolation tolerance
+        seed (int): movie seed
+    """
+
+    def __init__(self, sensor, etalon, light_source, camera=None, nframes=100, frame_rate=1000.0, temperature=None,
+                 velocity=None, amplitude=1.0, x_drift=0.0, y_drift=0.0, cosmic_ray_rate=0.0,
+                 cosmic_ray_electrons=5000.0, cosmic_ray_length=4, peak_counts=None, impact_factor=None, rtol=1e-5,
+                 seed=0):
+        super(SyntheticMovie, self).__init__()
+        self.sensor = sensor
+        self.etalon = etalon
+        self.light_source = light_source
+        self.camera = camera
+        self.nframes = int(nframes)
+        self.frame_rate = float(frame_rate)
+        self._specs = {'temperature': light_source.temperature if temperature is None else temperature,
+                       'velocity': velocity, 'amplitude': amplitude, 'x_drift': x_drift, 'y_drift': y_drift}
+        for name, spec in self._specs.items():
+            setattr(self, name, None if spec is None else time_function(spec))
+        self.cosmic_ray_rate = float(cosmic_ray_rate)
+        self.cosmic_ray_electrons = float(cosmic_ray_electrons)
+        self.cosmic_ray_length = max(1, int(cosmic_ray_length))
+        self.peak_counts = peak_counts
+        self.impact_factor = impact_factor
+        self.rtol = rtol
+        self.seed = int(seed)
+        self._profile_key = None
+        self._profile = None
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(sensor={!r}, nframes={!r}, frame_rate={!r}, seed={!r})".format(class_name, self.sensor,
+                                                                                 self.nframes, self.frame_rate,
+                                                                                 self.seed)
+
+    @property
+    def times(self):
+        """np.ndarray: frame times in seconds"""
+        return np.arange(self.nframes) / self.frame_rate
+
+    @property
+    def dtype(self):
+        """np.dtype: data type of the frames"""
+        return np.dtype(np.float64) if self.camera is None else self.camera.dtype
+
+    def truth(self):
+        """Ground truth of every frame
+
+        Returns:
+            dict: 't', 'temperature', 'velocity', 'amplitude', 'x0', 'y0' arrays of length nframes
+                ('velocity' only if it is a time function), x0 and y0 are the ring center in the
+                pixel convention of fabry.core.ringsum
+        """
+        t = self.times
+        truth = {'t': t}
+        for name in ('temperature', 'velocity', 'amplitude'):
+            if getattr(self, name) is not None:
+                truth[name] = np.asarray(getattr(self, name)(t), dtype=np.float64)
+        # ringsum counts pixels from 0, Sensor from 1
+        truth['x0'] = self.sensor.x0 - 1.0 + np.asarray(self.x_drift(t), dtype=np.float64)
+        truth['y0'] = self.sensor.y0 - 1.0 + np.asarray(self.y_drift(t), dtype=np.float64)
+        return truth
+
+    def _rmax(self):
+        t = self.times
+        drift = np.max(np.hypot(self.x_drift(t), self.y_drift(t))) if self.nframes else 0.0
+        corners_x = (1.0 - self.sensor.x0, self.sensor.nx - self.sensor.x0)
+        corners_y = (1.0 - self.sensor.y0, self.sensor.ny - self.sensor.y0)
+        return np.sqrt(max(x ** 2 for x in corners_x) + max(y ** 2 for y in corners_y)) + drift + 1.0
+
+    def profile(self, temperature, velocity):
+        """Radial profile at amplitude 1 for a temperature and velocity, the last one is cached
+
+        Args:
+            temperature (float): ion temperature in eV
+            velocity (float): velocity in m/s, None for the velocity of light_source
+
+        Returns:
+            RadialProfile
+        """
+        key = (float(temperature), None if velocity is None else float(velocity))
+        if key != self._profile_key:
+            light_source = copy.copy(self.light_source)
+            light_source.temperature = key[0]
+            if velocity is not None:
+                light_source.velocity = key[1]
+            profile = self.etalon.radial_profile(self.sensor, light_source, rtol=self.rtol,
+                                                 impact_factor=self.impact_factor, rmax=self._rmax())
+            if self.peak_counts is not None:
+                profile = synthetic.RadialProfile(profile.r2max,
+                                                  profile.values * (self.peak_counts / profile.values.max()))
+            self._profile_key = key
+            self._profile = profile
+        return self._profile
+
+    def _cosmic_rays(self, frame, rng):
+        """Adds cosmic ray tracks to frame in place and returns their (row, col, electrons)"""
+        ny, nx = frame.shape
+        nhits = rng.poisson(self.cosmic_ray_rate) if self.cosmic_ray_rate > 0.0 else 0
+        hits = np.empty((nhits, 3))
+        for idx in range(nhits):
+            row = rng.integers(ny)
+            col = rng.integers(nx)
+            electrons = rng.exponential(self.cosmic_ray_electrons)
+            length = rng.integers(1, self.cosmic_ray_length + 1)
+            angle = rng.uniform(0.0, 2.0 * np.pi)
+            steps = np.arange(length)
+            rows = np.clip(np.rint(row + steps * np.sin(angle)).astype(int), 0, ny - 1)
+            cols = np.clip(np.rint(col + steps * np.cos(angle)).astype(int), 0, nx - 1)
+            np.add.at(frame, (rows, cols), electrons / length)
+            hits[idx] = (row, col, electrons)
+        return hits
+
+    def frame(self, index, out=None, scratch=None):
+        """Renders one frame
+
+        Args:
+            index (int): frame number
+            out (np.ndarray, optional): (ny, nx) output array of dtype SyntheticMovie.dtype
+            scratch (np.ndarray, optional): (ny, nx) float64 work array, only used with a camera
+
+        Returns:
+            tuple (np.ndarray, np.ndarray): frame and the (nhits, 3) row, col, electrons of the
+                cosmic ray hits
+        """
+        t = index / self.frame_rate
+        ny, nx = self.sensor.ny, self.sensor.nx
+        profile = self.profile(self.temperature(t), None if self.velocity is None else self.velocity(t))
+        if self.camera is None:
+            signal = out if out is not None else np.empty((ny, nx))
+        else:
+            signal = scratch if scratch is not None else np.empty((ny, nx))
+
+        profile.render(nx, ny, self.sensor.x0 + float(self.x_drift(t)), self.sensor.y0 + float(self.y_drift(t)),
+                       out=signal, integrate=True)
+        signal *= float(self.amplitude(t))
+
+        ray_seed, noise_seed = np.random.SeedSequence(entropy=self.seed, spawn_key=(index,)).spawn(2)
+        hits = self._cosmic_rays(signal, np.random.Generator(np.random.PCG64(ray_seed)))
+
+        if self.camera is None:
+            return signal, hits
+        frame = self.camera.expose(signal, exposure=1.0 / self.frame_rate, seed=noise_seed, out=out)
+        return frame, hits
+
+    def frames(self, start=0, stop=None):
+        """Yields (index, frame, hits) one frame at a time, frames share one buffer"""
+        stop = self.nframes if stop is None else min(stop, self.nframes)
+        ny, nx = self.sensor.ny, self.sensor.nx
+        out = np.empty((ny, nx), dtype=self.dtype)
+        scratch = None if self.camera is None else np.empty((ny, nx))
+        for index in range(start, stop):
+            frame, hits = self.frame(index, out=out, scratch=scratch)
+            yield index, frame, hits
+
+    def write(self, fname, chunk_frames=16, verbose=False):
+        """Streams the movie to a multi page TIFF or an HDF5 store
+
+        HDF5 stores hold 'frames' (nframes, ny, nx), the ground truth under 'truth/' and the
+        cosmic ray hits 'cosmic_rays' (frame, row, col, electrons). For a TIFF, which
+        bin/process_image_stack.py reads, the truth goes to <name>_truth.h5 next to it.
+
+        Args:
+            fname (str): .tif/.tiff or .h5/.hdf5 file, overwritten if it exists
+            chunk_frames (int): frames rendered and written per block, default=16
+            verbose (bool): print progress, default=False
+        """
+        ny, nx = self.sensor.ny, self.sensor.nx
+        chunk_frames = max(1, min(int(chunk_frames), self.nframes))
+        tiff = path.splitext(fname)[-1].lower() in ('.tif', '.tiff')
+        block = np.empty((chunk_frames, ny, nx), dtype=self.dtype)
+        scratch = None if self.camera is None else np.empty((ny, nx))
+        hits = []
+
+        if tiff:
+            writer = tifffile.TiffWriter(fname, bigtiff=block.nbytes * self.nframes / chunk_frames > 2 ** 31)
+            h5 = h5py.File(path.splitext(fname)[0] + '_truth.h5', 'w')
+        else:
+            h5 = h5py.File(fname, 'w')
+            frames = h5.create_dataset('frames', shape=(self.nframes, ny, nx), dtype=self.dtype,
+                                       chunks=(1, ny, nx), compression='lzf')
+        try:
+            for start in range(0, self.nframes, chunk_frames):
+                stop = min(start + chunk_frames, self.nframes)
+                for index in range(start, stop):
+                    _, frame_hits = self.frame(index, out=block[index - start], scratch=scratch)
+                    hits.append(np.column_stack((np.full(len(frame_hits), index), frame_hits)))
+                if tiff:
+                    writer.write(block[:stop - start], contiguous=True)
+                else:
+                    frames[start:stop] = block[:stop - start]
+                if verbose:
+                    print('frames {0:d} to {1:d} of {2:d} written'.format(start, stop - 1, self.nframes))
+
+            group = h5.create_group('truth')
+            for name, values in self.truth().items():
+                group.create_dataset(name, data=values)
+            h5.create_dataset('cosmic_rays', data=np.vstack(hits) if hits else np.empty((0, 4)))
+            h5.attrs['config'] = json.dumps(self.to_dict())
+        finally:
+            h5.close()
+            if tiff:
+                writer.close()
+
+    def to_dict(self):
+        """Returns a dict representation of the SyntheticMovie"""
+        light_source = self.light_source.to_dict()
+        if type(self.light_source) is not synthetic.LightSource:
+            light_source['class_name'] = type(self.light_source).__name__
+        movie = {'sensor': self.sensor.to_dict(), 'etalon': self.etalon.to_dict(), 'light_source': light_source,
+                 'nframes': self.nframes, 'frame_rate': self.frame_rate,
+                 'cosmic_ray_rate': self.cosmic_ray_rate, 'cosmic_ray_electrons': self.cosmic_ray_electrons,
+                 'cosmic_ray_length': self.cosmic_ray_length, 'peak_counts': self.peak_counts,
+                 'impact_factor': self.impact_factor, 'rtol': self.rtol, 'seed': self.seed}
+        if self.camera is not None:
+            movie['camera'] = self.camera.to_dict()
+        for name, spec in self._specs.items():
+            if spec is not None:
+                movie[name] = _spec_to_dict(spec)
+        return movie
+
+    @classmethod
+    def from_dict(cls, movie):
+        """Creates a SyntheticMovie from a dict, see the module docstring for the layout
+
+        Args:
+            movie (dict): movie configuration
+
+        Returns:
+            SyntheticMovie
+        """
+        sensor, etalon, light_source, camera = build_case(movie)
+        kwargs = dict((key, movie[key]) for key in ('nframes', 'frame_rate', 'temperature', 'velocity', 'amplitude',
+                                                    'x_drift', 'y_drift', 'cosmic_ray_rate', 'cosmic_ray_electrons',
+                                                    'cosmic_ray_length', 'peak_counts', 'impact_factor', 'rtol',
+                                                    'seed') if key in movie)
+        return cls(sensor, etalon, light_source, camera=camera, **kwargs)
+
+    @classmethod
+    def load(cls, fname):
+        """Reads a SyntheticMovie from a .json or .yml/.yaml file
+
+        Args:
+            fname (str): path to the movie configuration
+
+        Returns:
+            SyntheticMovie
+        """
+        with open(fname, 'r') as infile:
+            if path.splitext(fname)[-1].lower() in ('.yml', '.yaml'):
+                movie = yaml.safe_load(infile)
+            else:
+                movie = json.load(infile)
+        return cls.from_dict(movie)
@@ -0,0 +1,346 @@
+"""Posterior predictive signals with bounded memory
+
+Credible bands for the model signal used to be built from the Cartesian product of the
+independent L/d, F and plasma posteriors, with every model stored before taking percentiles.
+Here joint rows are drawn from each posterior independently (which samples the same product
+distribution), evaluated in batches, and folded into running estimates. Percentiles are tracked
+with the P^2 algorithm (Jain & Chlamtac 1985), so memory is O(len(r)) however many samples are drawn.
+
+Classes:
+    StreamingQuantiles: P^2 quantile estimates for many independent streams
+    PredictiveBands: running mean, standard deviation and credible bands of model samples
+
+Functions:
+    joint_posterior_samples: draws rows from independent joint posteriors
+    batched_forward_model: models.forward_model for a batch of parameter samples
+    posterior_predictive: streams posterior predictive samples into PredictiveBands
+"""
+from __future__ import division, print_function
+import numpy as np
+from .quadrature import airy_reflectivity, _harmonics_needed
+
+
+class StreamingQuantiles(object):
+    """P^2 estimates of several quantiles for many independent streams (one per radius)
+
+    Each quantile keeps 5 marker heights and positions per stream. Markers are moved towards
+    their desired positions with a piecewise parabolic prediction after every observation.
+
+    Attributes:
+        probabilities (np.ndarray): quantile probabilities in (0, 1)
+        size (int): number of independent streams
+        count (int): number of observations per stream so far
+    """
+
+    def __init__(self, probabilities, size):
+        super(StreamingQuantiles, self).__init__()
+        p = np.atleast_1d(np.asarray(probabilities, dtype=np.float64))
+        if np.any(p <= 0.0) or np.any(p >= 1.0):
+            raise ValueError('quantile probabilities must be in (0, 1)')
+        self.probabilities = p
+        self.size = int(size)
+        self.count = 0
+
+        ones = np.ones_like(p)
+        nq = len(p)
+        self._heights = np.zeros((5, nq, self.size))
+        self._positions = np.tile(np.arange(1.0, 6.0)[:, np.newaxis, np.newaxis], (1, nq, self.size))
+        self._desired = np.array([ones, 1.0 + 2.0 * p, 1.0 + 4.0 * p, 3.0 + 2.0 * p, 5.0 * ones])[:, :, np.newaxis]
+        self._increments = np.array([0.0 * ones, p / 2.0, p, (1.0 + p) / 2.0, ones])[:, :, np.newaxis]
+        self._first = np.zeros((5, self.size))
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(probabilities={!r}, size={!r}, count={!r})".format(class_name, self.probabilities.tolist(),
+                                                                     self.size, self.count)
+
+    def update(self, samples):
+        """Adds observations to every stream
+
+        Args:
+            samples (np.ndarray): one observation per stream (size,) or a batch (nsamples, size)
+        """
+        samples = np.asarray(samples, dtype=np.float64)
+        for x in samples.reshape(-1, self.size):
+            self._update(x)
+
+    def _update(self, x):
+        if self.count < 5:
+            self._first[self.count] = x
+            self.count += 1
+            if self.count == 5:
+                self._heights[:] = np.sort(self._first, axis=0)[:, np.newaxis, :]
+            return
+        self.count += 1
+
+        q = self._heights
+        n = self._positions
+        x = x[np.newaxis, :]
+
+        # markers above the observation move up one position, the last marker always does
+        n[1:4] += x < q[1:4]
+        n[4] += 1.0
+        q[0] = np.minimum(q[0], x)
+        q[4] = np.maximum(q[4], x)
+        self._desired += self._increments
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in (1, 2, 3):
+                offset = self._desired[i] - n[i]
+                move = ((offset >= 1.0) & (n[i + 1] - n[i] > 1.0)) | ((offset <= -1.0) & (n[i - 1] - n[i] < -1.0))
+                if not np.any(move):
+                    continue
+                s = np.where(move, np.sign(offset), 0.0)
+
+                parabolic = q[i] + s / (n[i + 1] - n[i - 1]) * (
+                    (n[i] - n[i - 1] + s) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                    (n[i + 1] - n[i] - s) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                q_next = np.where(s > 0, q[i + 1], q[i - 1])
+                n_next = np.where(s > 0, n[i + 1], n[i - 1])
+                linear = q[i] + s * (q_next - q[i]) / (n_next - n[i])
+
+                in_order = (q[i - 1] < parabolic) & (parabolic < q[i + 1])
+                q[i] = np.where(move, np.where(in_order, parabolic, linear), q[i])
+                n[i] += s
+
+    def quantiles(self):
+        """Current quantile estimates
+
+        Returns:
+            np.ndarray: estimates with shape (len(probabilities), size)
+        """
+        if self.count == 0:
+            raise ValueError('no observations have been added')
+        if self.count < 5:
+            return np.percentile(self._first[:self.count], 100.0 * self.probabilities, axis=0)
+        return self._heights[2].copy()
+
+
+class PredictiveBands(object):
+    """Running mean, standard deviation and central credible bands of model samples
+
+    Attributes:
+        levels (tuple): credible levels in percent, e.g. (68, 95, 99)
+        size (int): length of each model sample
+        count (int): number of samples added
+    """
+
+    def __init__(self, size, levels=(68, 95, 99)):
+        super(PredictiveBands, self).__init__()
+        self.levels = tuple(float(x) for x in levels)
+        self.size = int(size)
+        self.count = 0
+        self._mean = np.zeros(self.size)
+        self._m2 = np.zeros(self.size)
+
+        probabilities = [0.5] + [0.5 - x / 200.0 for x in self.levels] + [0.5 + x / 200.0 for x in self.levels]
+        self._quantiles = StreamingQuantiles(probabilities, self.size)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(size={!r}, levels={!r}, count={!r})".format(class_name, self.size, self.levels, self.count)
+
+    def update(self, samples):
+        """Adds a batch of model samples
+
+        Args:
+            samples (np.ndarray): samples with shape (nsamples, size) or a single sample (size,)
+        """
+        samples = np.asarray(samples, dtype=np.float64).reshape(-1, self.size)
+        nb = samples.shape[0]
+        if nb == 0:
+            return
+
+        # Chan et al. parallel update of the mean and sum of squared deviations
+        batch_mean = np.mean(samples, axis=0)
+        batch_m2 = np.sum((samples - batch_mean) ** 2, axis=0)
+        total = self.count + nb
+        delta = batch_mean - self._mean
+        self._mean += delta * nb / total
+        self._m2 += batch_m2 + delta ** 2 * self.count * nb / total
+        self.count = total
+
+        self._quantiles.update(samples)
+
+    @property
+    def mean(self):
+        """np.ndarray: running mean of the samples"""
+        return self._mean.copy()
+
+    @property
+    def std(self):
+        """np.ndarray: running standard deviation of the samples"""
+        if self.count < 2:
+            return np.zeros(self.size)
+        return np.sqrt(self._m2 / (self.count - 1))
+
+    @property
+    def median(self):
+        """np.ndarray: running median estimate"""
+        return self._quantiles.quantiles()[0]
+
+    @property
+    def percentiles(self):
+        """dict: central credible bands, level -> (lower, upper) arrays"""
+        estimates = self._quantiles.quantiles()
+        nlevels = len(self.levels)
+        bands = {}
+        for k, level in enumerate(self.levels):
+            key = int(level) if level == int(level) else level
+            bands[key] = (estimates[1 + k], estimates[1 + nlevels + k])
+        return bands
+
+    def to_dict(self):
+        """Returns a dict representation of the current estimates (for file_io.dict_2_h5)
+
+        The P^2 marker state is not stored, a PredictiveBands made with from_dict can not be
+        updated further.
+        """
+        bands = self.percentiles
+        return {'levels': np.array(self.levels), 'count': self.count, 'mean': self.mean, 'std': self.std,
+                'median': self.median, 'lower': np.array([bands[k][0] for k in sorted(bands)]),
+                'upper': np.array([bands[k][1] for k in sorted(bands)])}
+
+    @classmethod
+    def from_dict(cls, bands):
+        """Creates a read only PredictiveBands from a dict made by to_dict
+
+        Args:
+            bands (dict): dictionary representation of a PredictiveBands
+
+        Returns:
+            PredictiveBands
+        """
+        levels = tuple(np.atleast_1d(bands['levels']))
+        new = cls(len(bands['mean']), levels=levels)
+        new.count = int(bands['count'])
+        new._mean = np.asarray(bands['mean'], dtype=np.float64)
+        std = np.asarray(bands['std'], dtype=np.float64)
+        new._m2 = std ** 2 * max(new.count - 1, 0)
+        q = new._quantiles
+        q.count = max(new.count, 5)
+        q._heights[2] = np.vstack((bands['median'], bands['lower'], bands['upper']))
+        return new
+
+
+def joint_posterior_samples(posteriors, nsamples, random_state=None):
+    """Draws rows from independent joint posteriors
+
+    Each posterior keeps its own correlations (e.g. L and d), different posteriors are independent,
+    so this samples the same distribution as their Cartesian product without building it.
+
+    Args:
+        posteriors (list): equally weighted posterior samples, each (n_i,) or (n_i, k_i)
+        nsamples (int): number of rows to draw
+        random_state (Union[int, np.random.RandomState], optional): seed or random state
+
+    Returns:
+        np.ndarray: samples with shape (nsamples, sum(k_i)), columns in the order of posteriors
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    columns = []
+    for post in posteriors:
+        post = np.asarray(post, dtype=np.float64)
+        if post.ndim == 1:
+            post = post[:, np.newaxis]
+        idx = random_state.randint(0, post.shape[0], size=nsamples)
+        columns.append(post[idx])
+
+    return np.hstack(columns)
+
+
+def _per_sample(x, nlines):
+    x = np.asarray(x, dtype=np.float64)
+    if x.ndim < 2:
+        x = x.reshape(1, 1) if x.size == 1 else x.reshape(-1, 1) if nlines == 1 else x.reshape(-1, nlines)
+    return x
+
+
+def batched_forward_model(r, L, d, F, w0, mu, amp, temp, v, tol=1e-10, max_elements=2 ** 22):
+    """models.forward_model for a batch of parameter samples
+
+    Uses the analytic Fourier series of the Airy function convolved with a Gaussian line (see
+    quadrature.fourier_line_model), so there is no wavelength grid per sample.
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (np.ndarray): camera lens focal lengths (nsamples,)
+        d (np.ndarray): etalon spacings in mm (nsamples,)
+        F (np.ndarray): etalon finesses (nsamples,)
+        w0 (Union[float, list]): central wavelength(s) in nm
+        mu (Union[float, list]): mass(es) in amu
+        amp (np.ndarray): amplitudes (nsamples,) for one line or (nsamples, nlines)
+        temp (np.ndarray): temperatures in eV, same shapes as amp
+        v (np.ndarray): velocities in m/s, same shapes as amp
+        tol (float): truncation tolerance for the harmonic sum, default=1e-10
+        max_elements (int): largest temporary array, sets the number of samples per block
+
+    Returns:
+        np.ndarray: models with shape (nsamples, len(r))
+    """
+    r = np.asarray(r, dtype=np.float64).ravel()
+    w0 = np.atleast_1d(np.asarray(w0, dtype=np.float64))
+    mu = np.atleast_1d(np.asarray(mu, dtype=np.float64)) * np.ones_like(w0)
+    nlines = len(w0)
+
+    L, d, F = (np.atleast_1d(np.asarray(x, dtype=np.float64))[:, np.newaxis] for x in (L, d, F))
+    L, d, F, amp, temp, v = np.broadcast_arrays(L, d, F, _per_sample(amp, nlines), _per_sample(temp, nlines),
+                                                _per_sample(v, nlines))
+    L, d, F = L[:, 0], d[:, 0], F[:, 0]
+    nsamples = len(L)
+
+    sigma = w0 * 3.2765e-5 * np.sqrt(temp / mu)
+    w = w0 * (1.0 - 3.336e-9 * v)
+    R = airy_reflectivity(F)
+    rr = r ** 2
+
+    model = np.zeros((nsamples, len(r)))
+    block = max(1, max_elements // (len(r) * nlines))
+    for start in range(0, nsamples, block):
+        sl = slice(start, start + block)
+        cos_th = L[sl, np.newaxis] / np.sqrt(L[sl, np.newaxis] ** 2 + rr[np.newaxis, :])
+        order = 2.e6 * d[sl, np.newaxis, np.newaxis] * cos_th[:, :, np.newaxis] / w[sl, np.newaxis, :]
+        damping = 2.0 * np.pi ** 2 * (order * sigma[sl, np.newaxis, :] / w[sl, np.newaxis, :]) ** 2
+        log_R = np.log(R[sl])[:, np.newaxis, np.newaxis]
+
+        nharm = _harmonics_needed(-np.max(log_R), np.min(damping), tol)
+        lines = np.ones_like(order)
+        for n in range(1, nharm + 1):
+            lines += 2.0 * np.exp(n * log_R - n ** 2 * damping) * np.cos(2.0 * np.pi * n * order)
+
+        scale = ((1.0 - R[sl]) / (1.0 + R[sl]))[:, np.newaxis]
+        model[sl] = scale * np.einsum('ijk,ik->ij', lines, amp[sl])
+
+    return model
+
+
+def posterior_predictive(model, posteriors, nsamples=10000, batch_size=256, levels=(68, 95, 99),
+                         random_state=None):
+    """Streams posterior predictive model samples into PredictiveBands
+
+    Args:
+        model (callable): model(params) -> (batch, nr) array for params with shape (batch, nparams)
+        posteriors (list): equally weighted posterior samples, see joint_posterior_samples
+        nsamples (int): number of posterior predictive samples, default=10000
+        batch_size (int): samples per model call, default=256
+        levels (tuple): credible levels in percent, default=(68, 95, 99)
+        random_state (Union[int, np.random.RandomState], optional): seed or random state
+
+    Returns:
+        PredictiveBands: running estimates over the nsamples model samples
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+
+    bands = None
+    for start in range(0, nsamples, batch_size):
+        nb = min(batch_size, nsamples - start)
+        params = joint_posterior_samples(posteriors, nb, random_state=random_state)
+        values = np.asarray(model(params), dtype=np.float64).reshape(nb, -1)
+        if bands is None:
+            bands = PredictiveBands(values.shape[1], levels=levels)
+        bands.update(values)
+
+    return bands
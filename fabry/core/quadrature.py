@@ -0,0 +1,358 @@
+"""Error controlled spectral quadrature for the Fabry-Perot forward models
+
+The fixed nlambda trapezoidal grids in models.forward_model cover +/- 10 sigma of the
+broadest line, which oversamples hot lines and undersamples cold lines mixed with hot ones.
+Here every line is integrated with its own Gauss-Hermite rule about the line center. The
+number of nodes is the fewest that meet a stated relative accuracy for the ratio of the
+Doppler width to the Airy fringe width and the finesse. Node counts are calibrated once per
+(sigma ratio, F) class against the exact Gaussian * Airy Fourier series and cached. Lines
+that are broad compared to the fringe spacing need more nodes than the largest rule, those
+are done with the Fourier series instead.
+
+Functions:
+    hermite_nodes: cached Gauss-Hermite nodes and weights
+    required_nodes: cached number of nodes needed for a (sigma ratio, F) class
+    line_nodes: wavelength nodes and weights for a set of lines
+    hermite_line_model: adaptive quadrature of Gaussian lines with a Fourier fallback
+    hermite_forward_model: adaptive quadrature version of models.forward_model
+    airy_quadrature: sums the Airy function over quadrature nodes
+    fourier_line_model: analytic Airy convolution of Gaussian, Lorentzian or Voigt lines
+    fourier_forward_model: analytic Fourier series version of models.forward_model
+"""
+from __future__ import division, print_function
+import numpy as np
+from numpy.polynomial.hermite import hermgauss
+
+# candidate rule sizes, roughly geometric so the search stays short
+_node_counts = (2, 3, 4, 6, 8, 12, 16, 24, 32, 48, 64, 96, 128, 192, 256)
+
+_hermite_cache = {}
+_required_nodes_cache = {}
+
+
+def hermite_nodes(n):
+    """Gauss-Hermite nodes and weights for a normalized Gaussian
+
+    Args:
+        n (int): number of nodes
+
+    Returns:
+        tuple (np.ndarray, np.ndarray): nodes in units of sigma, weights that sum to 1
+    """
+    if n not in _hermite_cache:
+        x, w = hermgauss(n)
+        _hermite_cache[n] = (np.sqrt(2.0) * x, w / np.sqrt(np.pi))
+    return _hermite_cache[n]
+
+
+def airy_reflectivity(F):
+    """Effective plate reflectivity R for a finesse F, where F = pi sqrt(R) / (1 - R)
+
+    Args:
+        F (float): etalon finesse
+
+    Returns:
+        float: reflectivity
+    """
+    y = (-np.pi + np.sqrt(np.pi ** 2 + 4.0 * F ** 2)) / (2.0 * F)
+    return y ** 2
+
+
+def _exact_gaussian_airy(offsets, sigma_order, F):
+    """Exact convolution of a Gaussian (width in orders) with the Airy function via its Fourier series"""
+    R = airy_reflectivity(F)
+    nharm = int(np.ceil(np.log(1e-17) / np.log(R))) + 1
+    n = np.arange(1, nharm + 1)
+    coeffs = R ** n * np.exp(-2.0 * np.pi ** 2 * n ** 2 * sigma_order ** 2)
+    series = 1.0 + 2.0 * np.dot(np.cos(2.0 * np.pi * np.outer(offsets, n)), coeffs)
+    return (1.0 - R) / (1.0 + R) * series
+
+
+def _ratio_class(ratio):
+    """Rounds a Doppler width / Airy width ratio up to a quarter octave"""
+    ratio = max(ratio, 2.0 ** -8)
+    return 2.0 ** (np.ceil(4.0 * np.log2(ratio)) / 4.0)
+
+
+def required_nodes(ratio, F, rtol=1e-4, max_nodes=256):
+    """Fewest Gauss-Hermite nodes needed to integrate a Gaussian line through the Airy function
+
+    The result is cached per (ratio class, ceil(F), rtol, max_nodes).
+
+    Args:
+        ratio (float): Doppler sigma divided by the Airy fringe full width (both in orders, i.e. sigma * F)
+        F (float): etalon finesse
+        rtol (float): accuracy relative to the peak of the convolved fringe, default=1e-4
+        max_nodes (int): largest rule to try, default=256
+
+    Returns:
+        Union[int, None]: number of nodes, None if no rule up to max_nodes meets rtol
+    """
+    ratio_class = _ratio_class(ratio)
+    F_class = float(np.ceil(F))
+    key = (ratio_class, F_class, rtol, max_nodes)
+
+    if key not in _required_nodes_cache:
+        sigma_order = ratio_class / F_class
+        offsets = np.linspace(0.0, 0.5, 65)
+        exact = _exact_gaussian_airy(offsets, sigma_order, F_class)
+        scale = np.max(exact)
+
+        Q = (2. * F_class / np.pi) ** 2
+        nodes = None
+        for n in (n for n in _node_counts if n <= max_nodes):
+            x, w = hermite_nodes(n)
+            phase = np.pi * (offsets[:, np.newaxis] + sigma_order * x[np.newaxis, :])
+            approx = np.dot(1.0 / (1.0 + Q * np.sin(phase) ** 2), w)
+            if np.max(np.abs(approx - exact)) <= rtol * scale:
+                nodes = n
+                break
+        _required_nodes_cache[key] = nodes
+
+    return _required_nodes_cache[key]
+
+
+def line_nodes(w, sigma, amp, d, F, rtol=1e-4, max_nodes=256):
+    """Builds the combined wavelength nodes and weights for a set of Gaussian lines
+
+    Args:
+        w (np.ndarray): line centers in nm
+        sigma (np.ndarray): Doppler widths in nm
+        amp (np.ndarray): line amplitudes
+        d (float): etalon spacing in mm
+        F (float): etalon finesse
+        rtol (float): relative accuracy, default=1e-4
+        max_nodes (int): largest rule per line, default=256
+
+    Returns:
+        tuple (np.ndarray, np.ndarray): wavelength nodes in nm, weights (include the amplitudes)
+
+    Raises:
+        ValueError: if a line needs more than max_nodes nodes, see hermite_line_model
+    """
+    w = np.atleast_1d(w)
+    sigma = np.atleast_1d(sigma)
+    amp = np.atleast_1d(amp) * np.ones_like(w)
+
+    wavelengths = []
+    weights = []
+    for ww, ss, so, aa in zip(w, sigma, _sigma_order(w, sigma, d), amp):
+        n = required_nodes(so * F, F, rtol=rtol, max_nodes=max_nodes)
+        if n is None:
+            raise ValueError("a line of width {0:g} nm needs more than {1:d} Gauss-Hermite nodes for "
+                             "rtol={2:g}".format(ss, max_nodes, rtol))
+        x, wt = hermite_nodes(n)
+        wavelengths.append(ww + ss * x)
+        weights.append(aa * wt)
+
+    return np.concatenate(wavelengths), np.concatenate(weights)
+
+
+def _sigma_order(w, sigma, d):
+    # Doppler width in orders at normal incidence (the largest order on the sensor)
+    return 2.e6 * d * sigma / w ** 2
+
+
+def hermite_line_model(r, L, d, F, w, sigma, amp, rtol=1e-4, max_nodes=256):
+    """Adaptive Gauss-Hermite quadrature of Gaussian lines through the Airy function
+
+    Lines that no rule up to max_nodes resolves to rtol (Doppler widths comparable to the
+    fringe spacing) are convolved analytically with fourier_line_model instead.
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w (np.ndarray): (shifted) line centers in nm
+        sigma (np.ndarray): Doppler widths in nm
+        amp (np.ndarray): line amplitudes
+        rtol (float): relative accuracy, default=1e-4
+        max_nodes (int): largest rule per line, default=256
+
+    Returns:
+        np.ndarray: array length of r of the model
+    """
+    w = np.atleast_1d(np.asarray(w, dtype=np.float64))
+    sigma = np.atleast_1d(np.asarray(sigma, dtype=np.float64)) * np.ones_like(w)
+    amp = np.atleast_1d(np.asarray(amp, dtype=np.float64)) * np.ones_like(w)
+
+    resolved = np.array([required_nodes(so * F, F, rtol=rtol, max_nodes=max_nodes) is not None
+                         for so in _sigma_order(w, sigma, d)])
+
+    model = np.zeros(np.shape(r))
+    if np.any(resolved):
+        wavelength, weights = line_nodes(w[resolved], sigma[resolved], amp[resolved], d, F, rtol=rtol,
+                                         max_nodes=max_nodes)
+        model += airy_quadrature(r, L, d, F, wavelength, weights)
+    if not np.all(resolved):
+        unresolved = np.logical_not(resolved)
+        model += fourier_line_model(r, L, d, F, w[unresolved], sigma[unresolved], amp[unresolved], tol=rtol)
+
+    return model
+
+
+def hermite_forward_model(r, L, d, F, w0, mu, amp, temp, v, rtol=1e-4, max_nodes=256):
+    """Adaptive quadrature version of models.forward_model
+
+    Each line is integrated with a Gauss-Hermite rule about its shifted center with the fewest
+    nodes that reach rtol relative to the fringe peak, see hermite_line_model.
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w0 (Union[float, list]): central wavelength(s) in nm
+        mu (Union[float, list]): mass(es) in amu
+        amp (Union[float, list]): amplitude(s) for the lines
+        temp (Union[float, list]): temperature(s) in eV
+        v (Union[float, list]): velocities in m/s
+        rtol (float): relative accuracy, default=1e-4
+        max_nodes (int): largest rule per line, default=256
+
+    Returns:
+        np.ndarray: array length of r of forward model
+    """
+    w0 = np.atleast_1d(np.asarray(w0, dtype=np.float64))
+    mu = np.atleast_1d(np.asarray(mu, dtype=np.float64))
+    temp = np.atleast_1d(np.asarray(temp, dtype=np.float64))
+    v = np.atleast_1d(np.asarray(v, dtype=np.float64))
+
+    sigma = w0 * 3.2765e-5 * np.sqrt(temp / mu)
+    w = w0 * (1.0 - 3.336e-9 * v)
+
+    return hermite_line_model(r, L, d, F, w, sigma, amp, rtol=rtol, max_nodes=max_nodes)
+
+
+def airy_quadrature(r, L, d, F, wavelength, weights):
+    """Sums the Airy function over quadrature nodes for every radius
+
+    Args:
+        r (np.ndarray): array of r values
+        L (float): camera lens focal length, same units as r
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        wavelength (np.ndarray): quadrature nodes in nm
+        weights (np.ndarray): quadrature weights
+
+    Returns:
+        np.ndarray: array length of r
+    """
+    r = np.asarray(r, dtype=np.float64)
+    cos_th = L / np.sqrt(L ** 2 + r.ravel() ** 2)
+    Q = (2. * F / np.pi) ** 2
+
+    model = np.empty_like(cos_th)
+    # keep the (r x nodes) temporaries to a few MB
+    chunk = max(1, 2 ** 19 // max(len(wavelength), 1))
+    inv_w = np.pi * 2.e6 * d / wavelength
+    for start in range(0, len(cos_th), chunk):
+        sl = slice(start, start + chunk)
+        phase = cos_th[sl, np.newaxis] * inv_w[np.newaxis, :]
+        model[sl] = np.dot(1.0 / (1.0 + Q * np.sin(phase) ** 2), weights)
+
+    return model.reshape(r.shape)
+
+
+def fourier_line_model(r, L, d, F, w, sigma, amp, gamma=0.0, tol=1e-10):
+    """Analytic convolution of Gaussian, Lorentzian or Voigt lines with the Airy function
+
+    The Airy function is periodic in the interference order m = 2d cos(theta) / lambda
+
+    .. math::
+        A = \\frac{1-R}{1+R}\\left(1 + 2 \\sum_n R^n \\cos(2 \\pi n m)\\right)
+
+    Over a line the order is linear in wavelength, so a line of Gaussian width sigma_m and
+    Lorentzian full width gamma_m (in orders) damps harmonic n by
+    exp(-2 pi^2 n^2 sigma_m^2 - pi n gamma_m). A Voigt line is the product of the two factors,
+    so every shape costs the same. Harmonics are summed until R^n (times the damping) drops
+    below tol.
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w (np.ndarray): (shifted) line centers in nm
+        sigma (np.ndarray): Gaussian widths in nm (0 for a pure Lorentzian)
+        amp (np.ndarray): line amplitudes
+        gamma (Union[float, np.ndarray]): Lorentzian full widths at half maximum in nm, default=0.0
+        tol (float): truncation tolerance for the harmonic sum, default=1e-10
+
+    Returns:
+        np.ndarray: array length of r of the model
+    """
+    r = np.asarray(r, dtype=np.float64)
+    w = np.atleast_1d(np.asarray(w, dtype=np.float64))
+    ones = np.ones_like(w)
+    sigma = np.atleast_1d(np.asarray(sigma, dtype=np.float64)) * ones
+    amp = np.atleast_1d(np.asarray(amp, dtype=np.float64)) * ones
+    gamma = np.atleast_1d(np.asarray(gamma, dtype=np.float64)) * ones
+
+    R = airy_reflectivity(F)
+    cos_th = L / np.sqrt(L ** 2 + r.ravel() ** 2)
+
+    # the narrowest line sets the number of harmonics, use the smallest order (largest r)
+    m_min = 2.e6 * d * np.min(cos_th) / w
+    decay = np.min(2.0 * np.pi ** 2 * (m_min * sigma / w) ** 2)
+    slope = -np.log(R) + np.min(np.pi * m_min * gamma / w)
+    nharm = _harmonics_needed(slope, decay, tol)
+    n = np.arange(1, nharm + 1)
+
+    model = np.zeros_like(cos_th)
+    chunk = max(1, 2 ** 20 // (len(w) * nharm))
+    for start in range(0, len(cos_th), chunk):
+        sl = slice(start, start + chunk)
+        order = 2.e6 * d * cos_th[sl, np.newaxis] / w[np.newaxis, :]
+        sigma_m = order * sigma / w
+        gamma_m = order * gamma / w
+        exponent = (n * np.log(R))[np.newaxis, np.newaxis, :] \
+            - 2.0 * np.pi ** 2 * (n ** 2)[np.newaxis, np.newaxis, :] * (sigma_m ** 2)[:, :, np.newaxis] \
+            - np.pi * n[np.newaxis, np.newaxis, :] * gamma_m[:, :, np.newaxis]
+        harmonics = np.exp(exponent) * np.cos(2.0 * np.pi * n[np.newaxis, np.newaxis, :] * order[:, :, np.newaxis])
+        lines = 1.0 + 2.0 * np.sum(harmonics, axis=2)
+        model[sl] = np.dot(lines, amp)
+
+    return (1.0 - R) / (1.0 + R) * model.reshape(r.shape)
+
+
+def _harmonics_needed(slope, curvature, tol, max_harmonics=100000):
+    """Smallest N with exp(-slope N - curvature N^2) < tol"""
+    target = -np.log(tol)
+    if curvature > 0.0:
+        N = (-slope + np.sqrt(slope ** 2 + 4.0 * curvature * target)) / (2.0 * curvature)
+    else:
+        N = target / slope
+    return int(min(np.ceil(N), max_harmonics)) + 1
+
+
+def fourier_forward_model(r, L, d, F, w0, mu, amp, temp, v, gamma=0.0, tol=1e-10):
+    """Analytic Fourier series version of models.forward_model with optional Lorentzian widths
+
+    Args:
+        r (np.ndarray): array of r values to compute model on
+        L (float): camera lens focal length, same units as r (pixels or mm)
+        d (float): etalon spacing (mm)
+        F (float): etalon finesse
+        w0 (Union[float, list]): central wavelength(s) in nm
+        mu (Union[float, list]): mass(es) in amu
+        amp (Union[float, list]): amplitude(s) for the lines
+        temp (Union[float, list]): temperature(s) in eV
+        v (Union[float, list]): velocities in m/s
+        gamma (Union[float, list]): Lorentzian full width(s) at half maximum in nm (Stark,
+            instrument, ...), default=0.0 (Gaussian lines)
+        tol (float): truncation tolerance for the harmonic sum, default=1e-10
+
+    Returns:
+        np.ndarray: array length of r of forward model
+    """
+    w0 = np.atleast_1d(np.asarray(w0, dtype=np.float64))
+    mu = np.atleast_1d(np.asarray(mu, dtype=np.float64))
+    temp = np.atleast_1d(np.asarray(temp, dtype=np.float64))
+    v = np.atleast_1d(np.asarray(v, dtype=np.float64))
+
+    sigma = w0 * 3.2765e-5 * np.sqrt(temp / mu)
+    w = w0 * (1.0 - 3.336e-9 * v)
+
+    return fourier_line_model(r, L, d, F, w, sigma, amp, gamma=gamma, tol=tol)
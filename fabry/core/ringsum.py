@@ -1,8 +1,10 @@
 from __future__ import division, print_function
 import numpy as np
-import matplotlib.pyplot as plt
 import multiprocessing as mp
 from numba import jit
+from ..tools.helpers import lazy_import, radius_blocks
+
+plt = lazy_import('matplotlib.pyplot')
 
 """
 Core module contains ringsum codes that are the basis of this
@@ -59,6 +61,54 @@ def get_bin_edges(dat, x0, y0, binsize=0.1):
     return redges
 
 
+def bin_edges_from_centers(r):
+    """Reconstructs the equal area bin edges from the bin centers returned by ringsum
+
+    The first annulus starts at r = 0, so its center is half of the first edge and every
+    edge is sqrt(n) times the first edge.
+
+    Args:
+        r (np.ndarray): bin centers from ringsum
+
+    Returns:
+        np.ndarray: bin edges (length len(r) + 1)
+    """
+    r = np.asarray(r, dtype=np.float64)
+    first_edge = 2.0 * r[0]
+    return first_edge * np.sqrt(np.arange(len(r) + 1))
+
+
+def coarsen_ringsum(redges, sig, sig_sd, factor):
+    """Merges groups of factor consecutive equal area annuli into larger equal area annuli
+
+    Every annulus holds the same number of pixels, so the merged mean is the mean of the bin
+    means. Left over bins at the end that do not fill a group are dropped.
+
+    Args:
+        redges (np.ndarray): bin edges (length len(sig) + 1)
+        sig (np.ndarray): ringsum bin means
+        sig_sd (np.ndarray): standard deviation of the bin means
+        factor (int): number of annuli to merge
+
+    Returns:
+        tuple (np.ndarray, np.ndarray, np.ndarray, np.ndarray): merged bin edges, bin centers,
+            bin means, standard deviation of the bin means
+    """
+    factor = int(factor)
+    nbins = len(sig) // factor
+    n = nbins * factor
+
+    edges = np.asarray(redges)[0:n + 1:factor]
+    sig = np.asarray(sig)[0:n].reshape(nbins, factor)
+    sig_sd = np.asarray(sig_sd)[0:n].reshape(nbins, factor)
+
+    new_sig = np.mean(sig, axis=1)
+    new_sd = np.sqrt(np.sum(sig_sd ** 2, axis=1)) / factor
+    rarr = 0.5 * (edges[0:-1] + edges[1:])
+
+    return edges, rarr, new_sig, new_sd
+
+
 def locate_center(data_in, xguess=None, yguess=None, maxiter=25, binsize=0.1, plotit=False, block_center=False,
                   printit=False):
     """
@@ -220,7 +270,7 @@ def locate_center(data_in, xguess=None, yguess=None, maxiter=25, binsize=0.1, pl
     return xguess, yguess
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def calculate_weighted_mean(data, error):
     """Calculates the weighted mean of data with standard deviation error
 
@@ -248,7 +298,7 @@ def calculate_weighted_mean(data, error):
     return mean, sigma
 
 
-@jit(nopython=True)
+@jit(nopython=True, cache=True)
 def super_pixelate(data, npix=2):
     """Creates super pixels for image data
 
@@ -267,8 +317,8 @@ def super_pixelate(data, npix=2):
 
     d = np.zeros((n_new, m_new))
 
-    for i in xrange(n_new):
-        for j in xrange(m_new):
+    for i in range(n_new):
+        for j in range(m_new):
             n_idx = slice(i * npix, (i + 1) * npix)
             m_idx = slice(j * npix, (j + 1) * npix)
             # d[i, j] = np.mean(data[n_idx, m_idx])
@@ -276,6 +326,48 @@ def super_pixelate(data, npix=2):
     return d
 
 
+@jit(nopython=True, cache=True)
+def _pixels_within(radii, nx, ny, x0, y0):
+    """Number of pixel centers (x, y counted from 0) of an (ny, nx) image within each radius"""
+    counts = np.zeros(len(radii), dtype=np.int64)
+    for k in range(len(radii)):
+        r2 = radii[k] ** 2
+        ilo = max(int(np.ceil(y0 - radii[k])), 0)
+        ihi = min(int(np.floor(y0 + radii[k])), ny - 1)
+        total = 0
+        for i in range(ilo, ihi + 1):
+            dy2 = (i - y0) ** 2
+            if dy2 > r2:
+                continue
+            half = np.sqrt(r2 - dy2)
+            jlo = max(int(np.ceil(x0 - half)), 0)
+            jhi = min(int(np.floor(x0 + half)), nx - 1)
+            if jhi >= jlo:
+                total += jhi - jlo + 1
+        counts[k] = total
+    return counts
+
+
+def annulus_pixel_counts(redges, nx, ny, x0, y0):
+    """Returns the number of pixels ringsum puts in each annulus, without an image
+
+    Pixel centers are counted per row from the chord length, which costs one square root per
+    row and edge instead of sorting every pixel radius.
+
+    Args:
+        redges (np.ndarray): bin edges from get_bin_edges (starting at 0)
+        nx (int): number of pixels in x
+        ny (int): number of pixels in y
+        x0 (float): center location in x
+        y0 (float): center location in y
+
+    Returns:
+        np.ndarray: pixel count of each of the len(redges) - 1 annuli
+    """
+    within = _pixels_within(np.asarray(redges[1:], dtype=np.float64), int(nx), int(ny), float(x0), float(y0))
+    return np.diff(np.concatenate(([0], within)))
+
+
 def ringsum(data, x0, y0, binsize=0.1, quadrants=False, use_weighted=False, remove_hot_pixels=False):
     """Returns a equal annulus area ringsum centered at (x0, y0) from data
 
@@ -290,13 +382,6 @@ def ringsum(data, x0, y0, binsize=0.1, quadrants=False, use_weighted=False, remo
     Returns:
         tuple
     """
-    ny, nx = data.shape
-    x = np.arange(0, nx, 1)
-    y = np.arange(0, ny, 1)
-
-    xx, yy = np.meshgrid(1. * x - x0, 1. * y - y0)
-    R = np.sqrt(xx ** 2 + yy ** 2)
-
     redges = get_bin_edges(data, x0, y0, binsize=binsize)
     ri = int(redges[-1])
 
@@ -317,9 +402,10 @@ def ringsum(data, x0, y0, binsize=0.1, quadrants=False, use_weighted=False, remo
         out = mp.Queue()
         labels = ['UL', 'UR', 'BL', 'BR']
         for k in range(nprocs):
-            p = mp.Process(target=_ringsum, args=(redges[1:],
-                                                  R[i1[k]:i2[k], j1[k]:j2[k]], data[i1[k]:i2[k], j1[k]:j2[k]]),
-                                                  kwargs={'out': out, 'label': labels[k], 'use_weighted': False, 'remove_hot_pixels':remove_hot_pixels})
+            # the quadrant's radii are computed in the worker relative to its own corner
+            p = mp.Process(target=_ringsum, args=(redges[1:], data[i1[k]:i2[k], j1[k]:j2[k]], x0 - j1[k], y0 - i1[k]),
+                           kwargs={'out': out, 'label': labels[k], 'use_weighted': False,
+                                   'remove_hot_pixels': remove_hot_pixels})
             procs.append(p)
             p.start()
 
@@ -332,71 +418,67 @@ def ringsum(data, x0, y0, binsize=0.1, quadrants=False, use_weighted=False, remo
 
         return rarr, sigs['UL'], sigs['UR'], sigs['BL'], sigs['BR']
     else:
-        sig, sigma = _ringsum(redges[1:], R, data, out=None, label=None, use_weighted=False, remove_hot_pixels=remove_hot_pixels)
+        sig, sigma = _ringsum(redges[1:], data, x0, y0, out=None, label=None, use_weighted=False,
+                              remove_hot_pixels=remove_hot_pixels)
         return rarr, sig, sigma
 
 
-def _ringsum(redges, radii, data, out=None, label=None, use_weighted=False, remove_hot_pixels=False):
+def _ringsum(redges, data, x0, y0, out=None, label=None, use_weighted=False, remove_hot_pixels=False):
     """Helper function for ringsumming
 
+    The pixel radii are made tile by tile (see radius_blocks) and only the per bin sums are
+    accumulated, so no full frame radius (or sort index) array is built. A pixel at radius R
+    goes into the first bin with R <= edge, pixels beyond the last edge are skipped.
+
     Args:
         redges (np.ndarray): bin edges (does not include origin)
-        radii (np.ndarray): radii to bin
         data (np.ndarray): image weights for the radii to be binned with
+        x0 (float): center location in x in the pixel coordinates of data
+        y0 (float): center location in y in the pixel coordinates of data
         out (mp.Queue, optional): multiprocessing queue to place results in if needed
         label (list, optional): label to put with results when placing in out
         use_weighted (bool): use weighted mean if True, default=False
 
     Returns:
-        None if use_weighted
+        None if out and label
         tuple (np.ndarray, np.ndarray): ring sum, ring sum standard deviations
     """
     # redges does not include zero!
     n = len(redges)
+    ny, nx = data.shape
 
-    R = radii.flatten()
-    d = data.flatten()
+    def bin_sums(*funcs):
+        # one pass over the tiles, func(values, bin index) gives the per pixel terms to sum
+        totals = [np.zeros(n) for _ in funcs]
+        for rows, cols, radii in radius_blocks(nx, ny, x0, y0):
+            idx = np.searchsorted(redges, radii.ravel())
+            inside = idx < n
+            idx = idx[inside]
+            vals = data[rows, cols].ravel()[inside].astype(np.float64)
+            for total, func in zip(totals, funcs):
+                total += np.bincount(idx, weights=func(vals, idx), minlength=n)
+        return totals
+
+    def moments(selected):
+        # (weighted) means and standard deviations of the means over the selected pixels
+        counts, sums = bin_sums(lambda d, i: selected(d, i).astype(np.float64),
+                                lambda d, i: np.where(selected(d, i), d, 0.0))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = sums / counts
+            std = np.sqrt(bin_sums(lambda d, i: np.where(selected(d, i), (d - mean[i]) ** 2, 0.0))[0] / counts)
+            if use_weighted:
+                # weights 1 / (1.8 d) for the positive pixels, see calculate_weighted_mean
+                npos, inv_sum = bin_sums(lambda d, i: (selected(d, i) & (d > 0.0)).astype(np.float64),
+                                         lambda d, i: np.where(selected(d, i) & (d > 0.0), 1.0 / np.abs(d), 0.0))
+                return npos / inv_sum, np.sqrt(1.8 / inv_sum), std
+            return mean, std / np.sqrt(counts), std
 
-    indsort = np.argsort(R)
-    R = R[indsort]
-    d = d[indsort]
+    means, sigmas, std = moments(lambda d, i: np.ones(d.shape, dtype=bool))
+
+    if remove_hot_pixels:
+        center = means
+        means, sigmas, _ = moments(lambda d, i: np.abs(d - center[i]) <= 3.0 * std[i])
 
-    n = len(redges)
-    means = np.zeros(n)
-    sigmas = np.zeros(n)
-    lengths = np.zeros(n)
-    start = 0
-    for idx, edge in enumerate(redges):
-        iedge = np.searchsorted(R[start:], edge, side='right')
-        portion = slice(start, start + iedge)
-        if use_weighted:
-            means[idx], sigmas[idx] = calculate_weighted_mean(d[portion], np.sqrt(1.8 * d[portion]))
-        else:
-            means[idx] = np.mean(d[portion])
-            std = np.std(d[portion])
-            sigmas[idx] = std / np.sqrt(len(d[portion]))
-
-
-        if remove_hot_pixels:
-            good_pixels = np.where(np.abs(d[portion] - means[idx]) <= 3.0*std)
-            if use_weighted:
-                means[idx], sigmas[idx] = calculate_weighted_mean(d[portion][good_pixels], np.sqrt(1.8 * d[portion][good_pixels]))
-            else:
-                means[idx] = np.mean(d[portion][good_pixels])
-                # print(len(d[portion]), len(d[portion][good_pixels]))
-                if False:#idx == 700:
-                    print(edge)
-                    fig, ax = plt.subplots()
-                    ax.hist(d[portion], bins='auto')
-                    ax.axvline(means[idx]-3.0*std)
-                    ax.axvline(means[idx]+3.0*std)
-                    plt.show()
-                sigmas[idx] = np.std(d[portion][good_pixels]) / np.sqrt(len(d[portion][good_pixels]))
-
-        lengths[idx] = len(d[portion])
-        start += iedge
-
-    #print(len(d[portion]))
     if out and label:
         out.put((label, means, sigmas))
     else:
@@ -1,9 +1,19 @@
 from __future__ import print_function, division, absolute_import
 import numpy as np
-from . import models
+from . import models, ringsum
 import multiprocessing as multi
-from collections import MutableMapping
+try:
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = ThreadPoolExecutor = None
+from numba import jit
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
 from ..plasma import plasma
+from ..tools.shared import SharedArray
+from ..tools.helpers import radius_blocks, row_blocks
 
 ########################################
 # Physical constants, DO NOT OVERWRITE #
@@ -13,67 +23,320 @@ c = 2.998e8
 mp = 1.672e-27
 
 
+@jit(nopython=True, cache=True)
+def _cubic_lookup(table, t):
+    """4 point Lagrange interpolation of a uniform table with one ghost point at each end"""
+    nint = len(table) - 3
+    if t <= 0.0:
+        return table[1]
+    if t >= nint:
+        return table[nint + 1]
+    idx = int(t)
+    u = t - idx
+    um1 = u - 1.0
+    um2 = u - 2.0
+    up1 = u + 1.0
+    return (-u * um1 * um2 * table[idx] + 3.0 * up1 * um1 * um2 * table[idx + 1]
+            - 3.0 * up1 * u * um2 * table[idx + 2] + up1 * u * um1 * table[idx + 3]) / 6.0
+
+
+@jit(nopython=True, cache=True)
+def _interpolate_r2(table, scale, r2, out):
+    """Interpolates the r^2 table onto the flat array r2"""
+    for i in range(len(r2)):
+        out[i] = _cubic_lookup(table, r2[i] * scale)
+
+
+@jit(nopython=True, cache=True)
+def _interpolate_r2_grid(table, scale, dx2, dy2, out):
+    """Interpolates the r^2 table onto out[i, j] at r^2 = dy2[i] + dx2[j]"""
+    for i in range(len(dy2)):
+        for j in range(len(dx2)):
+            out[i, j] = _cubic_lookup(table, (dy2[i] + dx2[j]) * scale)
+
+
+@jit(nopython=True, cache=True)
+def _cumulative_lookup(ctable, scale, first, last, s):
+    """Cumulative profile at s, extended linearly with the end values of the profile"""
+    nint = len(ctable) - 3
+    t = s * scale
+    if t <= 0.0:
+        return s * first
+    if t >= nint:
+        return ctable[nint + 1] + (t - nint) / scale * last
+    return _cubic_lookup(ctable, t)
+
+
+@jit(nopython=True, cache=True)
+def _cumulative_r2(ctable, scale, first, last, r2, out):
+    """Evaluates the cumulative profile at the flat array r2"""
+    for i in range(len(r2)):
+        out[i] = _cumulative_lookup(ctable, scale, first, last, r2[i])
+
+
+@jit(nopython=True, cache=True)
+def _pixel_average_r2_grid(table, ctable, scale, dx, dy, nodes, weights, out):
+    """Averages the r^2 table over unit pixels centered at (dx[j], dy[i])
+
+    Across a pixel r^2 is linear in x and y to a good approximation, so it has a trapezoidal
+    distribution: a uniform spread over the wide direction (differences of the cumulative
+    profile) averaged over the narrow direction with Gauss-Legendre nodes.
+    """
+    first = table[1]
+    last = table[len(table) - 2]
+    for i in range(len(dy)):
+        ay = abs(dy[i])
+        for j in range(len(dx)):
+            ax = abs(dx[j])
+            s0 = ax * ax + ay * ay + 1.0 / 6.0
+            wide = 2.0 * max(ax, ay)
+            narrow = 2.0 * min(ax, ay)
+            total = 0.0
+            for k in range(len(nodes)):
+                s = s0 + 0.5 * narrow * nodes[k]
+                if wide > 1e-6:
+                    total += weights[k] * (_cumulative_lookup(ctable, scale, first, last, s + 0.5 * wide) -
+                                           _cumulative_lookup(ctable, scale, first, last, s - 0.5 * wide)) / wide
+                else:
+                    total += weights[k] * _cubic_lookup(table, s * scale)
+            out[i, j] = total
+
+
+def _ghost_table(values):
+    """Pads values with quadratically extrapolated ghost points for the cubic lookup"""
+    table = np.empty(len(values) + 2)
+    table[1:-1] = values
+    table[0] = 3.0 * values[0] - 3.0 * values[1] + values[2]
+    table[-1] = 3.0 * values[-1] - 3.0 * values[-2] + values[-3]
+    return table
+
+
+class RadialProfile(object):
+    """A radially symmetric model tabulated on a uniform grid in r^2
+
+    Fabry-Perot fringes are (nearly) equally spaced in r^2, so a uniform r^2 grid resolves every
+    fringe with the same number of points and maps onto pixels with index arithmetic instead of
+    a sqrt and a binary search per pixel. Values in between are 4 point (cubic) Lagrange
+    interpolated.
+
+    Attributes:
+        r2max (float): largest tabulated r^2
+        values (np.ndarray): model values at r^2 = linspace(0, r2max, len(values))
+    """
+
+    def __init__(self, r2max, values):
+        super(RadialProfile, self).__init__()
+        self.r2max = float(r2max)
+        self.values = np.asarray(values, dtype=np.float64)
+        if len(self.values) < 3:
+            raise ValueError('a RadialProfile needs at least 3 points')
+        self._table = _ghost_table(self.values)
+        self._scale = (len(self.values) - 1) / self.r2max
+        self._cumulative_table = None
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(r2max={!r}, npts={!r})".format(class_name, self.r2max, len(self.values))
+
+    @property
+    def r2(self):
+        """np.ndarray: r^2 grid"""
+        return np.linspace(0.0, self.r2max, len(self.values))
+
+    @classmethod
+    def from_function(cls, func, rmax, rtol=1e-5, npts=256, max_points=2 ** 24):
+        """Tabulates func on a uniform r^2 grid refined until the interpolation meets rtol
+
+        The grid spacing is halved until the largest interpolation error, estimated at the
+        midpoints as 1/16 of the error of the previous grid, is below rtol times the largest
+        value. Every refinement reuses the values already computed.
+
+        Args:
+            func (callable): func(r) -> model values for an array of radii
+            rmax (float): largest radius needed
+            rtol (float): interpolation tolerance relative to max(|func|), default=1e-5
+            npts (int): number of intervals on the starting grid, default=256
+            max_points (int): stop refining beyond this many grid points, default=2**24
+
+        Returns:
+            RadialProfile
+        """
+        r2max = float(rmax) ** 2
+        r2 = np.linspace(0.0, r2max, npts + 1)
+        values = np.asarray(func(np.sqrt(r2)), dtype=np.float64)
+        while True:
+            mid = 0.5 * (r2[:-1] + r2[1:])
+            mid_values = np.asarray(func(np.sqrt(mid)), dtype=np.float64)
+            table = _ghost_table(values)
+            estimate = (9.0 * (table[1:-2] + table[2:-1]) - table[:-3] - table[3:]) / 16.0
+            error = np.max(np.abs(mid_values - estimate))
+
+            refined = np.empty(2 * len(values) - 1)
+            refined[0::2] = values
+            refined[1::2] = mid_values
+            values = refined
+            r2 = np.linspace(0.0, r2max, len(values))
+
+            if error / 16.0 <= rtol * np.max(np.abs(values)) or 2 * len(values) - 1 > max_points:
+                break
+
+        return cls(r2max, values)
+
+    def evaluate_r2(self, r2):
+        """Interpolates the profile at r^2 (values beyond r2max are clamped)
+
+        Args:
+            r2 (np.ndarray): squared radii
+
+        Returns:
+            np.ndarray: profile with the shape of r2
+        """
+        r2 = np.asarray(r2, dtype=np.float64)
+        out = np.empty(r2.size)
+        _interpolate_r2(self._table, self._scale, r2.ravel(), out)
+        return out.reshape(r2.shape)
+
+    def __call__(self, r):
+        r = np.asarray(r, dtype=np.float64)
+        return self.evaluate_r2(r * r)
+
+    def cumulative(self):
+        """np.ndarray: integral of the profile over r^2 from 0 to each grid point
+
+        The profile is integrated exactly under the cubic interpolation. The area of an annulus
+        is pi d(r^2), so differences of the cumulative profile are annulus integrals over pi.
+        """
+        if self._cumulative_table is None:
+            table = self._table
+            step = self.r2max / (len(self.values) - 1)
+            intervals = step * (13.0 * (table[1:-2] + table[2:-1]) - table[:-3] - table[3:]) / 24.0
+            self._cumulative_table = _ghost_table(np.concatenate(([0.0], np.cumsum(intervals))))
+        return self._cumulative_table[1:-1]
+
+    def annulus_mean(self, redges):
+        """Returns the mean of the profile over each annulus between consecutive radii
+
+        Args:
+            redges (np.ndarray): annulus edges
+
+        Returns:
+            np.ndarray: len(redges) - 1 annulus means
+        """
+        self.cumulative()
+        r2 = np.asarray(redges, dtype=np.float64) ** 2
+        cumulative = np.empty(len(r2))
+        _cumulative_r2(self._cumulative_table, self._scale, self._table[1], self._table[-2], r2, cumulative)
+        return np.diff(cumulative) / np.diff(r2)
+
+    def render(self, nx, ny, x0, y0, out=None, integrate=False, nodes=2):
+        """Maps the profile onto an (ny, nx) pixel grid
+
+        Pixel (i, j) is at x = j + 1, y = i + 1 like Sensor. The interpolation runs in a compiled
+        loop, so no temporaries the size of the image are created.
+
+        With integrate=True every pixel holds the average of the profile over its area instead
+        of the value at its center, which is what a camera records when fringes are narrow
+        compared to a pixel. The average comes from the cumulative profile, so there is no
+        quadrature over the pixel.
+
+        Args:
+            nx (int): number of pixels in x
+            ny (int): number of pixels in y
+            x0 (float): x location of the center
+            y0 (float): y location of the center
+            out (np.ndarray, optional): (ny, nx) output array
+            integrate (bool): average over the pixel area, default=False
+            nodes (int): Gauss-Legendre nodes across the narrow direction of r^2 for
+                integrate=True, default=2
+
+        Returns:
+            np.ndarray: (ny, nx) image
+        """
+        if out is None:
+            out = np.empty((ny, nx))
+        dx = np.arange(1, nx + 1) - x0
+        dy = np.arange(1, ny + 1) - y0
+        if integrate:
+            self.cumulative()
+            gl_nodes, gl_weights = np.polynomial.legendre.leggauss(nodes)
+            _pixel_average_r2_grid(self._table, self._cumulative_table, self._scale, dx, dy, gl_nodes,
+                                   0.5 * gl_weights, out)
+        else:
+            _interpolate_r2_grid(self._table, self._scale, dx ** 2, dy ** 2, out)
+        return out
+
+
 class Sensor(object):
     """A representation for a camera sensor for the Fabry Perot
 
+    Pixel radii are produced on demand in tiles (see blocks) instead of being stored for the
+    whole sensor.
+
     Attributes:
         nx (int): number of pixels in the x direction
         ny (int): number of pixels in the y direction
         px_size (float): Pixel size in mm
         x0 (float): x location of the center
         y0 (float): y location of th center
-        sensor (np.ndarray): 2D array representing the sensors where each 
+        dtype (np.dtype): data type of the pixel radii
+        sensor (np.ndarray): (ny, nx) array representing the sensors where each
             element is the count value for that pixel
     """
 
-    def __init__(self, nx, ny, px_size=0.004):
+    def __init__(self, nx, ny, px_size=0.004, dtype=np.float64):
         super(Sensor, self).__init__()
 
         self.nx = int(nx)
         self.ny = int(ny)
-        self.sensor = np.zeros((nx, ny))
+        self.sensor = np.zeros((self.ny, self.nx))
         self.px_size = px_size
         self.x0 = nx / 2.0
         self.y0 = ny / 2.0
-        self._R = None  # Delay the creation of the R matrix until it is actually needed
+        self.dtype = np.dtype(dtype)
+
+    def blocks(self, block_rows=256, block_cols=None):
+        """Iterates over the sensor in tiles of pixel radii
+
+        Args:
+            block_rows (int): rows per tile, default=256
+            block_cols (int, optional): columns per tile, full rows if None
+
+        Yields:
+            tuple (slice, slice, np.ndarray): rows, columns and radii (in self.dtype) of the tile
+        """
+        return radius_blocks(self.nx, self.ny, self.x0, self.y0, block_rows=block_rows, block_cols=block_cols,
+                             origin=1, dtype=self.dtype)
 
     def create_Rgrid(self):
         """Creates a 2D matrix of radii values for each pixel
 
+        Note: this allocates a full frame, prefer iterating over blocks for large sensors.
+
         returns:
             np.ndarray
         """
-        nx = self.nx
-        ny = self.ny
-
-        x = np.arange(1, nx + 1, 1)
-        y = np.arange(1, ny + 1, 1)
-
-        XX, YY = np.meshgrid(x, y)
-
-        R = np.sqrt((XX - self.x0) ** 2 + (YY - self.y0) ** 2)
-
+        R = np.empty((self.ny, self.nx), dtype=self.dtype)
+        for rows, cols, radii in self.blocks():
+            R[rows, cols] = radii
         return R
 
     @property
     def R(self):
-        """np.ndarray: 2D array of radii values for each pixel"""
-        if self._R is None:
-            self._R = self.create_Rgrid()
-        return self._R
+        """np.ndarray: 2D array of radii values for each pixel (created on every access)"""
+        return self.create_Rgrid()
 
-    # @R.setter
-    # def R(self):
-    #     self._R = self.create_Rgrid()
-
-    def calculate_emission(self, etalon, light_source, nprocs=4):
+    def calculate_emission(self, etalon, light_source, nprocs=4, camera=None, seed=None, noise=True):
         """Calculates emission from a light source through an etalon onto the sensor
 
         Args:
             etalon (Etalon): representation of the etalon
             light_source (LightSource): representation of the light source
+            camera (CameraModel, optional): noise model, defaults to shot noise only
+            seed (int, optional): seed for the camera noise
+            noise (bool): apply the camera noise, default=True
         """
-        self.sensor = etalon.calculate_emission(self, light_source, nprocs=nprocs)
+        self.sensor = etalon.calculate_emission(self, light_source, nprocs=nprocs, camera=camera, seed=seed,
+                                                noise=noise)
 
     @classmethod
     def from_dict(cls, sensor):
@@ -88,7 +351,8 @@ class Sensor(object):
         nx = sensor.get('nx', 1024)
         ny = sensor.get('ny', 1024)
         px_size = sensor.get('px_size', 0.004)
-        return cls(nx, ny, px_size=px_size)
+        dtype = sensor.get('dtype', 'float64')
+        return cls(nx, ny, px_size=px_size, dtype=dtype)
 
     def to_dict(self):
         """Returns a dictionary representation of a Sensor
@@ -96,11 +360,308 @@ class Sensor(object):
         Returns:
             dict: a dictionary representation of a Sensor
         """
-        return {'nx': self.nx, 'ny': self.ny, 'px_size': self.px_size}
+        return {'nx': self.nx, 'ny': self.ny, 'px_size': self.px_size, 'dtype': self.dtype.name}
 
     def __repr__(self):
         class_name = type(self).__name__
-        return '{}({!r}, {!r}, px_size={!r})'.format(class_name, self.nx, self.ny, self.px_size)
+        return '{}({!r}, {!r}, px_size={!r}, dtype={!r})'.format(class_name, self.nx, self.ny, self.px_size,
+                                                                 self.dtype.name)
+
+
+class CameraModel(object):
+    """Noise model of a camera that converts expected photoelectrons into counts
+
+    Pixels are exposed in fixed size chunks and every chunk draws from its own random stream
+    spawned from one np.random.SeedSequence, so a frame depends only on the seed, not on the
+    number of worker threads. Chunks run on a thread pool (numpy's generators release the GIL)
+    and write straight into the output array.
+
+    Attributes:
+        gain (float): electrons per count (ADU)
+        read_noise (float): read noise in electrons rms
+        dark_current (float): dark current in electrons per pixel per second
+        bias (float): offset added to every pixel in counts
+        full_well (float): full well capacity in electrons, None for no saturation
+        bit_depth (int): ADC bit depth, None for unquantized floating point counts
+    """
+
+    def __init__(self, gain=1.0, read_noise=0.0, dark_current=0.0, bias=0.0, full_well=None, bit_depth=None):
+        super(CameraModel, self).__init__()
+        self.gain = gain
+        self.read_noise = read_noise
+        self.dark_current = dark_current
+        self.bias = bias
+        self.full_well = full_well
+        self.bit_depth = bit_depth
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(gain={!r}, read_noise={!r}, dark_current={!r}, bias={!r}, full_well={!r}, bit_depth={!r})".format(
+            class_name, self.gain, self.read_noise, self.dark_current, self.bias, self.full_well, self.bit_depth)
+
+    @property
+    def dtype(self):
+        """np.dtype: data type of the exposed frames"""
+        if self.bit_depth is None:
+            return np.dtype(np.float64)
+        return np.dtype(np.uint16) if self.bit_depth <= 16 else np.dtype(np.uint32)
+
+    def expose(self, signal, exposure=1.0, seed=None, out=None, chunk_size=2 ** 20, nworkers=None):
+        """Applies shot (Poisson), dark current, full well, read noise (Gaussian), gain, bias and
+        ADC quantization to a noiseless frame
+
+        Args:
+            signal (np.ndarray): expected photoelectrons per pixel for the exposure
+            exposure (float): exposure time in seconds for the dark current, default=1.0
+            seed (Union[int, np.random.SeedSequence], optional): seed for the frame, fresh entropy if None
+            out (np.ndarray, optional): output array with the shape of signal
+            chunk_size (int): pixels per random stream, default=2**20
+            nworkers (int, optional): number of threads, defaults to the number of cpus
+
+        Returns:
+            np.ndarray: counts with the shape of signal and dtype CameraModel.dtype
+        """
+        signal = np.ascontiguousarray(signal, dtype=np.float64)
+        if out is None:
+            out = np.empty(signal.shape, dtype=self.dtype)
+        flat_signal = signal.reshape(-1)
+        flat_out = out.reshape(-1)
+
+        starts = list(range(0, flat_signal.size, int(chunk_size)))
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        streams = seed.spawn(len(starts))
+
+        def expose_chunk(idx):
+            start = starts[idx]
+            stop = min(start + int(chunk_size), flat_signal.size)
+            self._expose_chunk(flat_signal[start:stop], exposure, np.random.Generator(np.random.PCG64(streams[idx])),
+                               flat_out[start:stop])
+
+        nworkers = multi.cpu_count() if nworkers is None else max(1, int(nworkers))
+        if nworkers == 1 or len(starts) == 1 or ThreadPoolExecutor is None:
+            for idx in range(len(starts)):
+                expose_chunk(idx)
+        else:
+            with ThreadPoolExecutor(max_workers=nworkers) as executor:
+                list(executor.map(expose_chunk, range(len(starts))))
+
+        return out
+
+    def _expose_chunk(self, signal, exposure, rng, out):
+        expected = np.maximum(signal, 0.0)
+        if self.dark_current:
+            expected += self.dark_current * exposure
+        electrons = rng.poisson(expected).astype(np.float64)
+
+        if self.full_well is not None:
+            np.minimum(electrons, self.full_well, out=electrons)
+        if self.read_noise:
+            noise = rng.standard_normal(electrons.size)
+            noise *= self.read_noise
+            electrons += noise
+
+        electrons /= self.gain
+        electrons += self.bias
+        if self.bit_depth is not None:
+            np.rint(electrons, out=electrons)
+            np.clip(electrons, 0, 2 ** self.bit_depth - 1, out=electrons)
+        out[...] = electrons
+
+    @classmethod
+    def from_dict(cls, camera):
+        """Creates an instance of CameraModel from a dictionary
+
+        Args:
+            camera (dict): dictionary representing a camera
+
+        Returns:
+            CameraModel: a new instance of a CameraModel
+        """
+        return cls(gain=camera.get('gain', 1.0), read_noise=camera.get('read_noise', 0.0),
+                   dark_current=camera.get('dark_current', 0.0), bias=camera.get('bias', 0.0),
+                   full_well=camera.get('full_well', None), bit_depth=camera.get('bit_depth', None))
+
+    def to_dict(self):
+        """Returns a dictionary representation of a CameraModel
+
+        Returns:
+            dict: a dictionary representation of a CameraModel
+        """
+        return {'gain': self.gain, 'read_noise': self.read_noise, 'dark_current': self.dark_current,
+                'bias': self.bias, 'full_well': self.full_well, 'bit_depth': self.bit_depth}
+
+
+def _render_profile_rows(out, start, profile, x0, y0, integrate, nodes):
+    ny, nx = out.shape
+    profile.render(nx, ny, x0, y0 - start, out=out, integrate=integrate, nodes=nodes)
+
+
+def _forward_model_rows(out, start, x0, y0, L, d, F, w, mu, amp, temp, vel):
+    ny, nx = out.shape
+    for rows, cols, r in radius_blocks(nx, ny, x0, y0 - start, block_rows=16, origin=1):
+        out[rows, cols] = models.forward_model(r.ravel(), L, d, F, w, mu, amp, temp, vel).reshape(r.shape)
+
+
+def _fill_shared_rows(func, frame, start, stop, args):
+    """Runs func on rows start:stop of a SharedArray frame inside a worker"""
+    try:
+        func(frame.array[start:stop], start, *args)
+    finally:
+        frame.close()
+
+
+class FrameRenderer(object):
+    """Renders synthetic frames in row blocks on a persistent process pool
+
+    The workers write straight into one shared memory frame (fabry.tools.shared.SharedArray),
+    so only the row range and the model parameters are sent to them and nothing is sent back.
+    Pixel radii are broadcast per row block instead of being stored for the whole sensor. The
+    pool and the frame are reused for every frame of the same size; close the renderer (or
+    use it as a context manager) to stop the workers and free the frame.
+
+    Attributes:
+        nworkers (int): number of worker processes, 1 renders in process
+        block_rows (int): rows per task, None splits each frame into 4 tasks per worker
+    """
+
+    def __init__(self, nworkers=None, block_rows=None):
+        super(FrameRenderer, self).__init__()
+        self.nworkers = multi.cpu_count() if nworkers is None else max(1, int(nworkers))
+        self.block_rows = block_rows
+        self._pool = None
+        self._frame = None
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(nworkers={!r}, block_rows={!r})".format(class_name, self.nworkers, self.block_rows)
+
+    def _blocks(self, ny):
+        block_rows = self.block_rows
+        if block_rows is None:
+            block_rows = -(-ny // (4 * self.nworkers))
+        return [(rows.start, rows.stop) for rows in row_blocks(ny, block_rows)]
+
+    def _shared_frame(self, shape):
+        if self._frame is None or self._frame.shape != tuple(shape):
+            if self._frame is not None:
+                self._frame.unlink()
+            self._frame = SharedArray(shape)
+        return self._frame
+
+    def _run(self, func, shape, args):
+        frame = self._shared_frame(shape)
+        if self.nworkers == 1 or frame.name is None or ProcessPoolExecutor is None:
+            for start, stop in self._blocks(shape[0]):
+                func(frame.array[start:stop], start, *args)
+            return frame.array
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.nworkers)
+        futures = [self._pool.submit(_fill_shared_rows, func, frame, start, stop, args)
+                   for start, stop in self._blocks(shape[0])]
+        for future in futures:
+            future.result()
+        return frame.array
+
+    def render(self, profile, sensor, integrate=True, nodes=2):
+        """Renders a RadialProfile onto the sensor
+
+        Args:
+            profile (RadialProfile): tabulated emission in pixel units
+            sensor (Sensor): represents a camera sensor
+            integrate (bool): average over each pixel's area, default=True
+            nodes (int): see RadialProfile.render, default=2
+
+        Returns:
+            np.ndarray: (ny, nx) view of the shared frame, overwritten by the next render
+        """
+        args = (profile, sensor.x0, sensor.y0, integrate, nodes)
+        return self._run(_render_profile_rows, (sensor.ny, sensor.nx), args)
+
+    def render_direct(self, etalon, sensor, light_source):
+        """Evaluates models.forward_model at every pixel of the sensor
+
+        Args:
+            etalon (Etalon): representation of the etalon
+            sensor (Sensor): represents a camera sensor
+            light_source (LightSource): represents a light source for the Fabry Perot
+
+        Returns:
+            np.ndarray: (ny, nx) view of the shared frame, overwritten by the next render
+        """
+        args = (sensor.x0, sensor.y0, etalon.L / sensor.px_size, etalon.d, etalon.F, light_source.wavelength,
+                light_source.mu, light_source.amplitude, light_source.temperature, light_source.velocity)
+        return self._run(_forward_model_rows, (sensor.ny, sensor.nx), args)
+
+    def close(self):
+        """Shuts down the worker pool and frees the shared frame"""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        if self._frame is not None:
+            self._frame.unlink()
+            self._frame = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def synthetic_ringsum(profile, sensor, binsize=0.1, center=None, camera=None, exposure=1.0, seed=None, noise=True,
+                      color='b'):
+    """Generates the ringsum of a noisy sensor frame without rendering it
+
+    The bins are those of ringsum.ringsum and each one holds the exact number of pixels
+    ringsum.ringsum would put in it (ringsum.annulus_pixel_counts). The expected counts are the
+    annulus means of the profile; the error bars are the camera's per pixel noise (shot, dark,
+    read and quantization noise) over the square root of the pixel count, and the noise is
+    drawn per bin, which is accurate because every bin holds hundreds of pixels.
+
+    Args:
+        profile (RadialProfile): expected photoelectrons per pixel vs. radius in pixels
+        sensor (Sensor): represents a camera sensor
+        binsize (float): the delta r of the last annulus, default=0.1
+        center (tuple, optional): ringsum center (x0, y0) with pixels counted from 0, defaults to
+            the sensor center
+        camera (CameraModel, optional): noise model, defaults to shot noise only (CameraModel())
+        exposure (float): exposure time in seconds for the dark current, default=1.0
+        seed (Union[int, np.random.SeedSequence], optional): seed for the noise
+        noise (bool): add the noise to sig, otherwise sig is the expected ringsum, default=True
+        color (str): color entry of the output, default='b'
+
+    Returns:
+        dict: the bin/process_image.py ringsum layout ('fname', 'color', 'center', 'binsize', 'r',
+            'redges', 'sig', 'sig_sd') plus 'npix', the pixel count of every bin
+    """
+    if center is None:
+        center = (sensor.x0 - 1.0, sensor.y0 - 1.0)
+    x0, y0 = center
+    if camera is None:
+        camera = CameraModel()
+
+    redges = ringsum.get_bin_edges(np.broadcast_to(0.0, (sensor.ny, sensor.nx)), x0, y0, binsize=binsize)
+    npix = ringsum.annulus_pixel_counts(redges, sensor.nx, sensor.ny, x0, y0)
+    r = 0.5 * (redges[0:-1] + redges[1:])
+
+    electrons = np.maximum(profile.annulus_mean(redges), 0.0) + camera.dark_current * exposure
+    if camera.full_well is not None:
+        electrons = np.minimum(electrons, camera.full_well)
+    variance = (electrons + camera.read_noise ** 2) / camera.gain ** 2
+    if camera.bit_depth is not None:
+        variance += 1.0 / 12.0
+
+    sig = electrons / camera.gain + camera.bias
+    sig_sd = np.sqrt(variance / np.maximum(npix, 1))
+    if noise:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        sig = sig + sig_sd * np.random.Generator(np.random.PCG64(seed)).standard_normal(len(sig))
+
+    return {'fname': 'synthetic', 'color': color, 'center': (x0, y0), 'binsize': binsize, 'r': r,
+            'redges': redges, 'sig': sig, 'sig_sd': sig_sd, 'npix': npix}
 
 
 class Etalon(object):
@@ -120,98 +681,91 @@ class Etalon(object):
         self.d = d
         self.F = F
 
-    def calculate_emission(self, sensor, light_source, nprocs=4):
+    def calculate_emission(self, sensor, light_source, nprocs=4, method='interpolate', rtol=1e-5, integrate=True,
+                           renderer=None, noise=True, camera=None, seed=None):
         """Calcultes the emission onto a sensor from a light source
 
-        Note: This uses multiprocessing for speed. Each process has a for loop 
-            because of memory constraints if the sensor is too big.
+        Both methods render row blocks on a FrameRenderer process pool that writes into a shared
+        memory frame. Pass a renderer to reuse its pool (and frame) across calls. Noise is applied
+        the same way for both methods, shot noise only unless a camera is given.
 
         Args:
             sensor (Sensor): represents a camera sensor
             light_source (LightSource): represents a light source for the Fabry Perot
-            nprocs (int): number of processes to use
+            nprocs (int): number of processes to use when no renderer is given
+            method (str): 'interpolate' tabulates the model once on a radial grid (see
+                RadialProfile) and maps it onto the pixels, 'direct' evaluates the model at every
+                pixel, default='interpolate'
+            rtol (float): interpolation tolerance for method='interpolate', default=1e-5
+            integrate (bool): average the emission over each pixel's area instead of sampling
+                pixel centers for method='interpolate', default=True
+            renderer (FrameRenderer, optional): persistent renderer to use
+            noise (bool): expose the emission with camera, default=True
+            camera (CameraModel, optional): noise model, defaults to CameraModel() (shot noise)
+            seed (int, optional): seed for the noise
 
         Returns:
-            np.ndarray: shape matches sensor.sensor.shape
+            np.ndarray: (sensor.ny, sensor.nx) emission
         """
-        r = sensor.R
-        px_size = sensor.px_size
-
-        w = light_source.wavelength
-        mu = light_source.mu
-        amp = light_source.amplitude
-        vel = light_source.velocity
-        temp = light_source.temperature
-
-        split_r = np.array_split(r.flatten(), nprocs)
-        procs = []
-        sigs = {}
-        out = multi.Queue()
-        labels = ['{0}'.format(x) for x in range(nprocs)]
-        for k in range(nprocs):
-            p = multi.Process(target=Etalon._calculate_emission,
-                              args=(split_r[k], self.L / px_size, self.d, self.F, w, mu, amp, temp, vel),
-                              kwargs={'out': out, 'label': labels[k]})
-            procs.append(p)
-            p.start()
-
-        for i in range(nprocs):
-            tup = out.get()
-            sigs[tup[0]] = tup[1]
-
-        for p in procs:
-            p.join()
-
-        emission = []
-        for k in labels:
-            emission.append(sigs[k])
-        emission = np.concatenate(emission)
-        emission.shape = r.shape
-
-        return emission
+        if method not in ('interpolate', 'direct'):
+            raise ValueError("method must be 'interpolate' or 'direct'")
+
+        if renderer is None:
+            with FrameRenderer(nworkers=nprocs) as frame_renderer:
+                return np.array(self.calculate_emission(sensor, light_source, method=method, rtol=rtol,
+                                                        integrate=integrate, renderer=frame_renderer, noise=noise,
+                                                        camera=camera, seed=seed))
+
+        if method == 'interpolate':
+            profile = self.radial_profile(sensor, light_source, rtol=rtol)
+            emission = renderer.render(profile, sensor, integrate=integrate)
+        else:
+            emission = renderer.render_direct(self, sensor, light_source)
 
-    @staticmethod
-    def _calculate_emission(r, L, d, F, w, mu, amp, temp, vel, out=None, label=None, noise=True):
-        """Helper function for calculating emission
+        if not noise:
+            return emission
+        camera = CameraModel() if camera is None else camera
+        out = emission if camera.dtype == emission.dtype else None
+        return camera.expose(emission, seed=seed, out=out)
 
-        Note: This is utlized by calculate_emission for multiprocessing
+    def radial_profile(self, sensor, light_source, rtol=1e-5, impact_factor=None, nlambda=1024, rmax=None):
+        """Tabulates the noiseless emission out to the farthest sensor corner
 
         Args:
-            r (np.ndarray): radii in pixels
-            L (float): focal length of camera lens in pixels
-            d (float): etalon spacing in mm
-            F (float): finesse of etalon
-            w (float): wavelength in nm
-            mu (float): relative mass
-            amp (float): amplitude of line
-            temp (float): ion temperature in eV
-            vel (float): velocity of ion in m/s
-            out (multiprocessing.Queue): output queue
-            label (str): label for the output being put into the output queue
+            sensor (Sensor): represents a camera sensor
+            light_source (LightSource): represents a light source for the Fabry Perot
+            rtol (float): interpolation tolerance relative to the peak, default=1e-5
+            impact_factor (float, optional): view a UniformPlasma along the chord with this impact
+                factor (see UniformPlasma.chord_emission) instead of a single line of
+                light_source.amplitude
+            nlambda (int): number of wavelengths for the chord spectrum, default=1024
+            rmax (float, optional): largest radius in pixels, defaults to just past the farthest
+                sensor corner
 
         Returns:
-            np.ndarray (optional) only if not using for multiprocessing
+            RadialProfile
         """
-        # Memory is a problem here because of broadcasting so I'm going to split the problem up
-        model = []
-        r_split = np.array_split(r.flatten(), 1000)
-        for r_sp in r_split:
-            model.append(models.forward_model(r_sp, L, d, F, w, mu, amp, temp, vel))
-        model = np.concatenate(model)
-
-        if noise:
-            print(label, 'adding noise to the image')
-            npts = len(model)
-            for i in xrange(npts):
-                model[i] = model[i] + np.random.normal(scale=np.sqrt(model[i]))
-                if i % 100 == 0:
-                    print(model[i], np.random.normal(scale=np.sqrt(model[i])))
-
-        if out and label:
-            print(label)
-            out.put((label, model))
+        L = self.L / sensor.px_size
+        if rmax is None:
+            corners_x = (1.0 - sensor.x0, sensor.nx - sensor.x0)
+            corners_y = (1.0 - sensor.y0, sensor.ny - sensor.y0)
+            rmax = np.sqrt(max(x ** 2 for x in corners_x) + max(y ** 2 for y in corners_y)) + 1.0
+
+        if impact_factor is not None:
+            velocity = light_source.velocity
+            vmax = abs(getattr(velocity, 'Vmax', velocity or 0.0))
+            width = 10.0 * light_source.sigma + light_source.wavelength * vmax / c
+            wavelength = np.linspace(light_source.wavelength - width, light_source.wavelength + width, nlambda)
+            spectrum = light_source.chord_emission(impact_factor, wavelength)
+
+            def func(r):
+                return models.general_model(r, L, self.d, self.F, wavelength, spectrum)
         else:
-            return model
+            def func(r):
+                return models.forward_model(r, L, self.d, self.F, light_source.wavelength, light_source.mu,
+                                            light_source.amplitude, light_source.temperature, light_source.velocity)
+
+        return RadialProfile.from_function(func, rmax, rtol=rtol)
 
     def __repr__(self):
         class_name = type(self).__name__
@@ -354,46 +908,60 @@ class UniformPlasma(LightSource):
             velocity = velocity(r)
 
         if cos_theta is not None:
-            print('im in the cos theta portion')
-            cosine = np.asarray(cos_theta)
-            print(cosine.max(), cosine.min())
-            velocity *= cosine
+            velocity = velocity * np.asarray(cos_theta)
 
         line_profile = self.gaussian(wavelength, velocity)
 
         emission = self.ne ** 2 * self.pec * line_profile / (4 * np.pi)
         return emission
 
-    def chord_emission(self, impact_factor, wavelength):
-
-        b = np.asarray(impact_factor)
-        if np.max(b) < 0.0:
-            raise ValueError('impact_factor must be greater than or equal to zero')
+    def chord_emission(self, impact_factor, wavelength, nnodes=128, max_radius=150.0, max_bytes=2 ** 27):
+        """Integrates the ion emission along chords with Gauss-Legendre quadrature
 
-        max_radii = 150.0
-        x_max = np.sqrt(max_radii ** 2 - b ** 2)
-        x_arr = np.linspace(0.0, x_max, 1000)
+        The chords at all impact factors are evaluated together as (nchord, nnodes, nlambda)
+        arrays, in chunks of chords that keep each array below max_bytes. A callable velocity
+        profile is evaluated chord by chord, so its normalization only sees the radii of that
+        chord as before.
 
-        # I need the x_arr and subsequent arrays to be broadcastable with wavelength array
-        x_arr = x_arr[np.newaxis, :]
-        w = wavelength[:, np.newaxis]
-
-        # theta_arr = np.arctan2(b, x_arr)
-        cos_theta = b / np.sqrt(b ** 2 + x_arr ** 2)
-
-        rarr = np.sqrt(x_arr ** 2 + b ** 2)
-        print(rarr.shape)
-        print(w.shape)
-        emission = self.ion_emission(rarr, w, cos_theta=cos_theta)
+        Args:
+            impact_factor (Union[float, np.ndarray]): impact factor(s) of the chords in cm
+            wavelength (np.ndarray): wavelengths to evaluate the spectrum at
+            nnodes (int): Gauss-Legendre nodes along each half chord, default=128
+            max_radius (float): edge of the plasma in cm, default=150.0
+            max_bytes (int): memory cap for the batched arrays, default=2**27
 
-        radiance = 2.0 * np.trapz(emission, x=x_arr, axis=1)
-        print(emission.shape, x_arr.shape, w.shape, radiance.shape)
-        # fig, ax = plt.subplots()
-        # for i in range(1000):
-        #    if i % 50 == 0:
-        #        ax.plot(wavelength, emission[:, i] / emission.max())
-        # ax.plot(wavelength, radiance / radiance.max(), 'k')
-        # plt.show()
+        Returns:
+            np.ndarray: radiance (nlambda,) for a single impact factor, (nchord, nlambda) otherwise
+        """
+        b = np.asarray(impact_factor, dtype=np.float64)
+        chords = np.atleast_1d(b)
+        if np.min(chords) < 0.0 or np.max(chords) > max_radius:
+            raise ValueError('impact_factor must be between zero and max_radius')
+        w = np.asarray(wavelength, dtype=np.float64)
+
+        nodes, weights = np.polynomial.legendre.leggauss(nnodes)
+        half_length = np.sqrt(max_radius ** 2 - chords ** 2)
+        x_arr = 0.5 * half_length[:, np.newaxis] * (nodes[np.newaxis, :] + 1.0)
+        dx = 0.5 * half_length[:, np.newaxis] * weights[np.newaxis, :]
+        rarr = np.sqrt(x_arr ** 2 + chords[:, np.newaxis] ** 2)
+        cos_theta = np.divide(chords[:, np.newaxis], rarr, out=np.ones_like(rarr), where=rarr > 0.0)
+
+        velocity = 0.0 if self.velocity is None else self.velocity
+        if callable(velocity):
+            velocity = np.array([velocity(r) for r in rarr])
+        velocity = np.broadcast_to(velocity, rarr.shape) * cos_theta
+
+        radiance = np.empty((len(chords), len(w)))
+        chunk = max(1, int(max_bytes // (8 * nnodes * len(w))))
+        for start in range(0, len(chords), chunk):
+            idx = slice(start, start + chunk)
+            line_profile = self.gaussian(w[np.newaxis, np.newaxis, :], velocity[idx, :, np.newaxis])
+            line_profile *= dx[idx, :, np.newaxis]
+            radiance[idx] = np.sum(line_profile, axis=1)
+        radiance *= 2.0 * self.ne ** 2 * self.pec / (4 * np.pi)
+
+        if b.ndim == 0:
+            return radiance[0]
         return radiance
 
     def gaussian(self, wavelength, velocity):
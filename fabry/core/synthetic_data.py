@@ -1,9 +1,10 @@
 from __future__ import print_function, division
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy.integrate import trapz
 import multiprocessing as mp
-import h5py
+from ..tools.helpers import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+h5py = lazy_import('h5py')
 
 def airy_func(wavelength, cos_th, d, F):
     Q = (2. * F / np.pi)**2
@@ -68,7 +69,7 @@ def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024, sm_ang=False,
         def par_func(cos_th, spec, wavelength, d, F, out=None, label=None):
             model = np.zeros_like(cos_th)
             for i, cth in enumerate(cos_th):
-                model[i] = trapz(spec*airy_func(wavelength, cth, d, F), wavelength, axis=0)
+                model[i] = np.trapz(spec*airy_func(wavelength, cth, d, F), wavelength, axis=0)
                 model[i] *= 1000
                 model[i] += np.random.normal(loc=0.0, scale=np.sqrt(model[i]), size=1)
             if out and label:
@@ -99,7 +100,7 @@ def forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=1024, sm_ang=False,
             model.append(sigs[k])
         model = np.concatenate(model)
     else:
-        model = trapz(spec*airy_func(wavelength, cos_th, d, F), wavelength, axis=0)
+        model = np.trapz(spec*airy_func(wavelength, cos_th, d, F), wavelength, axis=0)
 
     return model
 
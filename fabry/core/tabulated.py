@@ -0,0 +1,236 @@
+"""Tabulated forward model for single line plasma fits with a fixed calibration
+
+With (L, d, F) fixed, the ringsum model of a single line only depends on the amplitude (linear),
+the Doppler width (Ti) and the shift (V). ModelTable precomputes the unit amplitude forward model
+on a grid that is uniform in sqrt(Ti) and V over the fit radii. Likelihood calls then become a
+16 term cubic interpolation of length len(r) vectors.
+
+Classes:
+    ModelTable: (Ti, V) interpolation table of models.forward_model
+"""
+from __future__ import division, print_function
+import numpy as np
+from .models import forward_model
+from ..tools import file_io as io
+
+
+def _cubic_weights(x, x0, dx, n):
+    """Local cubic Lagrange weights on a uniform grid
+
+    Args:
+        x (float): location to interpolate at
+        x0 (float): first grid point
+        dx (float): grid spacing
+        n (int): number of grid points (at least 4)
+
+    Returns:
+        tuple (int, np.ndarray): index of the first of the four nodes, the four weights
+    """
+    s = (x - x0) / dx
+    i = int(np.floor(s)) - 1
+    i = min(max(i, 0), n - 4)
+    t = s - i
+    # Lagrange basis on the nodes 0, 1, 2, 3
+    weights = np.array([-(t - 1.0) * (t - 2.0) * (t - 3.0) / 6.0,
+                        t * (t - 2.0) * (t - 3.0) / 2.0,
+                        -t * (t - 1.0) * (t - 3.0) / 2.0,
+                        t * (t - 1.0) * (t - 2.0) / 6.0])
+    return i, weights
+
+
+class ModelTable(object):
+    """Unit amplitude forward model tabulated on a (sqrt(Ti), V) grid
+
+    Attributes:
+        r (np.ndarray): radii the model is tabulated at
+        L (float): camera focal length
+        d (float): etalon spacing in mm
+        F (float): etalon finesse
+        w0 (float): line wavelength in nm
+        mu (float): line mass in amu
+        sqrt_Ti (np.ndarray): uniform grid in sqrt(Ti) (Ti in eV)
+        V (np.ndarray): uniform grid in velocity (m/s)
+        table (np.ndarray): model with shape (len(sqrt_Ti), len(V), len(r))
+        max_error (float): largest error relative to the model peak found by check_error (nan if unchecked)
+    """
+
+    def __init__(self, r, L, d, F, w0, mu, sqrt_Ti, V, table, max_error=np.nan):
+        super(ModelTable, self).__init__()
+        self.r = np.asarray(r, dtype=np.float64)
+        self.L = L
+        self.d = d
+        self.F = F
+        self.w0 = w0
+        self.mu = mu
+        self.sqrt_Ti = np.asarray(sqrt_Ti, dtype=np.float64)
+        self.V = np.asarray(V, dtype=np.float64)
+        self.table = np.asarray(table, dtype=np.float64)
+        self.max_error = max_error
+
+        if len(self.sqrt_Ti) < 4 or len(self.V) < 4:
+            raise ValueError('ModelTable needs at least 4 grid points in Ti and V')
+        if self.table.shape != (len(self.sqrt_Ti), len(self.V), len(self.r)):
+            raise ValueError('table shape does not match the grids')
+
+        self._dsqrt_Ti = self.sqrt_Ti[1] - self.sqrt_Ti[0]
+        self._dV = self.V[1] - self.V[0]
+
+    @classmethod
+    def build(cls, r, L, d, F, Ti_lim, V_lim, nTi=64, nV=64, w0=487.98634, mu=39.948, nlambda=1024,
+              rtol=None, Ti_min=1e-3):
+        """Computes forward_model on the (sqrt(Ti), V) grid
+
+        Args:
+            r (np.ndarray): fit radii
+            L (float): camera focal length, same units as r
+            d (float): etalon spacing in mm
+            F (float): etalon finesse
+            Ti_lim (tuple): (min, max) ion temperature in eV
+            V_lim (tuple): (min, max) velocity in m/s
+            nTi (int): number of grid points in sqrt(Ti), default=64
+            nV (int): number of grid points in V, default=64
+            w0 (float): line wavelength in nm, default=487.98634
+            mu (float): line mass in amu, default=39.948
+            nlambda (int): number of points in the wavelength array for forward_model, default=1024
+            rtol (float, optional): if given, check_error is run and a ValueError is raised when the
+                interpolation error relative to the model peak is larger than rtol
+            Ti_min (float): smallest tabulated ion temperature in eV, a lower limit below it (e.g. 0)
+                is raised to Ti_min because forward_model is singular at Ti = 0, default=1e-3
+
+        Returns:
+            ModelTable
+        """
+        if Ti_min <= 0.0:
+            raise ValueError('Ti_min must be positive')
+        Ti_lo = max(Ti_lim[0], Ti_min)
+        if Ti_lo >= Ti_lim[1]:
+            raise ValueError('Ti_lim = {} must extend above Ti_min = {}'.format(Ti_lim, Ti_min))
+        sqrt_Ti = np.linspace(np.sqrt(Ti_lo), np.sqrt(Ti_lim[1]), nTi)
+        V = np.linspace(V_lim[0], V_lim[1], nV)
+        r = np.asarray(r, dtype=np.float64)
+
+        table = np.zeros((nTi, nV, len(r)))
+        for i, sTi in enumerate(sqrt_Ti):
+            for j, vel in enumerate(V):
+                table[i, j, :] = forward_model(r, L, d, F, w0, mu, 1.0, sTi ** 2, vel, nlambda=nlambda)
+
+        model_table = cls(r, L, d, F, w0, mu, sqrt_Ti, V, table)
+        if rtol is not None:
+            error = model_table.check_error(nlambda=nlambda)
+            if error > rtol:
+                raise ValueError('interpolation error {0:g} is larger than rtol={1:g}, '
+                                 'increase nTi and/or nV'.format(error, rtol))
+        return model_table
+
+    def __call__(self, Ti, V, amp=1.0):
+        """Interpolated forward model at the tabulated radii
+
+        Temperatures between 0 and the first grid point (see build's Ti_min) are evaluated at
+        the first grid point, the Doppler width there is far below the instrument width.
+
+        Args:
+            Ti (float): ion temperature in eV
+            V (float): velocity in m/s
+            amp (float): line amplitude, default=1.0
+
+        Returns:
+            np.ndarray: model evaluated at self.r
+        """
+        sTi = np.sqrt(Ti) if Ti >= 0.0 else np.nan
+        if 0.0 <= sTi < self.sqrt_Ti[0]:
+            sTi = self.sqrt_Ti[0]
+        if not (self.sqrt_Ti[0] <= sTi <= self.sqrt_Ti[-1] and self.V[0] <= V <= self.V[-1]):
+            raise ValueError('(Ti, V) = ({0}, {1}) is outside of the table'.format(Ti, V))
+
+        i, wi = _cubic_weights(sTi, self.sqrt_Ti[0], self._dsqrt_Ti, len(self.sqrt_Ti))
+        j, wj = _cubic_weights(V, self.V[0], self._dV, len(self.V))
+
+        block = self.table[i:i + 4, j:j + 4, :]
+        return amp * np.tensordot(np.outer(wi, wj), block, axes=([0, 1], [0, 1]))
+
+    def check_error(self, npts=None, nlambda=1024):
+        """Compares the interpolation against forward_model at the worst case cell centers
+
+        Sets and returns max_error, the largest absolute difference relative to the model peak.
+
+        Args:
+            npts (int, optional): number of cell centers to check (spread evenly), default checks all
+            nlambda (int): number of points in the wavelength array for forward_model, default=1024
+
+        Returns:
+            float: largest error relative to the model peak
+        """
+        sTi_mid = 0.5 * (self.sqrt_Ti[1:] + self.sqrt_Ti[:-1])
+        V_mid = 0.5 * (self.V[1:] + self.V[:-1])
+        centers = [(s, v) for s in sTi_mid for v in V_mid]
+        if npts is not None and npts < len(centers):
+            idx = np.linspace(0, len(centers) - 1, npts).astype(int)
+            centers = [centers[k] for k in idx]
+
+        max_error = 0.0
+        for sTi, vel in centers:
+            exact = forward_model(self.r, self.L, self.d, self.F, self.w0, self.mu, 1.0, sTi ** 2, vel,
+                                  nlambda=nlambda)
+            approx = self(sTi ** 2, vel)
+            max_error = max(max_error, np.max(np.abs(approx - exact)) / np.max(np.abs(exact)))
+
+        self.max_error = max_error
+        return max_error
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(nr={}, L={!r}, d={!r}, F={!r}, w0={!r}, mu={!r}, Ti=[{}, {}], V=[{}, {}], max_error={!r})".format(
+            class_name, len(self.r), self.L, self.d, self.F, self.w0, self.mu, self.sqrt_Ti[0] ** 2,
+            self.sqrt_Ti[-1] ** 2, self.V[0], self.V[-1], self.max_error)
+
+    def to_dict(self, compact=True):
+        """Returns a dict representation of the ModelTable
+
+        Args:
+            compact (bool): store the table in single precision, default=True
+        """
+        return {'r': self.r,
+                'L': self.L,
+                'd': self.d,
+                'F': self.F,
+                'w0': self.w0,
+                'mu': self.mu,
+                'sqrt_Ti': self.sqrt_Ti,
+                'V': self.V,
+                'table': self.table.astype(np.float32) if compact else self.table,
+                'max_error': self.max_error,
+                }
+
+    @classmethod
+    def from_dict(cls, table):
+        """Creates a new ModelTable from a dict
+
+        Args:
+            table (dict): dictionary representation of a ModelTable
+
+        Returns:
+            ModelTable
+        """
+        return cls(table['r'], table['L'], table['d'], table['F'], table['w0'], table['mu'],
+                   table['sqrt_Ti'], table['V'], table['table'], max_error=table.get('max_error', np.nan))
+
+    def save(self, fname, compact=True):
+        """Writes the table to an hdf5 file (lzf compressed)
+
+        Args:
+            fname (str): hdf5 filename
+            compact (bool): store the table in single precision, default=True
+        """
+        io.dict_2_h5(fname, self.to_dict(compact=compact))
+
+    @classmethod
+    def load(cls, fname):
+        """Reads a ModelTable from an hdf5 file written by save
+
+        Args:
+            fname (str): hdf5 filename
+
+        Returns:
+            ModelTable
+        """
+        return cls.from_dict(io.h5_2_dict(fname))
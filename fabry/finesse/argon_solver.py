@@ -1,70 +1,69 @@
-"""This module contains a few different MultiNest calibration solvers for the Th lamp with the 488
-    nm central wavelength 1 nm fwhm filter. 
+"""This module contains a few different calibration solvers for the Th lamp with the 488
+    nm central wavelength 1 nm fwhm filter. The sampler backend is picked at run time (see
+    fabry.solvers.samplers), MultiNest by default.
 
     Attributes:
         mu (tuple): relative mass for Th and then Ar
         w0 (tuple): Th I and Ar II wavelengths used for calibration
 """
 from __future__ import print_function, division, absolute_import
-import pymultinest
 import numpy as np
-from ..core.models import forward_model, offset_forward_model
+from ..core.models import forward_model, offset_forward_model, annulus_nodes, annulus_average
+from ..core.likelihood import CalibrationMarginalizer
+from ..core.linelist import LineList, linelist_forward_model
 import json
 from ..tools import file_io as io
+from ..core.ringsum import bin_edges_from_centers, coarsen_ringsum
 import random
 from os.path import abspath, join
+from ..solvers import samplers
+from ..solvers.priors import PriorSpec, UniformPrior
+from ..tools.helpers import lazy_import
 
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    pass
+plt = lazy_import('matplotlib.pyplot')
 
 
 w0 = (487.873302, 487.98634, 487.800942)
 mu = (232.03806, 39.948, 232.03806)
 
 
-def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=True, test_plot=False):
+def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=True, test_plot=False,
+           calibration=None, ncalibration=32, bin_average=None, nnodes=3, sampler='multinest', **sampler_kwargs):
     """
-    MultiNest solver for point spread function calibration with the Argon filter
+    Solver for point spread function calibration with the Argon filter
 
     Arguments:
         output_folder (str): path to folder containing input and output files for finesse solver
-        prior_filename (str): path to file for the MultiNest prior (json format)
+        prior_filename (str): path to file for the prior limits (json format)
         data_filename (str): path to file for the input data 
         Lpost (np.ndarray): array of equally weighted marginal posterior L values
         dpost(np.ndarray): array of equally weighted marginal posterior d values
-        resume (bool, optional): MultiNest will resume the calculation if True
+        resume (bool, optional): the sampler will resume the calculation if True
         test_plot (bool, optional): for debugging purposes, allows the user to sample the prior and compare to input data
+        calibration (str, optional): 'samples' or 'moment' for a deterministic marginalization over the L and d
+            posterior (see fabry.core.likelihood.CalibrationMarginalizer). If None, a random sample is drawn for
+            each likelihood call
+        ncalibration (int, optional): number of calibration samples for calibration='samples'
+        bin_average (int, optional): if given, merge this many ringsum annuli over the whole fit region and
+            compare against the annulus averaged model instead of the model at every third bin center
+        nnodes (int, optional): number of Gauss-Legendre nodes per annulus for bin_average
+        sampler (str, optional): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        **sampler_kwargs: passed on to the sampler backend
     """
 
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0]*(F_lim[1] - F_lim[0]) + F_lim[0]
-        cube[1] = cube[1]*(A_lim[1] - A_lim[0]) + A_lim[0]
-        cube[2] = cube[2]*(Arel_lim[1] - Arel_lim[0]) + Arel_lim[0]
-        cube[3] = cube[3]*(Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
+    def log_likelihood(cube):
+        amps, Ti = build_function_parameters(cube)
 
-        for idx, (w, amp_lim) in enumerate(zip(w_extra, Arel_extra), 4):
-            cube[idx] = cube[idx]*(amp_lim[1] - amp_lim[0]) + amp_lim[0]
+        if calibration is not None:
+            return calibration.log_likelihood(lambda L, d, F: model(L, d, cube[0], amps, Ti), sig, error)
 
-    def log_likelihood(cube, ndim, nparams):
-        # I want to fix this at some point
-        # i = random.randint(0, nL-1)
         i = np.random.choice(nL)
         L = Lpost[i]
         d = dpost[i]
         # L = 0.380173301412519577E+05
         # d = 0.883628502371783142E+00
-        # amps, w, mass, V, Ti = build_function_parameters(cube, nparams)
 
-        amps = [cube[1]*cube[2], cube[1]]
-        w = list(w0)
-        mass = list(mu)
-        Ti = [0.025, cube[3]]
-        V = [0.0, 0.0]
-
-        vals = forward_model(r, L, d, cube[0], w, mass, amps, Ti,
-                V, nlambda=2000)
+        vals = model(L, d, cube[0], amps, Ti)
         #vals = offset_forward_model(r, L, d, cube[0], w, mass, amps, Ti,
         #        V, sm_ang=False, nlambda=2000, coeff=0.4)
         # trying to q offset here
@@ -73,38 +72,25 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
         chisq = np.sum((vals - sig)**2 / error**2)
         return -chisq / 2.0
 
-    def build_function_parameters(cube, nparams):
-        """
-        Helper function for building some intermediate lists of parameters
-        needed for the forward q.
+    def model(L, d, F, amps, Ti):
+        vals = linelist_forward_model(r_model, L, d, F, lines, Ti, 0.0, amplitude=amps, nlambda=2000)
+        if bin_average is None:
+            return vals
+        return annulus_average(vals, node_weights)
 
-        Note that you need to be careful with the cube parameter. It is not a
-        python list! I believe it is some kind of fortran array. For example,
-        you cannot call len() on it.
+    def build_function_parameters(cube):
         """
-        amps = [0.0 for _ in range(nparams-4+2)]
-        amps[0] = cube[2]
-        amps[1] = 1.0
-        for idx, x in enumerate(amps[2:], 2):
-            amps[idx] = cube[idx+2]
-        #amps.extend([x for x in list(cube[4:])])
-        amps = [x * cube[1] for x in amps]
-
-        w = [x for x in w0]
-        w += w_extra
-
-        mass = [x for x in mu]
-        mass += [mu[0] for _ in w_extra]
-
-        V = [0.0 for _ in mass]
+        Helper function for building the line amplitudes and group temperatures
+        needed for the forward q. The line order is Th, Ar, then the w_extra Th lines.
+        """
+        amps = [cube[2], 1.0]
+        amps += [cube[idx] for idx in range(4, 4 + len(w_extra))]
+        amps = cube[1] * np.array(amps)
 
         #Ti = [0.025*1000.0/300.0, cube[3]]
-        #Ti += [0.025*1000.0/300.0 for _ in w_extra]
-
-        Ti = [0.025 for _ in w]
-        Ti[1] = cube[3]
+        Ti = [0.025, cube[3]]
 
-        return amps, w, mass, V, Ti
+        return amps, Ti
 
     with open(prior_filename, 'r') as infile:
         prior = json.load(infile, parse_float=np.float64)
@@ -112,10 +98,19 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
     data = io.h5_2_dict(data_filename)
 
     nL = len(Lpost)
-    ix = data['fit_ix']['0'][0:-1:3]
-    r = data['r'][ix]
-    sig = data['sig'][ix]
-    error = data['sig_sd'][ix]
+    if bin_average is None:
+        ix = data['fit_ix']['0'][0:-1:3]
+        r = data['r'][ix]
+        sig = data['sig'][ix]
+        error = data['sig_sd'][ix]
+        r_model = r
+    else:
+        ix = data['fit_ix']['0']
+        # older ringsum files do not store the bin edges
+        redges = data['redges'] if 'redges' in data else bin_edges_from_centers(data['r'])
+        redges, r, sig, error = coarsen_ringsum(redges[ix[0]:ix[-1] + 2], data['sig'][ix], data['sig_sd'][ix],
+                                                bin_average)
+        r_model, node_weights = annulus_nodes(redges, nnodes=nnodes)
 
     F_lim = prior['F_lim']
     A_lim = (0.6*np.max(sig), 1.4*np.max(sig))
@@ -126,10 +121,21 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
 
     assert len(w_extra) == len(Arel_extra)
 
-    n_params = 4 + len(w_extra)
+    # Th and Ar lines followed by any extra Th lines from the prior file, Th lines share
+    # temperature group 0 and Ar has its own temperature
+    lines = LineList([w0[0], w0[1]] + list(w_extra), [mu[0], mu[1]] + [mu[0] for _ in w_extra],
+                     temperature_group=[0, 1] + [0 for _ in w_extra])
+
+    names = ['F', 'A', 'Arel', 'Ti'] + ['Arel_{0:d}'.format(idx) for idx in range(len(w_extra))]
+    priors = PriorSpec(names, [UniformPrior(*F_lim), UniformPrior(*A_lim), UniformPrior(*Arel_lim),
+                               UniformPrior(*Ti_lim)] + [UniformPrior(*amp_lim) for amp_lim in Arel_extra])
+    n_params = priors.ndim
     folder = abspath(output_folder)
 
-    print('There are {0:d} paremeters for MultiNest'.format(n_params))
+    if calibration is not None:
+        calibration = CalibrationMarginalizer(Lpost, dpost, method=calibration, nsamples=ncalibration)
+
+    print('There are {0:d} paremeters for the sampler'.format(n_params))
 
     if test_plot:
         npts = 30
@@ -138,11 +144,9 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
             j = random.randint(0, nL-1)
             L = Lpost[j]
             d = dpost[j]
-            cube = [random.random() for _ in range(n_params)]
-            log_prior(cube, None, None)
-            amps, w, mass, V, Ti = build_function_parameters(cube, n_params)
-            test_sig[i, :] = forward_model(r, L, d, cube[0], w, mass, amps, Ti,
-                                           V, sm_ang=False, nlambda=2000)
+            cube = priors.transform([random.random() for _ in range(n_params)])
+            amps, Ti = build_function_parameters(cube)
+            test_sig[i, :] = model(L, d, cube[0], amps, Ti)
 
         # fig, ax = plt.subplots()
         # for i in xrange(npts):
@@ -150,39 +154,28 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
         # ax.errorbar(r, sig, yerr=error, fmt='', ecolor='C2', color='C1')
         # plt.show()
     else:
-        pymultinest.run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-                resume=resume, verbose=True, sampling_efficiency='model', n_live_points=100,
-                outputfiles_basename=join(folder, 'finesse_'))
+        samplers.run_likelihood(log_likelihood, priors, join(folder, 'finesse_'), sampler=sampler, resume=resume,
+                                nlive=100, **sampler_kwargs)
 
 
-def full_solver(output_folder, prior_filename, data_filename, resume=True, test_plot=False):
-    """MultiNest solver for point spread function calibration with the Argon filter. This is a 
+def full_solver(output_folder, prior_filename, data_filename, resume=True, test_plot=False, sampler='multinest',
+                **sampler_kwargs):
+    """Solver for point spread function calibration with the Argon filter. This is a
         full solver. L and d will be solved as well!
 
     Args:
         output_folder (str): path to folder containing input and output files for finesse solver
-        prior_filename (str): path to file for the MultiNest prior (json format)
+        prior_filename (str): path to file for the prior limits (json format)
         data_filename (str): path to file for the input data 
 
     Kwargs:
-        resume (bool, optional): MultiNest will resume the calculation if True
+        resume (bool, optional): the sampler will resume the calculation if True
         test_plot (bool, optional): for debugging purposes, allows the user to sample the prior and compare to input data
+        sampler (str, optional): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        **sampler_kwargs: passed on to the sampler backend
     """
 
-
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0]*(L_lim[1] - L_lim[0]) + L_lim[0]
-        cube[1] = cube[1]*(d_lim[1] - d_lim[0]) + d_lim[0]
-        cube[2] = cube[2]*(F_lim[1] - F_lim[0]) + F_lim[0]
-        cube[3] = cube[3]*(A_lim[1] - A_lim[0]) + A_lim[0]
-        cube[4] = cube[4]*(Arel_lim[1] - Arel_lim[0]) + Arel_lim[0]
-        cube[5] = cube[5]*(Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
-        #cube[6] = cube[6]*(off_lim[1] - off_lim[0]) + off_lim[0]
-        cube[6] = cube[6]*(Brel_lim[1] - Brel_lim[0]) + Brel_lim[0]
-        #cube[7] = cube[7]*(Brel_lim[1] - Brel_lim[0]) + Brel_lim[0]
-
-
-    def log_likelihood(cube, ndim, nparams):
+    def log_likelihood(cube):
         #vals = forward_model(r, cube[0], cube[1], cube[2], w0, mu, [cube[3]*cube[4], cube[3]], [Ti_Th, cube[5]], [0.0, 0.0], nlambda=2000)
         #vals = forward_model(r, cube[0], cube[1], cube[2], w0, mu, [cube[3]*cube[4], cube[3], cube[3]*cube[7]], [Ti_Th, cube[5], Ti_Th],
         #        [0.0, 0.0, 0.0], nlambda=2000)
@@ -221,9 +214,9 @@ def full_solver(output_folder, prior_filename, data_filename, resume=True, test_
     #min_val = np.abs(np.min(data['sig'][ix]))
     min_val = 50.0
     off_lim = [0.0, min_val]
-    #n_params = 6
-    n_params = 7
-    #n_params = 8
+    priors = PriorSpec(['L', 'd', 'F', 'A', 'Arel', 'Ti', 'Brel'],
+                       [UniformPrior(*L_lim), UniformPrior(*d_lim), UniformPrior(*F_lim), UniformPrior(*A_lim),
+                        UniformPrior(*Arel_lim), UniformPrior(*Ti_lim), UniformPrior(*Brel_lim)])
     folder = abspath(output_folder)
 
     if test_plot:
@@ -243,9 +236,8 @@ def full_solver(output_folder, prior_filename, data_filename, resume=True, test_
         # plt.show()
 
     else:
-        pymultinest.run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-                resume=resume, verbose=True, sampling_efficiency='model', n_live_points=1000,
-                outputfiles_basename=join(folder, 'full_'))
+        samplers.run_likelihood(log_likelihood, priors, join(folder, 'full_'), sampler=sampler, resume=resume,
+                                nlive=1000, **sampler_kwargs)
 
 
 
@@ -3,27 +3,29 @@ import os.path as path
 from ..tools import file_io as io
 import numpy as np
 from ..core import models
-from pymultinest import run
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    pass
+from ..solvers import samplers
+from ..solvers.priors import PriorSpec, UniformPrior
+from ..tools.helpers import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
 
 w0 = 468.619458
 mu = 232.03806
 w1 = 468.335172
 
-def full_solver(output_folder, data_filename, resume=True, test_plot=False):
+def full_solver(output_folder, data_filename, resume=True, test_plot=False, sampler='multinest', **sampler_kwargs):
+    """Solver for L, d, F and the amplitude with the He II filter
 
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0]*(L_lim[1] - L_lim[0]) + L_lim[0]
-        cube[1] = cube[1]*(d_lim[1] - d_lim[0]) + d_lim[0]
-        cube[2] = cube[2]*(F_lim[1] - F_lim[0]) + F_lim[0]
-        cube[3] = cube[3]*(A_lim[1] - A_lim[0]) + A_lim[0]
-        #cube[4] = cube[4]*(B_lim[1] - B_lim[0]) + B_lim[0]
-        #cube[5] = cube[5]*(Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
+    Args:
+        output_folder (str): path to folder for the output files
+        data_filename (str): path to file for the input data
+        resume (bool): resume calculation if True, default=True
+        test_plot (bool): plot prior samples against the data instead of solving, default=False
+        sampler (str): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        **sampler_kwargs: passed on to the sampler backend
+    """
 
-    def log_likelihood(cube, ndim, nparams):
+    def log_likelihood(cube):
         #vals0, vals1 = forward_model(cube)
         vals0 = forward_model(cube)
         chisq = np.sum((vals0 - sig0)**2 / sig0_sd**2)
@@ -73,7 +75,9 @@ def full_solver(output_folder, data_filename, resume=True, test_plot=False):
     Ti = 0.025 * 1000.0 / 300.0
     #Ti_lim = [0.025, 1.0]
 
-    n_params = 4
+    priors = PriorSpec(['L', 'd', 'F', 'A'], [UniformPrior(*L_lim), UniformPrior(*d_lim), UniformPrior(*F_lim),
+                                             UniformPrior(*A_lim)])
+    n_params = priors.ndim
     folder = path.abspath(output_folder)
 
     if test_plot:
@@ -84,8 +88,7 @@ def full_solver(output_folder, data_filename, resume=True, test_plot=False):
         test0 = np.zeros((npts, len(r0)))
         test1 = np.zeros((npts, len(r1)))
         for i in range(npts):
-            cube = [np.random.random() for _ in range(n_params)]
-            log_prior(cube, None, None)
+            cube = priors.transform(np.random.random(size=n_params))
             test0[i, :], test1[i, :] = forward_model(cube)
 
         fig, ax = plt.subplots()
@@ -97,21 +100,28 @@ def full_solver(output_folder, data_filename, resume=True, test_plot=False):
         plt.show()
 
     else:
-        run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-            resume=resume, verbose=True, sampling_efficiency='model', n_live_points=600,
-            outputfiles_basename=path.join(folder, 'full_'))
+        samplers.run_likelihood(log_likelihood, priors, path.join(folder, 'full_'), sampler=sampler, resume=resume,
+                                nlive=600, **sampler_kwargs)
 
 
-def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=True, test_plot=True):
+def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=True, test_plot=True,
+           sampler='multinest', **sampler_kwargs):
+    """Solver for F, amplitude, Ti and offset with the He II filter for a given L and d posterior
 
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0]*(F_lim[1] - F_lim[0]) + F_lim[0]
-        cube[1] = cube[1]*(A_lim[1] - A_lim[0]) + A_lim[0]
-        cube[2] = cube[2]*(Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
-        cube[3] = cube[3]*(offset_lim[1] - offset_lim[0]) + offset_lim[0]
+    Args:
+        output_folder (str): path to folder for the output files
+        prior_filename (str): unused
+        data_filename (str): path to file for the input data
+        Lpost (np.ndarray): posterior results for the camera focal length
+        dpost (np.ndarray): posterior results for the etalon spacing
+        resume (bool): resume calculation if True, default=True
+        test_plot (bool): plot prior samples against the data instead of solving, default=True
+        sampler (str): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        **sampler_kwargs: passed on to the sampler backend
+    """
 
-    def log_likelihood(cube, ndim, nparams):
-        L, d = np.random.choice(Ld_post, size=1)
+    def log_likelihood(cube):
+        L, d = Ld_post[np.random.choice(len(Ld_post))]
 
         vals = models.offset_forward_model(r0, L, d, cube[0], w0, mu, cube[1], cube[2], coeff=cube[3])
 
@@ -138,7 +148,9 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
     Ti_lim = [0.025, 1.0]
 
     offset_lim = [0.0, 0.3]
-    n_params = 4
+    priors = PriorSpec(['F', 'A', 'Ti', 'offset'], [UniformPrior(*F_lim), UniformPrior(*A_lim),
+                                                    UniformPrior(*Ti_lim), UniformPrior(*offset_lim)])
+    n_params = priors.ndim
 
     folder = path.abspath(output_folder)
 
@@ -149,10 +161,9 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
         vals = np.zeros((npts, nr))
 
         for i in range(npts):
-            L, d = np.random.choice(Ld_post)
+            L, d = Ld_post[np.random.choice(len(Ld_post))]
 
-            cube = np.random.random(size=6)
-            log_prior(cube, None, None)
+            cube = priors.transform(np.random.random(size=n_params))
             vals[i, :] = models.offset_forward_model(r0, L, d, cube[0], w0, mu, cube[1], cube[2], coeff=cube[3])
 
         fig, ax = plt.subplots()
@@ -162,6 +173,5 @@ def solver(output_folder, prior_filename, data_filename, Lpost, dpost, resume=Tr
         plt.show()
 
     else:
-        run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-            resume=resume, verbose=True, sampling_efficiency='model', n_live_points=600,
-            outputfiles_basename=path.join(folder, 'full_'))
+        samplers.run_likelihood(log_likelihood, priors, path.join(folder, 'full_'), sampler=sampler, resume=resume,
+                                nlive=600, **sampler_kwargs)
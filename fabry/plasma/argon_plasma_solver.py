@@ -1,22 +1,35 @@
 from __future__ import division, print_function
 from ..core import models
+from ..core.likelihood import linear_log_likelihood, CalibrationMarginalizer
+from ..core.tabulated import ModelTable
 from ..tools import file_io
-import plasma
+from ..solvers import samplers
+from ..solvers.priors import PriorSpec, UniformPrior, LogUniformPrior
+from . import plasma
 import os.path as path
 import numpy as np
-import pymultinest
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    pass
+from ..tools.helpers import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
 
 
 w0 = 487.98634
 mu = 39.948
 
 
-def no_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=False):
-    """PyMultinest Solver for Ar II with no velocity
+def _solver_priors(default, prior_spec=None):
+    """Returns the PriorSpec from the prior_spec file if given, otherwise default"""
+    if prior_spec is None:
+        return default
+    priors = PriorSpec.load(prior_spec)
+    if priors.names != default.names:
+        raise ValueError('{} must define the parameters {}'.format(prior_spec, default.names))
+    return priors
+
+
+def no_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=False, calibration=None,
+                  ncalibration=32, sampler='multinest', prior_spec=None, **sampler_kwargs):
+    """Solver for Ar II with no velocity
 
     Args:
         output_folder (str): path to folder for input and output folders
@@ -25,12 +38,19 @@ def no_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=Fal
         dpost (np.ndarray): posterior results for the etalon spacing
         resume (bool): resume calculation if True, default=True
         test_plot (bool): make a test plot of prior intstead of solving, default=False
+        calibration (str, optional): 'samples' or 'moment' for a deterministic marginalization over
+            the calibration posterior (see CalibrationMarginalizer). If None, a random calibration sample
+            is drawn for each likelihood call, default=None
+        ncalibration (int): number of calibration samples for calibration='samples', default=32
+        sampler (str): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        prior_spec (str, optional): JSON/YAML prior spec for (Ti, A) replacing the default limits
+        **sampler_kwargs: passed on to the sampler backend
     """
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0] * (Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
-        cube[1] = cube[1] * (A_lim[1] - A_lim[0]) + A_lim[0]
+    def log_likelihood(cube):
+        if calibration is not None:
+            return calibration.log_likelihood(lambda L, d, F: models.forward_model(r, L, d, F, w0, mu, cube[1], cube[0],
+                                                                                 0.0, nlambda=2000), sig, error)
 
-    def log_likelihood(cube, ndim, nparams):
         iL = np.random.choice(nL)
         # jF = np.random.choice(nF)
         L = Lpost[iL]
@@ -55,18 +75,21 @@ def no_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=Fal
     A_lim = [0.5 * A_max, 2.0 * A_max]
 
     Ti_lim = [0.025, 3.0]
+    priors = _solver_priors(PriorSpec(['Ti', 'A'], [UniformPrior(*Ti_lim), UniformPrior(*A_lim)]), prior_spec)
 
     nL = len(Lpost)
     nF = len(Fpost)
     n_params = 2
 
+    if calibration is not None:
+        calibration = CalibrationMarginalizer(Lpost, dpost, Fpost, method=calibration, nsamples=ncalibration)
+
     if test_plot:
         # do a test plot
         npts = 100
         test_sig = np.zeros((npts, len(r)))
         for idx in range(npts):
-            cub = np.random.random(size=n_params)
-            log_prior(cub, None, None)
+            cub = priors.transform(np.random.random(size=n_params))
             i = np.random.choice(nL)
             j = np.random.choice(nF)
             LL = Lpost[i]
@@ -82,14 +105,13 @@ def no_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=Fal
         plt.show()
 
     else:
-        # run multinest
-        pymultinest.run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-                        resume=resume, verbose=True, sampling_efficiency='model', n_live_points=400,
-                        outputfiles_basename=path.join(output_folder, 'Ti_noV_'))
+        samplers.run_likelihood(log_likelihood, priors, path.join(output_folder, 'Ti_noV_'), sampler=sampler,
+                                resume=resume, nlive=400, **sampler_kwargs)
 
 
-def const_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=False):
-    """PyMultinest Solver for Ar II with constant velocity
+def const_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=False, calibration=None,
+                     ncalibration=32, sampler='multinest', prior_spec=None, table=False, **sampler_kwargs):
+    """Solver for Ar II with constant velocity
 
     Args:
         output_folder (str): path to folder for input and output folders
@@ -98,16 +120,26 @@ def const_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=
         dpost (np.ndarray): posterior results for the etalon spacing
         resume (bool): resume calculation if True, default=True
         test_plot (bool): make a test plot of prior intstead of solving, default=False
+        calibration (str, optional): 'samples' or 'moment' for a deterministic marginalization over
+            the calibration posterior (see CalibrationMarginalizer). If None, a random calibration sample
+            is drawn for each likelihood call, default=None
+        ncalibration (int): number of calibration samples for calibration='samples', default=32
+        sampler (str): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        prior_spec (str, optional): JSON/YAML prior spec for (Ti, A, V) replacing the default limits
+        table (bool): fix the calibration at the posterior means of L, d and F and interpolate the
+            model from a ModelTable over the prior range instead of calling forward_model. Can not
+            be combined with calibration, default=False
+        **sampler_kwargs: passed on to the sampler backend
     """
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0] * (Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
-        cube[1] = cube[1] * (A_lim[1] - A_lim[0]) + A_lim[0]
-        cube[2] = cube[2] * (v_lim[1] - v_lim[0]) + v_lim[0]
-        #cube[3] = cube[3] * (F_lim[1] - F_lim[0]) + F_lim[0]
-        #cube[3] = cube[3] * (off_lim[1] - off_lim[0]) + off_lim[0]
-        #cube[4] = cube[4] * (F_lim[1] - F_lim[0]) + F_lim[0]
-
-    def log_likelihood(cube, ndim, nparams):
+    def log_likelihood(cube):
+        if model_table is not None:
+            vals = model_table(cube[0], cube[2], amp=cube[1])
+            return -np.sum((vals - sig) ** 2 / error ** 2) / 2
+
+        if calibration is not None:
+            return calibration.log_likelihood(lambda L, d, F: models.forward_model(r, L, d, F, w0, mu, cube[1], cube[0],
+                                                                                 cube[2], nlambda=2000), sig, error)
+
         iL = np.random.choice(nL)
         LL = Lpost[iL]
         dd = dpost[iL]
@@ -150,10 +182,24 @@ def const_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=
     #F_folder = "/home/milhone/Research/python_FabryPerot/Data/2018_10_28/"
     #Fpost = np.loadtxt(path.join(F_folder, 'full_post_equal_weights.dat'), ndmin=2)[:,2]
     off_lim = [-20.0, 20.0]
+    priors = _solver_priors(PriorSpec(['Ti', 'A', 'V'], [UniformPrior(*Ti_lim), UniformPrior(*A_lim),
+                                                         UniformPrior(*v_lim)]), prior_spec)
     nL = len(Lpost)
     nF = len(Fpost)
     n_params = 3
 
+    if calibration is not None:
+        calibration = CalibrationMarginalizer(Lpost, dpost, Fpost, method=calibration, nsamples=ncalibration)
+
+    model_table = None
+    if table:
+        if calibration is not None:
+            raise ValueError('table=True fixes the calibration, it can not be combined with calibration')
+        # the table covers the prior range of Ti and V, Ti = 0 maps to the first grid point
+        lower, upper = priors.transform(np.array([np.zeros(n_params), np.ones(n_params)]))
+        model_table = ModelTable.build(r, np.mean(Lpost), np.mean(dpost), np.mean(Fpost), (lower[0], upper[0]),
+                                       (lower[2], upper[2]), w0=w0, mu=mu, nlambda=2000)
+
     if False:#test_plot:
         # do a test plot
         npts = 100
@@ -182,14 +228,12 @@ def const_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=
         plt.show()
 
     else:
-        # run multinest
-        pymultinest.run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-                        resume=resume, verbose=True, sampling_efficiency='model', n_live_points=400,
-                        outputfiles_basename=path.join(output_folder, 'Ti_constV_'))
+        samplers.run_likelihood(log_likelihood, priors, path.join(output_folder, 'Ti_constV_'), sampler=sampler,
+                                resume=resume, nlive=400, **sampler_kwargs)
 
-def profile_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=False):
-    """PyMultinest Solver for Ar II with velocity profile for PCX-U with outer boundary
-    spinning
+def profile_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plot=False, calibration=None,
+                       ncalibration=32, sampler='multinest', prior_spec=None, **sampler_kwargs):
+    """Solver for Ar II with velocity profile for PCX-U with outer boundary spinning
 
     Args:
         output_folder (str): path to folder for input and output folders
@@ -198,24 +242,28 @@ def profile_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plo
         dpost (np.ndarray): posterior results for the etalon spacing
         resume (bool): resume calculation if True, default=True
         test_plot (bool): make a test plot of prior intstead of solving, default=False
+        calibration (str, optional): 'samples' or 'moment' for a deterministic marginalization over
+            the calibration posterior (see CalibrationMarginalizer). If None, a random calibration sample
+            is drawn for each likelihood call, default=None
+        ncalibration (int): number of calibration samples for calibration='samples', default=32
+        sampler (str): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        prior_spec (str, optional): JSON/YAML prior spec for (Ti, A, V, nen0) replacing the default limits
+        **sampler_kwargs: passed on to the sampler backend
     """
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0] * (Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
-        cube[1] = 10 ** (cube[1] * (A_lim[1] - A_lim[0]) + A_lim[0])
-        cube[2] = cube[2] * (v_lim[1] - v_lim[0]) + v_lim[0]
-        #cube[3] = 10 ** (cube[3] * (Lnu_lim[1] - Lnu_lim[0]) + Lnu_lim[0])
-        cube[3] = 10 ** (cube[3] * (nen0_loglim[1] - nen0_loglim[0]) + nen0_loglim[0])
-
-    def log_likelihood(cube, ndim, nparams):
+    def log_likelihood(cube):
+        Lnu = 100.0 * plasma.Lnu(cube[3], cube[0], mu=40, noise=False)
+        # print(Lnu)
+        w, spec = chord(cube[0], Lnu, cube[2])
+
+        if calibration is not None:
+            return calibration.log_likelihood(lambda L, d, F: cube[1] * models.general_model(r, L, d, F, w, spec),
+                                              sig, error)
+
         iL = np.random.choice(nL)
         jF = np.random.choice(nF)
         LL = Lpost[iL]
         dd = dpost[iL]
         FF = Fpost[jF]
-        Lnu = 100.0 * plasma.Lnu(cube[3], cube[0], mu=40, noise=False)
-        # print(Lnu)
-        w, spec = plasma.calculate_pcx_chord_emission(impact_factor,
-                                                      cube[0], w0, mu, Lnu, cube[2], nr=nr, nlambda=nlambda, Lne=4.0, R_outer=35.0, rmax=42.0)
 
         vals = cube[1] * models.general_model(r, LL, dd, FF, w, spec)
 
@@ -234,28 +282,33 @@ def profile_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plo
     # so I'm going to a huge prior in log space
     A_max = np.max(sig)
     A_lim = [0.1 * A_max, 10.0 * A_max]
-    A_lim = [np.log10(AA) for AA in A_lim]
 
     Ti_lim = [0.025, 3.0]
 
     v_lim = [-10000, 10000]
 
     # Lnu_lim = [0.1, 100]
-    # Lnu_lim = [np.log10(lim) for lim in Lnu_lim]
 
     # ne = [1e16, 1e19], n0 = [1e16, 1e19]
-    # nen0_loglim = [16+16, 19+19]
-    nen0_loglim = [np.log10(1e17*1e17), np.log10(2e18*2e18)]
+    nen0_lim = [1e17 * 1e17, 2e18 * 2e18]
+    priors = _solver_priors(PriorSpec(['Ti', 'A', 'V', 'nen0'],
+                                      [UniformPrior(*Ti_lim), LogUniformPrior(*A_lim), UniformPrior(*v_lim),
+                                       LogUniformPrior(*nen0_lim)]), prior_spec)
 
     nL = len(Lpost)
     nF = len(Fpost)
 
     n_params = 4
 
+    if calibration is not None:
+        calibration = CalibrationMarginalizer(Lpost, dpost, Fpost, method=calibration, nsamples=ncalibration,
+                                              independent_F=True)
+
     # impact_factor = 33.0
     impact_factor = 25.0
     nr = 400
     nlambda = 2000
+    chord = plasma.ChordModel(impact_factor, w0, mu, nr=nr, nlambda=nlambda, Lne=4.0, R_outer=35.0, rmax=42.0)
 
     if test_plot:
         # do a test plot
@@ -265,8 +318,7 @@ def profile_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plo
         Lnu_vals = np.zeros(npts)
         # nout = output.shape[0]
         for idx in range(npts):
-            cub = np.random.random(size=n_params)
-            log_prior(cub, None, None)
+            cub = priors.transform(np.random.random(size=n_params))
             #k = np.random.choice(nout)
             #cub = output[k, :]
             i = np.random.choice(nL)
@@ -295,49 +347,102 @@ def profile_vel_solver(output_folder, Fpost, Lpost, dpost, resume=True, test_plo
         plt.show()
 
     else:
-        # run multinest
-        pymultinest.run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-                        resume=resume, verbose=True, sampling_efficiency='model', n_live_points=500,
-                        outputfiles_basename=path.join(output_folder, 'Ti_profileV_'))
-
-
-def multi_image_solver(output_folder, locs, folders, Lpost, dpost, Fpost, test_plot=False, resume=True):
-
-    def log_prior(cube, ndim, nparams):
-        cube[0] = cube[0] * (Ti_lim[1] - Ti_lim[0]) + Ti_lim[0]
-        cube[1] = cube[1] * (v_lim[1] - v_lim[0]) + v_lim[0]
-        #cube[2] = 10 ** (cube[2] * (nen0_loglim[1] - nen0_loglim[0]) + nen0_loglim[0])
-        cube[2] = cube[2] * (Lnu_lim[1] - Lnu_lim[0]) + Lnu_lim[0]
-        cube[3] = 10 ** (cube[3] * (A_lim[0][1] - A_lim[0][0]) + A_lim[0][0])
-        cube[4] = 10 ** (cube[4] * (A_lim[1][1] - A_lim[1][0]) + A_lim[1][0])
-        cube[5] = 10 ** (cube[5] * (A_lim[2][1] - A_lim[2][0]) + A_lim[2][0])
-        cube[6] = 10 ** (cube[6] * (A_lim[3][1] - A_lim[3][0]) + A_lim[3][0])
-
-    def log_likelihood(cube, ndim, nparams):
-        # pick L, d and F
-        iL = np.random.choice(nL)
-        jF = np.random.choice(nF)
-        LL = Lpost[iL]
-        dd = dpost[iL]
-        FF = Fpost[jF]
+        samplers.run_likelihood(log_likelihood, priors, path.join(output_folder, 'Ti_profileV_'), sampler=sampler,
+                                resume=resume, nlive=500, **sampler_kwargs)
 
-        # calculate Lnu from Ti and nen0
-        #Lnu = 100.0 * plasma.Lnu(cube[2], cube[0], mu=40, noise=False)
 
-        # print(Lnu)
+def multi_image_solver(output_folder, locs, folders, Lpost, dpost, Fpost, test_plot=False, resume=True,
+                       amplitudes='sample', fit_offset=False, calibration=None, ncalibration=32, sampler='multinest',
+                       prior_spec=None, **sampler_kwargs):
+    """Solver for Ar II with a PCX-U velocity profile using multiple chords
 
+    The chord amplitudes (and optional offsets) enter the model linearly. With amplitudes set
+    to 'profile' or 'marginalize' they are removed from the sampled dimensions and solved
+    in closed form for every likelihood call. Their best fit values are still written to the
+    output files as derived parameters in the same columns used by the 'sample' mode. The
+    derived values are averaged over fixed calibration samples (weighted by the likelihood of
+    each sample) so they are a deterministic function of the sampled parameters, also when the
+    likelihood draws a random calibration.
+
+    Args:
+        output_folder (str): path to folder for output files
+        locs (list): impact factors for each chord
+        folders (list): folders containing argon_input.h5 for each chord
+        Lpost (np.ndarray): posterior results for the camera focal length
+        dpost (np.ndarray): posterior results for the etalon spacing
+        Fpost (np.ndarray): posterior results for the finesse
+        test_plot (bool): unused, default=False
+        resume (bool): resume calculation if True, default=True
+        amplitudes (str): 'sample' (log uniform MultiNest parameters), 'profile' or 'marginalize',
+            default='sample'
+        fit_offset (bool): fit a constant offset for each chord analytically, only used when
+            amplitudes is not 'sample', default=False
+        calibration (str, optional): 'samples' ('moment' is allowed when amplitudes='sample') for a deterministic marginalization over
+            the calibration posterior (see CalibrationMarginalizer). If None, a random calibration sample
+            is drawn for each likelihood call, default=None
+        ncalibration (int): number of calibration samples for calibration='samples' and for the derived
+            linear parameters, default=32
+        sampler (str): registered sampler backend (see fabry.solvers.samplers), default='multinest'
+        prior_spec (str, optional): JSON/YAML prior spec for (Ti, V, Lnu) plus A_<i> per chord with
+            amplitudes='sample', replacing the default limits
+        **sampler_kwargs: passed on to the sampler backend
+    """
+    if amplitudes not in ('sample', 'profile', 'marginalize'):
+        raise ValueError("amplitudes must be 'sample', 'profile', or 'marginalize'")
+    if calibration == 'moment' and amplitudes != 'sample':
+        raise ValueError("calibration='moment' requires amplitudes='sample'")
+
+    def log_likelihood(cube):
+        # the chord spectra do not depend on the calibration
+        spectra = [chord(cube[0], cube[2], cube[1]) for chord in chords]
+
+        if calibration is None:
+            # pick L, d and F
+            iL = np.random.choice(nL)
+            jF = np.random.choice(nF)
+            return chord_log_likelihood(cube, spectra, Lpost[iL], dpost[iL], Fpost[jF])[0]
+
+        if calibration.method == 'moment':
+            model = lambda L, d, F: np.concatenate([cube[idx+3] * models.general_model(r, L, d, F, w, spec)
+                                                    for idx, (r, (w, spec)) in enumerate(zip(r_list, spectra))])
+            return calibration.log_likelihood(model, all_sig, all_error)
+
+        return calibration.marginal_log_likelihood(lambda LL, dd, FF: chord_log_likelihood(cube, spectra, LL, dd,
+                                                                                           FF)[0])
+
+    def derived(cube):
+        # likelihood weighted linear parameters over the fixed calibration samples
+        spectra = [chord(cube[0], cube[2], cube[1]) for chord in chords]
+        fits = [chord_log_likelihood(cube, spectra, LL, dd, FF) for (LL, dd, FF) in derived_calibration]
+        loglikes = np.array([loglike for loglike, _ in fits])
+        weights = np.exp(loglikes - np.max(loglikes))
+        return np.dot(weights, np.array([linear for _, linear in fits])) / np.sum(weights)
+
+    def chord_log_likelihood(cube, spectra, LL, dd, FF):
         # loop over the different chord locations and calculate chi squared
         chisq = 0.0
+        loglike = 0.0
+        amps = []
+        offsets = []
         for idx, (r, sig, error) in enumerate(zip(r_list, s_list, sd_list)):
-            w, spec = plasma.calculate_pcx_chord_emission(locs[idx],
-                               #cube[0], w0, mu, Lnu, cube[1], nr=nr, nlambda=nlambda, Lne=4.0, R_outer=35.0, rmax=42.0)
-                               cube[0], w0, mu, cube[2], cube[1], nr=nr, nlambda=nlambda, Lne=4.0, R_outer=35.0, rmax=42.0)
+            w, spec = spectra[idx]
 
-            vals = cube[idx+3] * models.general_model(r, LL, dd, FF, w, spec)
+            if amplitudes == 'sample':
+                vals = cube[idx+3] * models.general_model(r, LL, dd, FF, w, spec)
+                chisq += np.sum((vals - sig) ** 2 / error ** 2)
+            else:
+                basis = models.general_model(r, LL, dd, FF, w, spec)
+                chord_loglike, coeffs = linear_log_likelihood(basis, sig, error, offset=fit_offset,
+                                                              marginalize=amplitudes == 'marginalize',
+                                                              prior_lim=lin_lim[idx])
+                loglike += chord_loglike
 
-            chisq += np.sum((vals - sig) ** 2 / error ** 2)
+                # the linear parameters are written as derived parameters, amplitudes then offsets
+                amps.append(coeffs[0])
+                if fit_offset:
+                    offsets.append(coeffs[1])
 
-        return -chisq / 2.0
+        return loglike - chisq / 2.0, amps + offsets
 
 
     # locs = [5, 15, 25, 35]
@@ -364,10 +469,12 @@ def multi_image_solver(output_folder, locs, folders, Lpost, dpost, Fpost, test_p
 
     # make amplitude prior limits
     A_lim = []
+    lin_lim = []
     for sig in s_list:
         A_max = np.max(sig)
         temp = [0.1 * A_max, 10.0 * A_max]
-        A_lim.append([np.log10(AA) for AA in temp])
+        A_lim.append(temp)
+        lin_lim.append([temp, [-A_max, A_max]] if fit_offset else [temp])
 
     Ti_lim = [0.025, 3.0]
 
@@ -386,22 +493,38 @@ def multi_image_solver(output_folder, locs, folders, Lpost, dpost, Fpost, test_p
     nL = len(Lpost)
     nF = len(Fpost)
 
-    n_params = 7
+    if calibration is not None:
+        calibration = CalibrationMarginalizer(Lpost, dpost, Fpost, method=calibration, nsamples=ncalibration,
+                                              independent_F=True)
+    # the derived parameters need fixed calibration samples even if the likelihood draws them
+    derived_calibration = calibration
+    if calibration is None and amplitudes != 'sample':
+        derived_calibration = CalibrationMarginalizer(Lpost, dpost, Fpost, method='samples', nsamples=ncalibration,
+                                                      independent_F=True)
+    all_sig = np.concatenate(s_list)
+    all_error = np.concatenate(sd_list)
+
+    nchords = len(folders)
+    names = ['Ti', 'V', 'Lnu']
+    prior_list = [UniformPrior(*Ti_lim), UniformPrior(*v_lim), UniformPrior(*Lnu_lim)]
+    amp_names = ['A_{0:d}'.format(idx) for idx in range(nchords)]
+    if amplitudes == 'sample':
+        names += amp_names
+        prior_list += [LogUniformPrior(*lim) for lim in A_lim]
+        derived_names = None
+    else:
+        derived_names = amp_names + (['offset_{0:d}'.format(idx) for idx in range(nchords)] if fit_offset else [])
+    priors = _solver_priors(PriorSpec(names, prior_list), prior_spec)
 
     nr = 400
     nlambda = 2000
+    chords = [plasma.ChordModel(loc, w0, mu, nr=nr, nlambda=nlambda, Lne=4.0, R_outer=35.0, rmax=42.0) for loc in locs]
 
     if test_plot:
         pass
     else:
-        # run multinest
-        pymultinest.run(log_likelihood, log_prior, n_params, importance_nested_sampling=False,
-<<<<<<< Updated upstream
-                        resume=resume, verbose=True, sampling_efficiency='model', n_live_points=200,
-                        outputfiles_basename=path.join(output_folder, 'Ti_multi_Lnu_'))
-=======
-                        resume=resume, verbose=True, sampling_efficiency='model', n_live_points=600,
-                        outputfiles_basename=path.join(output_folder, 'Ti_multi_'))
->>>>>>> Stashed changes
+        samplers.run_likelihood(log_likelihood, priors, path.join(output_folder, 'Ti_multi_Lnu_'), sampler=sampler,
+                                resume=resume, nlive=200, derived=None if derived_names is None else derived,
+                                derived_names=derived_names, **sampler_kwargs)
 
 
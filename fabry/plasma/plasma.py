@@ -1,12 +1,12 @@
 from __future__ import division, print_function
 import numpy as np
-from scipy import special
+from numba import jit
 from ..core import models
 from functools import partial
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    pass
+from ..tools.helpers import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+special = lazy_import('scipy.special')
 
 cx_fits = {40: [0.39004112, -34.24186523],
            4: [0.40712338, -33.82360615],
@@ -128,10 +128,130 @@ def calculate_line_profile(wavelength, w0, Ti, vel, theta, mu):
     return models.gaussian(wavelength, w_shift, sigma, norm=False)
 
 
+@jit(nopython=True, cache=True)
+def _chord_spectrum(w_shifts, weights, wavelength, sigma, out):
+    """Sums Gaussians of width sigma centered on w_shifts with weights on a uniform wavelength grid
+
+    Contributions more than 12 sigma from a center are below 1e-31 of its peak and are skipped.
+    """
+    nlambda = len(wavelength)
+    dw = (wavelength[nlambda - 1] - wavelength[0]) / (nlambda - 1)
+    width = 12.0 * sigma
+    out[:] = 0.0
+    for i in range(len(w_shifts)):
+        if weights[i] == 0.0:
+            continue
+        lo = max(0.0, np.ceil((w_shifts[i] - width - wavelength[0]) / dw))
+        hi = min(nlambda - 1.0, np.floor((w_shifts[i] + width - wavelength[0]) / dw))
+        for j in range(int(lo), int(hi) + 1):
+            z = (wavelength[j] - w_shifts[i]) / sigma
+            out[j] += weights[i] * np.exp(-0.5 * z * z)
+
+
+class ChordModel(object):
+    """PCX chord emission with only the outer boundary spinning for a fixed chord
+
+    The chord geometry (r, theta, x), the line of sight projection and the trapezoidal weights
+    times the density squared only depend on the impact factor and the grid, so they are computed
+    once. A call evaluates the velocity profile on the cached radii and sums the Doppler shifted
+    Gaussians in a compiled loop without building the (nr, nlambda) spectrum matrix.
+
+    Attributes:
+        impact_factor (float): impact factor for chord
+        w0 (float): central wavelength
+        mu (float): mass in amu
+        rmax (float): end of the plasma
+        nr (int): number of radial points to integrate chord with
+        nlambda (int): number of wavelength points
+        Lne (float): density gradient scale length at rmax
+        R_outer (float): radius of the outer boundary
+        r (np.ndarray): radii along the chord
+        theta (np.ndarray): angle between the toroidal direction and the chord
+        x (np.ndarray): distance along the chord
+        weights (np.ndarray): trapezoidal weights along x times the density squared
+    """
+
+    def __init__(self, impact_factor, w0, mu, rmax=40.0, nr=101, nlambda=2000, Lne=2.5, R_outer=35):
+        super(ChordModel, self).__init__()
+        self.impact_factor = impact_factor
+        self.w0 = w0
+        self.mu = mu
+        self.rmax = rmax
+        self.nr = int(nr)
+        self.nlambda = int(nlambda)
+        self.Lne = Lne
+        self.R_outer = R_outer
+
+        self.r, self.theta, self.x = calculate_r_theta_x_from_impact_factor(impact_factor, rmax=rmax, npts=self.nr)
+        self._cos_theta = np.cos(self.theta)
+
+        dx = np.diff(self.x)
+        trapz_weights = np.zeros_like(self.x)
+        trapz_weights[:-1] += 0.5 * dx
+        trapz_weights[1:] += 0.5 * dx
+        self.weights = trapz_weights * density_profile(self.r, rmax, Lne) ** 2
+
+        self._inside = self.r <= R_outer
+        self._outer_shape = np.exp(-(self.r[~self._inside] - R_outer) ** 2 / 4.0 ** 2)
+        self._unit = np.linspace(-1, 1, self.nlambda)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}({!r}, {!r}, {!r}, rmax={!r}, nr={!r}, nlambda={!r}, Lne={!r}, R_outer={!r})".format(
+            class_name, self.impact_factor, self.w0, self.mu, self.rmax, self.nr, self.nlambda, self.Lne,
+            self.R_outer)
+
+    def velocity(self, Lnu, Vouter):
+        """Toroidal velocity on the chord radii, see pcx_velocity_profile
+
+        The ratio of Bessel functions uses the exponentially scaled i1e, so it does not
+        overflow for small Lnu.
+
+        Args:
+            Lnu (float): momentum diffusion length
+            Vouter (float): velocity in m/s for outer boundary
+
+        Returns:
+            np.ndarray: velocity at each radius
+        """
+        vel = np.empty_like(self.r)
+        x = self.r[self._inside] / Lnu
+        xo = self.R_outer / Lnu
+        vel[self._inside] = Vouter * special.i1e(x) / special.i1e(xo) * np.exp(x - xo)
+        vel[~self._inside] = Vouter * self._outer_shape
+        return vel
+
+    def __call__(self, Ti, Lnu, Vouter):
+        """Calculates the chord spectrum
+
+        Args:
+            Ti (float): ion temperature in eV
+            Lnu (float): momentum diffusion length
+            Vouter (float): velocity in m/s for outer boundary
+
+        Returns:
+            tuple: (np.ndarray, np.ndarray) wavelength and spectrum
+        """
+        vel_adjusted = self.velocity(Lnu, Vouter) * self._cos_theta
+
+        # ToDo: Should really iterate over w0 to handle the He II complex
+        w_shifted_max = models.doppler_shift(self.w0, np.max(vel_adjusted))
+        sigma = models.doppler_broadening(w_shifted_max, self.mu, Ti)
+        wavelength = self._unit * 10.0 * sigma + w_shifted_max
+
+        w_shifts = models.doppler_shift(self.w0, vel_adjusted)
+        spectrum = np.empty(self.nlambda)
+        _chord_spectrum(w_shifts, self.weights, wavelength, sigma, spectrum)
+
+        return wavelength, spectrum
+
+
 def calculate_pcx_chord_emission(impact_factor, Ti, w0, mu, Lnu, Vouter, rmax=40.0, nr=101, nlambda=2000,
                                  Lne=2.5, R_outer=35):
     """Calculates PCX emission with only the outer boundary spinning for a given impact factor
 
+    Solvers that evaluate the same chord many times should build a ChordModel once instead.
+
     Args:
         impact_factor (float): impact factor for chord
         Ti (float): ion temperature in eV
@@ -148,46 +268,8 @@ def calculate_pcx_chord_emission(impact_factor, Ti, w0, mu, Lnu, Vouter, rmax=40
     Returns:
         tuple: (np.ndarray, np.ndarray) wavelength and spectrum
     """
-    r, theta, x = calculate_r_theta_x_from_impact_factor(impact_factor, rmax=rmax, npts=nr)
-    vel = pcx_velocity_profile(r, Lnu, R_outer, Vouter)
-    # fig, ax = plt.subplots()
-    # ax.plot(r, vel)
-    # plt.show()
-    vel_adjusted = vel * np.cos(theta)
-
-    # ToDo: Should really iterate over w0 to handle the He II complex
-    w_shifted_max = models.doppler_shift(w0, np.max(vel_adjusted))
-    sigma = models.doppler_broadening(w_shifted_max, mu, Ti)
-    wavelength = np.linspace(-1, 1, nlambda) * 10.0 * sigma + w_shifted_max
-
-    # Now to build a big spectrum matrix
-    w_shifts = models.doppler_shift(w0, vel_adjusted)
-    full_spectrum = models.gaussian(wavelength[np.newaxis, :], w_shifts[:, np.newaxis], sigma, amp=1.0, norm=False)
-
-    # fig, ax = plt.subplots()
-    # ax.plot(vel_adjusted, w_shifts)
-    # plt.show()
-
-    dens = density_profile(r, rmax, Lne)
-    dens = dens[:, np.newaxis]
-
-    full_spectrum *= dens ** 2
-
-    # fig, ax = plt.subplots()
-    # for idx, spec in enumerate(full_spectrum):
-    #    ax.plot(wavelength, spec, 'C0')
-    #    ax.axvline(w_shifts[idx], color='C1')
-    # plt.show()
-
-    # print(full_spectrum.shape)
-    spectrum = np.trapz(full_spectrum, x=x, axis=0)
-    # print(spectrum.shape)
-
-    # fig, ax = plt.subplots()
-    # ax.plot(wavelength, spectrum / spectrum.max(), 'C1')
-    # plt.show()
-
-    return wavelength, spectrum
+    chord = ChordModel(impact_factor, w0, mu, rmax=rmax, nr=nr, nlambda=nlambda, Lne=Lne, R_outer=R_outer)
+    return chord(Ti, Lnu, Vouter)
 
 
 def charge_exchange_rate(Ti, mu=40, noise=False):
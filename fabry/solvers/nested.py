@@ -0,0 +1,276 @@
+"""Multiprocess nested sampler that needs neither MPI nor MultiNest
+
+Live points live in the unit cube. Every iteration removes the k lowest likelihood live points
+(k defaults to the number of workers) and replaces them with points above the k-th likelihood,
+drawn from the enlarged bounding ellipsoid of the live points. Proposals are evaluated in
+batches on a ProcessPoolExecutor whose workers receive the Problem once, at start up. Data
+arrays wrapped in fabry.tools.shared.SharedArray are attached from shared memory instead of
+being copied to every worker.
+
+Removing k points at once is exact: the j-th of them is removed with nlive - j live points
+left, and their replacements only have to beat the largest removed likelihood.
+
+Classes:
+    NestedSampler: batched, parallel nested sampling of a Problem
+
+Functions:
+    equal_weight_indices: systematic resampling of weighted samples
+"""
+from __future__ import division, print_function
+import multiprocessing
+import os.path as path
+import numpy as np
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+_worker_problem = None
+
+
+def _init_worker(problem):
+    global _worker_problem
+    _worker_problem = problem
+
+
+def _evaluate_block(cube):
+    return _log_likelihoods(_worker_problem, cube)
+
+
+def _log_likelihoods(problem, cube):
+    theta = problem.prior_transform(cube)
+    return np.array([problem.log_likelihood(x) for x in theta], dtype=np.float64)
+
+
+def _log_widths(nlive):
+    """Log prior volume widths of dead points removed with nlive live points each"""
+    logX = np.concatenate(([0.0], -np.cumsum(1.0 / np.asarray(nlive, dtype=np.float64))))
+    return logX[:-1] + np.log1p(-np.exp(logX[1:] - logX[:-1]))
+
+
+def _bounding_ellipsoid(points, enlarge):
+    """Mean and Cholesky factor of the ellipsoid enclosing points, enlarged in volume by enlarge"""
+    ndim = points.shape[1]
+    mean = np.mean(points, axis=0)
+    cov = np.atleast_2d(np.cov(points, rowvar=False)) + 1e-12 * np.eye(ndim)
+    delta = points - mean
+    d2 = np.einsum('ij,jk,ik->i', delta, np.linalg.inv(cov), delta)
+    cov = cov * np.max(d2) * enlarge ** (2.0 / ndim)
+    return mean, np.linalg.cholesky(cov)
+
+
+def _sample_ellipsoid(mean, chol, npts, random_state):
+    ndim = len(mean)
+    z = random_state.standard_normal((npts, ndim))
+    z /= np.sqrt(np.sum(z ** 2, axis=1))[:, np.newaxis]
+    z *= random_state.uniform(size=(npts, 1)) ** (1.0 / ndim)
+    return mean + np.dot(z, chol.T)
+
+
+class NestedSampler(object):
+    """Batched nested sampling of a Problem on a process pool
+
+    With spawn based multiprocessing the Problem (and its log likelihood) must be picklable;
+    with fork (the Linux default) closures work as well. nworkers=1 evaluates in process.
+
+    Attributes:
+        problem (Problem): priors and log likelihood
+        nlive (int): number of live points
+        nworkers (int): number of worker processes
+        batch_size (int): number of live points replaced per iteration
+        enlarge (float): volume enlargement of the bounding ellipsoid
+        ncall (int): number of likelihood evaluations so far
+    """
+
+    def __init__(self, problem, nlive=400, nworkers=None, batch_size=None, enlarge=1.25, random_state=None):
+        super(NestedSampler, self).__init__()
+        self.problem = problem
+        self.nlive = int(nlive)
+        self.nworkers = multiprocessing.cpu_count() if nworkers is None else max(1, int(nworkers))
+        self.batch_size = self.nworkers if batch_size is None else int(batch_size)
+        self.batch_size = max(1, min(self.batch_size, self.nlive // 2))
+        self.enlarge = float(enlarge)
+        self.random_state = random_state if isinstance(random_state, np.random.RandomState) \
+            else np.random.RandomState(random_state)
+
+        self.ncall = 0
+        self.finished = False
+        self._live_u = None
+        self._live_logl = None
+        self._dead_u = []
+        self._dead_logl = []
+        self._dead_nlive = []
+        self._efficiency = 1.0
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(nlive={!r}, nworkers={!r}, batch_size={!r}, ncall={!r})".format(class_name, self.nlive,
+                                                                                    self.nworkers, self.batch_size,
+                                                                                    self.ncall)
+
+    def _evaluate(self, pool, cube):
+        self.ncall += len(cube)
+        if pool is None:
+            return _log_likelihoods(self.problem, cube)
+        blocks = np.array_split(cube, min(self.nworkers, len(cube)))
+        return np.concatenate(list(pool.map(_evaluate_block, blocks)))
+
+    def _log_volume(self):
+        return -np.sum(1.0 / np.asarray(self._dead_nlive, dtype=np.float64))
+
+    def _log_evidence(self):
+        if not self._dead_logl:
+            return -np.inf
+        return np.logaddexp.reduce(np.asarray(self._dead_logl) + _log_widths(self._dead_nlive))
+
+    def _replace(self, pool):
+        k = self.batch_size
+        order = np.argsort(self._live_logl)
+        worst = order[:k]
+        threshold = self._live_logl[worst[-1]]
+        mean, chol = _bounding_ellipsoid(self._live_u, self.enlarge)
+
+        for j, idx in enumerate(worst):
+            self._dead_u.append(self._live_u[idx].copy())
+            self._dead_logl.append(self._live_logl[idx])
+            self._dead_nlive.append(self.nlive - j)
+
+        new_u = []
+        new_logl = []
+        nfound = 0
+        while nfound < k:
+            nprop = int(np.ceil((k - nfound) / max(self._efficiency, 0.01)))
+            nprop = min(max(nprop, self.nworkers), 100 * self.nworkers + k)
+            cube = _sample_ellipsoid(mean, chol, nprop, self.random_state)
+            cube = cube[np.all((cube > 0.0) & (cube < 1.0), axis=1)]
+            if len(cube) == 0:
+                self._efficiency *= 0.5
+                continue
+            logl = self._evaluate(pool, cube)
+            accept = logl > threshold
+            self._efficiency = 0.5 * self._efficiency + 0.5 * max(np.mean(accept), 1.0 / nprop)
+            new_u.append(cube[accept])
+            new_logl.append(logl[accept])
+            nfound += np.sum(accept)
+
+        keep = order[k:]
+        self._live_u = np.vstack([self._live_u[keep]] + new_u)[:self.nlive]
+        self._live_logl = np.concatenate([self._live_logl[keep]] + new_logl)[:self.nlive]
+
+    def run(self, dlogz=0.1, maxiter=None, checkpoint=None, checkpoint_every=50, verbose=False):
+        """Runs nested sampling until the live points hold less than dlogz of the evidence
+
+        Args:
+            dlogz (float): stopping criterion log(Z + L_max X) - log(Z), default=0.1
+            maxiter (int, optional): maximum number of iterations (batches of replacements)
+            checkpoint (str, optional): .npz file for the sampler state, resumed from if it exists
+            checkpoint_every (int): iterations between checkpoints, default=50
+            verbose (bool): print progress, default=False
+
+        Returns:
+            dict: see results
+        """
+        if checkpoint is not None and path.isfile(checkpoint):
+            self.load_state(checkpoint)
+        if self.finished:
+            return self.results()
+
+        pool = None
+        if self.nworkers > 1:
+            if ProcessPoolExecutor is None:
+                raise ImportError('concurrent.futures is required for nworkers > 1')
+            pool = ProcessPoolExecutor(max_workers=self.nworkers, initializer=_init_worker,
+                                       initargs=(self.problem,))
+        try:
+            if self._live_u is None:
+                self._live_u = self.random_state.uniform(size=(self.nlive, self.problem.ndim))
+                self._live_logl = self._evaluate(pool, self._live_u)
+
+            iteration = 0
+            while maxiter is None or iteration < maxiter:
+                logz = self._log_evidence()
+                remaining = np.max(self._live_logl) + self._log_volume()
+                delta = np.logaddexp(logz, remaining) - logz
+                if verbose and iteration % 10 == 0:
+                    print('iter {0:d}: ncall={1:d} logz={2:.3f} dlogz={3:.3f} eff={4:.3f}'.format(
+                        len(self._dead_logl), self.ncall, logz, delta, self._efficiency))
+                if delta < dlogz:
+                    self.finished = True
+                    break
+
+                self._replace(pool)
+                iteration += 1
+                if checkpoint is not None and iteration % checkpoint_every == 0:
+                    self.save_state(checkpoint)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+
+        if checkpoint is not None:
+            self.save_state(checkpoint)
+
+        return self.results()
+
+    def results(self):
+        """Weighted samples and evidence from the dead points plus the current live points
+
+        Returns:
+            dict: 'samples' (physical parameters), 'logl', 'logwt', 'weights', 'logz', 'logz_err',
+                'information', 'ncall', 'niter'
+        """
+        order = np.argsort(self._live_logl)
+        cube = np.vstack([np.atleast_2d(np.asarray(self._dead_u)).reshape(-1, self.problem.ndim),
+                          self._live_u[order]])
+        logl = np.concatenate((self._dead_logl, self._live_logl[order]))
+        nlive = np.concatenate((self._dead_nlive, np.arange(self.nlive, 0, -1)))
+        logwt = logl + _log_widths(nlive)
+        logz = np.logaddexp.reduce(logwt)
+        weights = np.exp(logwt - logz)
+        information = max(np.sum(weights * logl) - logz, 0.0)
+
+        return {'samples': self.problem.prior_transform(cube), 'logl': logl, 'logwt': logwt, 'weights': weights,
+                'logz': logz, 'logz_err': np.sqrt(information / self.nlive), 'information': information,
+                'ncall': self.ncall, 'niter': len(self._dead_logl)}
+
+    def save_state(self, fname):
+        """Writes the sampler state to an .npz file"""
+        np.savez(fname, live_u=self._live_u, live_logl=self._live_logl,
+                 dead_u=np.asarray(self._dead_u).reshape(-1, self.problem.ndim),
+                 dead_logl=np.asarray(self._dead_logl), dead_nlive=np.asarray(self._dead_nlive),
+                 ncall=self.ncall, finished=self.finished, efficiency=self._efficiency)
+
+    def load_state(self, fname):
+        """Restores the sampler state from an .npz file written by save_state"""
+        state = np.load(fname)
+        if state['live_u'].shape != (self.nlive, self.problem.ndim):
+            raise ValueError('{} was written for a different nlive or number of parameters'.format(fname))
+        self._live_u = state['live_u']
+        self._live_logl = state['live_logl']
+        self._dead_u = list(state['dead_u'])
+        self._dead_logl = list(state['dead_logl'])
+        self._dead_nlive = list(state['dead_nlive'])
+        self.ncall = int(state['ncall'])
+        self.finished = bool(state['finished'])
+        self._efficiency = float(state['efficiency'])
+
+
+def equal_weight_indices(weights, random_state=None):
+    """Systematic resampling of weighted samples to about the effective sample size
+
+    Args:
+        weights (np.ndarray): normalized sample weights
+        random_state (Union[int, np.random.RandomState], optional): seed or random state
+
+    Returns:
+        np.ndarray: indices of the equally weighted samples
+    """
+    if not isinstance(random_state, np.random.RandomState):
+        random_state = np.random.RandomState(random_state)
+    weights = np.asarray(weights, dtype=np.float64)
+    weights = weights / np.sum(weights)
+    nsamples = max(1, int(1.0 / np.sum(weights ** 2)))
+    positions = (random_state.uniform() + np.arange(nsamples)) / nsamples
+    cumulative = np.cumsum(weights)
+    cumulative[-1] = 1.0
+    return np.searchsorted(cumulative, positions)
@@ -0,0 +1,265 @@
+"""Declarative prior specifications for the nested sampling and MCMC solvers
+
+A prior spec is an ordered list of named parameters, each with a prior type and its arguments.
+It is stored as JSON (or YAML if PyYAML is installed), for example::
+
+    {"parameters": [
+        {"name": "Ti", "prior": "uniform", "lower": 0.025, "upper": 3.0},
+        {"name": "A", "prior": "log_uniform", "lower": 100.0, "upper": 1e5},
+        {"name": "V", "prior": "normal", "mean": 0.0, "sigma": 2000.0}
+    ]}
+
+Every prior maps the unit interval to the parameter (the MultiNest/dynesty prior transform), so
+the same spec drives every sampler backend.
+
+Classes:
+    Prior: base class for a one dimensional prior transform
+    UniformPrior, LogUniformPrior, NormalPrior: registered prior types
+    PriorSpec: ordered collection of named priors
+
+Functions:
+    register_prior: class decorator that adds a Prior type to prior_types
+"""
+from __future__ import division, print_function
+import json
+import os.path as path
+import numpy as np
+from ..tools.helpers import lazy_import
+
+special = lazy_import('scipy.special')
+yaml = lazy_import('yaml')
+
+prior_types = {}
+
+
+def register_prior(prior_cls):
+    """Decorator for registering Prior classes by their name attribute
+
+    Args:
+        prior_cls (type): Prior subclass with a unique name
+
+    Returns:
+        type: prior_cls
+    """
+    prior_types[prior_cls.name] = prior_cls
+    return prior_cls
+
+
+class Prior(object):
+    """Base class for a one dimensional prior transform
+
+    Subclasses set name, list their arguments in args and implement transform.
+    """
+    name = None
+    args = ()
+
+    def transform(self, u):
+        """Maps u in [0, 1] to the parameter
+
+        Args:
+            u (Union[float, np.ndarray]): unit cube value(s)
+
+        Returns:
+            Union[float, np.ndarray]: parameter value(s)
+        """
+        raise NotImplementedError
+
+    def bounds(self):
+        """Returns the (lower, upper) support of the prior"""
+        return self.transform(0.0), self.transform(1.0)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        args = ", ".join("{}={!r}".format(arg, getattr(self, arg)) for arg in self.args)
+        return "{}({})".format(class_name, args)
+
+    def to_dict(self):
+        """Returns a dict representation of the prior"""
+        prior = {'prior': self.name}
+        for arg in self.args:
+            prior[arg] = getattr(self, arg)
+        return prior
+
+    @classmethod
+    def from_dict(cls, prior):
+        """Creates a registered Prior from a dict with a 'prior' type and its arguments
+
+        Args:
+            prior (dict): dictionary representation of a prior
+
+        Returns:
+            Prior
+        """
+        prior = dict(prior)
+        name = prior.pop('prior')
+        if name not in prior_types:
+            raise ValueError("unknown prior type '{}', choose from {}".format(name, sorted(prior_types)))
+        prior_cls = prior_types[name]
+        return prior_cls(**dict((arg, prior[arg]) for arg in prior_cls.args))
+
+
+@register_prior
+class UniformPrior(Prior):
+    """Uniform prior between lower and upper"""
+    name = 'uniform'
+    args = ('lower', 'upper')
+
+    def __init__(self, lower, upper):
+        super(UniformPrior, self).__init__()
+        self.lower = float(lower)
+        self.upper = float(upper)
+
+    def transform(self, u):
+        return self.lower + u * (self.upper - self.lower)
+
+
+@register_prior
+class LogUniformPrior(Prior):
+    """Uniform prior in log10 between lower and upper (both given as parameter values)"""
+    name = 'log_uniform'
+    args = ('lower', 'upper')
+
+    def __init__(self, lower, upper):
+        super(LogUniformPrior, self).__init__()
+        if lower <= 0.0 or upper <= 0.0:
+            raise ValueError('log_uniform limits must be positive')
+        self.lower = float(lower)
+        self.upper = float(upper)
+
+    def transform(self, u):
+        log_lower = np.log10(self.lower)
+        return 10.0 ** (log_lower + u * (np.log10(self.upper) - log_lower))
+
+
+@register_prior
+class NormalPrior(Prior):
+    """Normal prior with mean and standard deviation sigma"""
+    name = 'normal'
+    args = ('mean', 'sigma')
+
+    def __init__(self, mean, sigma):
+        super(NormalPrior, self).__init__()
+        self.mean = float(mean)
+        self.sigma = float(sigma)
+
+    def transform(self, u):
+        return self.mean + self.sigma * special.ndtri(u)
+
+
+class PriorSpec(object):
+    """Ordered collection of named priors
+
+    Attributes:
+        names (list): parameter names in sampling order
+        priors (list): Prior for each parameter
+    """
+
+    def __init__(self, names, priors):
+        super(PriorSpec, self).__init__()
+        if len(names) != len(priors):
+            raise ValueError('names and priors must have the same length')
+        if len(set(names)) != len(names):
+            raise ValueError('parameter names must be unique')
+        self.names = list(names)
+        self.priors = list(priors)
+
+    @property
+    def ndim(self):
+        """int: number of parameters"""
+        return len(self.names)
+
+    def __len__(self):
+        return self.ndim
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(names={!r}, priors={!r})".format(class_name, self.names, self.priors)
+
+    def index(self, name):
+        """Returns the column of parameter name"""
+        return self.names.index(name)
+
+    def transform(self, cube):
+        """Maps unit cube points to parameters
+
+        Args:
+            cube (np.ndarray): unit cube point (ndim,) or points (npts, ndim)
+
+        Returns:
+            np.ndarray: parameters with the shape of cube
+        """
+        cube = np.asarray(cube, dtype=np.float64)
+        theta = np.empty_like(cube)
+        for idx, prior in enumerate(self.priors):
+            theta[..., idx] = prior.transform(cube[..., idx])
+        return theta
+
+    def transform_inplace(self, cube, ndim=None):
+        """In place prior transform for MultiNest style cubes (ctypes arrays)
+
+        Args:
+            cube: array like unit cube point, overwritten with the parameters
+            ndim (int, optional): number of sampled parameters, defaults to self.ndim
+        """
+        for idx in range(self.ndim if ndim is None else ndim):
+            cube[idx] = self.priors[idx].transform(cube[idx])
+
+    def bounds(self):
+        """Returns an (ndim, 2) array with the support of each prior"""
+        return np.array([prior.bounds() for prior in self.priors], dtype=np.float64)
+
+    def to_dict(self):
+        """Returns a dict representation of the PriorSpec"""
+        parameters = []
+        for name, prior in zip(self.names, self.priors):
+            entry = {'name': name}
+            entry.update(prior.to_dict())
+            parameters.append(entry)
+        return {'parameters': parameters}
+
+    @classmethod
+    def from_dict(cls, spec):
+        """Creates a new PriorSpec from a dict
+
+        Args:
+            spec (dict): {'parameters': [{'name': ..., 'prior': ..., **args}, ...]}
+
+        Returns:
+            PriorSpec
+        """
+        names = []
+        priors = []
+        for entry in spec['parameters']:
+            entry = dict(entry)
+            names.append(entry.pop('name'))
+            priors.append(Prior.from_dict(entry))
+        return cls(names, priors)
+
+    @classmethod
+    def load(cls, fname):
+        """Reads a PriorSpec from a .json or .yml/.yaml file
+
+        Args:
+            fname (str): path to the prior spec
+
+        Returns:
+            PriorSpec
+        """
+        with open(fname, 'r') as infile:
+            if path.splitext(fname)[-1].lower() in ('.yml', '.yaml'):
+                spec = yaml.safe_load(infile)
+            else:
+                spec = json.load(infile)
+        return cls.from_dict(spec)
+
+    def save(self, fname):
+        """Writes the PriorSpec to a .json or .yml/.yaml file
+
+        Args:
+            fname (str): path to write to
+        """
+        with open(fname, 'w') as outfile:
+            if path.splitext(fname)[-1].lower() in ('.yml', '.yaml'):
+                yaml.safe_dump(self.to_dict(), outfile, default_flow_style=False)
+            else:
+                json.dump(self.to_dict(), outfile, indent=4)
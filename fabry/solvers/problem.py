@@ -0,0 +1,90 @@
+"""Sampling problems for the solver backends
+
+A Problem pairs a PriorSpec with a log likelihood of the physical parameters. The sampler
+backends in fabry.solvers.samplers only see this interface, so a solver is written once and
+sampled with whichever backend is available.
+
+Classes:
+    GaussianLikelihood: -chi^2 / 2 of a model against data with independent errors
+    Problem: prior spec plus log likelihood
+"""
+from __future__ import division, print_function
+import numpy as np
+from ..tools.shared import SharedArray
+
+
+class GaussianLikelihood(object):
+    """Gaussian log likelihood -chi^2 / 2 for model(theta) against data
+
+    Module level models (or functools.partial of them) keep the likelihood picklable for the
+    multiprocess backends. data and error may be fabry.tools.shared.SharedArray instances, which
+    workers attach from shared memory instead of receiving a copy.
+
+    Attributes:
+        model (callable): model(theta) -> prediction with the shape of data
+        data (np.ndarray): measured values
+        error (np.ndarray): standard deviation of data
+    """
+
+    def __init__(self, model, data, error):
+        super(GaussianLikelihood, self).__init__()
+        self.model = model
+        self.data = data if isinstance(data, SharedArray) else np.asarray(data, dtype=np.float64)
+        self.error = error if isinstance(error, SharedArray) else np.asarray(error, dtype=np.float64)
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(model={!r}, npts={!r})".format(class_name, self.model, np.size(self.data))
+
+    def __call__(self, theta):
+        vals = self.model(theta)
+        return -0.5 * np.sum(((vals - np.asarray(self.data)) / np.asarray(self.error)) ** 2)
+
+
+class Problem(object):
+    """Prior spec plus log likelihood of the physical parameters
+
+    Attributes:
+        priors (PriorSpec): named priors in sampling order
+        log_likelihood (callable): log_likelihood(theta) -> float for a 1d parameter array
+    """
+
+    def __init__(self, priors, log_likelihood):
+        super(Problem, self).__init__()
+        self.priors = priors
+        self.log_likelihood = log_likelihood
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(priors={!r}, log_likelihood={!r})".format(class_name, self.priors, self.log_likelihood)
+
+    @property
+    def ndim(self):
+        """int: number of sampled parameters"""
+        return self.priors.ndim
+
+    @property
+    def names(self):
+        """list: parameter names in sampling order"""
+        return self.priors.names
+
+    def prior_transform(self, cube):
+        """Maps unit cube point(s) to parameters, see PriorSpec.transform"""
+        return self.priors.transform(cube)
+
+    def unit_log_likelihood(self, cube):
+        """Log likelihood as a function of the unit cube point
+
+        Sampling cube uniformly with this likelihood samples the posterior, which lets MCMC
+        backends use the same prior transform as the nested samplers.
+
+        Args:
+            cube (np.ndarray): unit cube point (ndim,)
+
+        Returns:
+            float: log likelihood, -inf outside the unit cube
+        """
+        cube = np.asarray(cube, dtype=np.float64)
+        if np.any(cube <= 0.0) or np.any(cube >= 1.0):
+            return -np.inf
+        return self.log_likelihood(self.priors.transform(cube))
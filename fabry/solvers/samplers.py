@@ -0,0 +1,315 @@
+"""Pluggable sampler backends for fabry.solvers.problem.Problem
+
+Backends are registered by name with register_sampler and picked at run time with
+run(problem, basename, sampler=name). Optional dependencies are imported on first use, so a
+backend is only required when it is selected. Every backend writes the MultiNest equally weighted
+posterior file basename + 'post_equal_weights.dat' (parameters followed by the log likelihood) and
+basename + 'params.json', so the fabry.tools.file_io readers and the check scripts work unchanged.
+
+Registered backends:
+    nested: built-in multiprocess nested sampler (fabry.solvers.nested), no optional dependencies
+    multinest: pymultinest (MPI aware)
+    dynesty: dynesty static nested sampling with checkpointing
+    emcee: emcee ensemble MCMC in unit cube coordinates with an HDF5 backend
+
+Functions:
+    register_sampler: decorator factory that registers a backend under a name
+    available_samplers: registered backends whose dependencies import
+    mpi_rank: rank of this process in MPI.COMM_WORLD, 0 without MPI
+    run: samples a Problem with a registered backend
+    run_likelihood: samples a log likelihood under a PriorSpec, the entry point of the solvers
+    write_equal_weights: writes a MultiNest style equally weighted posterior
+    read_equal_weights: reads a MultiNest style equally weighted posterior
+"""
+from __future__ import division, print_function
+import importlib
+import json
+import os
+import os.path as path
+import sys
+import numpy as np
+from .nested import NestedSampler, equal_weight_indices
+from .problem import Problem
+from ..tools import file_io
+from ..tools.helpers import lazy_import
+
+pymultinest = lazy_import('pymultinest')
+dynesty = lazy_import('dynesty')
+emcee = lazy_import('emcee')
+
+samplers = {}
+sampler_requirements = {}
+
+
+def register_sampler(name, requires=None):
+    """Decorator factory for registering sampler backends
+
+    A backend is called as backend(problem, basename, resume=True, **kwargs) and must write
+    basename + 'post_equal_weights.dat'.
+
+    Args:
+        name (str): name used to select the backend in run
+        requires (str, optional): module that must be importable for the backend to be available
+
+    Returns:
+        callable: decorator that registers the backend and returns it unchanged
+    """
+    def decorator(func):
+        samplers[name] = func
+        sampler_requirements[name] = requires
+        return func
+    return decorator
+
+
+def available_samplers():
+    """Returns the names of the registered backends whose dependencies can be imported"""
+    names = []
+    for name in sorted(samplers):
+        module = sampler_requirements[name]
+        if module is not None:
+            try:
+                importlib.import_module(module)
+            except ImportError:
+                continue
+        names.append(name)
+    return names
+
+
+def mpi_rank():
+    """Rank of this process in MPI.COMM_WORLD, 0 without MPI
+
+    mpi4py is only asked if something (e.g. pymultinest) already imported it, otherwise the rank
+    comes from the launcher environment, so serial runs never initialize MPI.
+
+    Returns:
+        int: rank
+    """
+    if 'mpi4py.MPI' in sys.modules:
+        return sys.modules['mpi4py.MPI'].COMM_WORLD.Get_rank()
+    for key in ('OMPI_COMM_WORLD_RANK', 'PMI_RANK', 'PMIX_RANK', 'MV2_COMM_WORLD_RANK'):
+        if key in os.environ:
+            return int(os.environ[key])
+    return 0
+
+
+def write_equal_weights(basename, samples, log_likelihood):
+    """Writes a MultiNest style equally weighted posterior
+
+    Args:
+        basename (str): output files basename
+        samples (np.ndarray): equally weighted samples (nsamples, ndim)
+        log_likelihood (np.ndarray): log likelihood of each sample
+    """
+    post = np.column_stack((samples, log_likelihood))
+    np.savetxt(basename + 'post_equal_weights.dat', post, fmt='%.18E')
+
+
+def read_equal_weights(basename):
+    """Reads a MultiNest style equally weighted posterior
+
+    Args:
+        basename (str): output files basename
+
+    Returns:
+        np.ndarray: (nsamples, ndim + 1) array, the last column is the log likelihood
+    """
+    return np.loadtxt(basename + 'post_equal_weights.dat', ndmin=2)
+
+
+def run(problem, basename, sampler='multinest', resume=True, **kwargs):
+    """Samples a Problem with a registered backend
+
+    Args:
+        problem (Problem): priors and log likelihood
+        basename (str): output files basename, e.g. join(folder, 'Ti_')
+        sampler (str): name of a registered backend, default='multinest'
+        resume (bool): resume from the backend's saved state if it exists, default=True
+        **kwargs: passed on to the backend
+
+    Returns:
+        np.ndarray: equally weighted posterior (nsamples, ndim + 1), the last column is the log likelihood
+    """
+    if sampler not in samplers:
+        raise ValueError("unknown sampler '{}', choose from {}".format(sampler, sorted(samplers)))
+
+    if mpi_rank() == 0:
+        folder = path.dirname(path.abspath(basename))
+        file_io.prep_folder(folder)
+        with open(basename + 'params.json', 'w') as outfile:
+            json.dump(problem.names, outfile)
+
+    samplers[sampler](problem, basename, resume=resume, **kwargs)
+
+    return read_equal_weights(basename)
+
+
+def run_likelihood(log_likelihood, priors, basename, sampler='multinest', resume=True, nlive=None, derived=None,
+                   derived_names=None, **kwargs):
+    """Samples log_likelihood(theta) under priors, the entry point of the solvers
+
+    Derived parameters (e.g. linear amplitudes solved in closed form) are evaluated for the
+    equally weighted posterior after sampling and written after the sampled parameters, the
+    column layout of MultiNest runs with nparams > ndim.
+
+    Args:
+        log_likelihood (callable): log_likelihood(theta) -> float for a 1d parameter array
+        priors (PriorSpec): named priors in sampling order
+        basename (str): output files basename, e.g. join(folder, 'Ti_')
+        sampler (str): name of a registered backend, default='multinest'
+        resume (bool): resume from the backend's saved state if it exists, default=True
+        nlive (int, optional): number of live points for the nested sampling backends
+        derived (callable, optional): derived(theta) -> 1d array of derived parameters
+        derived_names (list, optional): names of the derived parameters for params.json
+        **kwargs: passed on to the backend
+
+    Returns:
+        np.ndarray: equally weighted posterior, the last column is the log likelihood (derived
+            parameters are only added on rank 0)
+    """
+    if nlive is not None:
+        if sampler == 'multinest':
+            kwargs.setdefault('n_live_points', nlive)
+        elif sampler in ('nested', 'dynesty'):
+            kwargs.setdefault('nlive', nlive)
+
+    post = run(Problem(priors, log_likelihood), basename, sampler=sampler, resume=resume, **kwargs)
+    # only rank 0 rewrites the posterior file
+    if derived is None or mpi_rank() != 0:
+        return post
+
+    theta = post[:, :priors.ndim]
+    values = np.array([np.atleast_1d(derived(x)) for x in theta]).reshape(len(theta), -1)
+    post = np.column_stack((theta, values, post[:, -1]))
+    write_equal_weights(basename, post[:, :-1], post[:, -1])
+    names = list(derived_names) if derived_names is not None else \
+        ['derived_{0:d}'.format(idx) for idx in range(values.shape[1])]
+    with open(basename + 'params.json', 'w') as outfile:
+        json.dump(priors.names + names, outfile)
+    return post
+
+
+@register_sampler('nested')
+def run_nested(problem, basename, resume=True, nlive=400, nworkers=None, batch_size=None, dlogz=0.1,
+               enlarge=1.25, maxiter=None, random_state=None, verbose=False):
+    """Built-in multiprocess nested sampler (see fabry.solvers.nested.NestedSampler)
+
+    Besides post_equal_weights.dat this writes the MultiNest basename + '.txt' table (posterior
+    weight, -2 log likelihood, parameters), so pymultinest.Analyzer can read the run, and
+    basename + 'nested_stats.json' with the evidence.
+
+    Args:
+        problem (Problem): priors and log likelihood
+        basename (str): output files basename
+        resume (bool): resume from basename + 'nested_state.npz' if it exists
+        nlive (int): number of live points, default=400
+        nworkers (int, optional): number of worker processes, defaults to the number of cpus
+        batch_size (int, optional): live points replaced per iteration, defaults to nworkers
+        dlogz (float): stopping criterion on the remaining evidence, default=0.1
+        enlarge (float): volume enlargement of the bounding ellipsoid, default=1.25
+        maxiter (int, optional): maximum number of iterations
+        random_state (int, optional): seed
+        verbose (bool): print progress, default=False
+    """
+    checkpoint = basename + 'nested_state.npz'
+    if not resume and path.isfile(checkpoint):
+        os.remove(checkpoint)
+
+    random_state = np.random.RandomState(random_state)
+    sampler = NestedSampler(problem, nlive=nlive, nworkers=nworkers, batch_size=batch_size, enlarge=enlarge,
+                            random_state=random_state)
+    results = sampler.run(dlogz=dlogz, maxiter=maxiter, checkpoint=checkpoint, verbose=verbose)
+
+    samples = results['samples']
+    np.savetxt(basename + '.txt', np.column_stack((results['weights'], -2.0 * results['logl'], samples)),
+               fmt='%.18E')
+    idx = equal_weight_indices(results['weights'], random_state=random_state)
+    write_equal_weights(basename, samples[idx], results['logl'][idx])
+
+    stats = dict((key, float(results[key])) for key in ('logz', 'logz_err', 'information'))
+    stats.update({'ncall': int(results['ncall']), 'niter': int(results['niter']), 'nlive': sampler.nlive,
+                  'finished': sampler.finished})
+    with open(basename + 'nested_stats.json', 'w') as outfile:
+        json.dump(stats, outfile, indent=4)
+
+
+@register_sampler('multinest', requires='pymultinest')
+def run_multinest(problem, basename, resume=True, **kwargs):
+    """MultiNest through pymultinest, keyword arguments are passed to pymultinest.run"""
+    def log_prior(cube, ndim, nparams):
+        problem.priors.transform_inplace(cube, ndim)
+
+    def log_likelihood(cube, ndim, nparams):
+        return problem.log_likelihood(np.array([cube[idx] for idx in range(ndim)]))
+
+    options = {'importance_nested_sampling': False, 'verbose': True, 'sampling_efficiency': 'model',
+               'n_live_points': 400}
+    options.update(kwargs)
+
+    pymultinest.run(log_likelihood, log_prior, problem.ndim, resume=resume, outputfiles_basename=basename,
+                    **options)
+
+
+@register_sampler('dynesty', requires='dynesty')
+def run_dynesty(problem, basename, resume=True, nlive=400, dlogz=0.1, random_state=None, **kwargs):
+    """dynesty static nested sampling
+
+    Args:
+        problem (Problem): priors and log likelihood
+        basename (str): output files basename
+        resume (bool): restore from basename + 'dynesty.save' if it exists
+        nlive (int): number of live points, default=400
+        dlogz (float): stopping criterion on the remaining evidence, default=0.1
+        random_state (int, optional): seed for the sampler
+        **kwargs: passed on to dynesty.NestedSampler
+    """
+    checkpoint = basename + 'dynesty.save'
+    if resume and path.isfile(checkpoint):
+        sampler = dynesty.NestedSampler.restore(checkpoint)
+        sampler.run_nested(dlogz=dlogz, checkpoint_file=checkpoint, resume=True)
+    else:
+        rstate = np.random.default_rng(random_state)
+        sampler = dynesty.NestedSampler(problem.log_likelihood, problem.prior_transform, problem.ndim,
+                                        nlive=nlive, rstate=rstate, **kwargs)
+        sampler.run_nested(dlogz=dlogz, checkpoint_file=checkpoint)
+
+    results = sampler.results
+    weights = np.exp(results.logwt - results.logz[-1])
+    idx = dynesty.utils.resample_equal(np.arange(len(weights)), weights / np.sum(weights))
+    write_equal_weights(basename, results.samples[idx], results.logl[idx])
+
+
+@register_sampler('emcee', requires='emcee')
+def run_emcee(problem, basename, resume=True, nwalkers=None, nsteps=5000, burn=0.5, thin=10,
+              random_state=None, **kwargs):
+    """emcee ensemble MCMC on the unit cube (see Problem.unit_log_likelihood)
+
+    Args:
+        problem (Problem): priors and log likelihood
+        basename (str): output files basename
+        resume (bool): continue the chain in basename + 'emcee.h5' if it exists
+        nwalkers (int, optional): number of walkers, defaults to 4 * ndim (at least 16)
+        nsteps (int): number of steps to add, default=5000
+        burn (float): fraction of the chain discarded as burn in, default=0.5
+        thin (int): thinning of the stored chain, default=10
+        random_state (int, optional): seed for the initial walkers
+        **kwargs: passed on to emcee.EnsembleSampler (e.g. pool, moves)
+    """
+    ndim = problem.ndim
+    if nwalkers is None:
+        nwalkers = max(16, 4 * ndim)
+
+    backend = emcee.backends.HDFBackend(basename + 'emcee.h5')
+    if resume and path.isfile(basename + 'emcee.h5') and backend.iteration > 0:
+        initial = None
+        nwalkers = backend.shape[0]
+    else:
+        backend.reset(nwalkers, ndim)
+        initial = np.random.RandomState(random_state).uniform(0.0, 1.0, size=(nwalkers, ndim))
+
+    sampler = emcee.EnsembleSampler(nwalkers, ndim, problem.unit_log_likelihood, backend=backend, **kwargs)
+    sampler.run_mcmc(initial, nsteps)
+
+    discard = int(burn * backend.iteration)
+    cube = sampler.get_chain(discard=discard, thin=thin, flat=True)
+    log_likelihood = sampler.get_log_prob(discard=discard, thin=thin, flat=True)
+    write_equal_weights(basename, problem.prior_transform(cube), log_likelihood)
@@ -1,7 +1,9 @@
 from __future__ import print_function, division
 import os
 import numpy as np
-import h5py
+from .helpers import lazy_import
+
+h5py = lazy_import('h5py')
 
 
 def dict_2_h5(fname, dic, append=False):
@@ -71,7 +73,7 @@ def recursive_load_dict_from_h5(h5, path):
     for key, item in h5[path].items():
         # if type(item) == h5py._hl.dataset.Dataset:
         if isinstance(item, h5py.Dataset):
-            out_dict[key] = item.value
+            out_dict[key] = item[()]
         # elif type(item) == h5py._hl.group.Group:
         elif isinstance(item, h5py.Group):
             out_dict[key] = recursive_load_dict_from_h5(h5, path + key + '/')
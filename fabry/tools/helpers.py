@@ -1,6 +1,91 @@
 from __future__ import print_function, division
+import importlib
 import numpy as np
 
+
+class LazyModule(object):
+    """Stand in for a module that is imported on first attribute access
+
+    Heavy optional dependencies (matplotlib, rawpy, pymultinest, ...) are only needed by a few
+    functions, but a top level import makes every multiprocessing or MPI worker pay for them.
+    An ImportError is raised at first use instead of at import time.
+
+    Attributes:
+        name (str): full name of the module to import
+    """
+
+    def __init__(self, name):
+        self.__dict__['name'] = name
+        self.__dict__['_module'] = None
+
+    def _load(self):
+        if self._module is None:
+            self.__dict__['_module'] = importlib.import_module(self.name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = 'loaded' if self._module is not None else 'not loaded'
+        return "<lazy module '{}' ({})>".format(self.name, state)
+
+
+def lazy_import(name):
+    """Returns a LazyModule for name, use it like `plt = lazy_import('matplotlib.pyplot')`
+
+    Args:
+        name (str): full name of the module to import
+
+    Returns:
+        LazyModule
+    """
+    return LazyModule(name)
+
+
+def row_blocks(ny, block_rows=256):
+    """Yields slices covering rows 0 to ny in blocks of block_rows
+
+    Args:
+        ny (int): number of rows
+        block_rows (int): rows per block, default=256
+
+    Yields:
+        slice: rows of the block
+    """
+    block_rows = max(1, int(block_rows))
+    for start in range(0, ny, block_rows):
+        yield slice(start, min(start + block_rows, ny))
+
+
+def radius_blocks(nx, ny, x0, y0, block_rows=256, block_cols=None, origin=0, dtype=np.float64):
+    """Yields tiles of pixel distances from (x0, y0) without building full frame coordinate grids
+
+    Pixel (i, j) is at x = j + origin, y = i + origin. Each tile is broadcast from its row and
+    column offsets, so at most one tile of radii exists at a time.
+
+    Args:
+        nx (int): number of pixels in x
+        ny (int): number of pixels in y
+        x0 (float): x location of the center
+        y0 (float): y location of the center
+        block_rows (int): rows per tile, default=256
+        block_cols (int, optional): columns per tile, full rows if None
+        origin (int): coordinate of the first pixel, default=0
+        dtype (np.dtype): data type of the radii, e.g. np.float32 to halve memory, default=np.float64
+
+    Yields:
+        tuple (slice, slice, np.ndarray): rows, columns and radii of the tile
+    """
+    dtype = np.dtype(dtype)
+    dx2 = ((np.arange(nx) + origin - x0) ** 2).astype(dtype)
+    dy2 = ((np.arange(ny) + origin - y0) ** 2).astype(dtype)
+    for cols in row_blocks(nx, nx if block_cols is None else block_cols):
+        for rows in row_blocks(ny, block_rows):
+            R = dy2[rows, np.newaxis] + dx2[np.newaxis, cols]
+            yield rows, cols, np.sqrt(R, out=R)
+
+
 def bin_data(data, npts=100):
     n, m = divmod(len(data), npts)
     if m != 0:
@@ -1,12 +1,14 @@
 from __future__ import print_function, division
-import rawpy
-import exifread
 import numpy as np
 import os.path as path
 import collections
-import skimage.io as io
 from . import file_io
-import matplotlib.pyplot as plt
+from .helpers import lazy_import
+
+rawpy = lazy_import('rawpy')
+exifread = lazy_import('exifread')
+io = lazy_import('skimage.io')
+plt = lazy_import('matplotlib.pyplot')
 
 
 image_readers = []
@@ -1,8 +1,10 @@
 from __future__ import print_function, division
 import numpy as np
-import matplotlib.pyplot as plt
-from matplotlib.patches import Rectangle
-from mpl_toolkits.axes_grid1 import make_axes_locatable
+from .helpers import lazy_import
+
+plt = lazy_import('matplotlib.pyplot')
+patches = lazy_import('matplotlib.patches')
+axes_grid1 = lazy_import('mpl_toolkits.axes_grid1')
 
 
 def tableau20_colors():
@@ -86,7 +88,7 @@ def my_hist2d(ax, data1, data2, bins=None, z=30):
     dy = yy[1] - yy[0]
 
     im = ax.contourf(yy[0:-1], xx[0:-1], hist * dx * dy, z)
-    # ax_divider = make_axes_locatable(ax)
+    # ax_divider = axes_grid1.make_axes_locatable(ax)
     # cax = ax_divider.append_axes("right", size="7%", pad="2%")
     cb = plt.colorbar(im, ax=ax)
 
@@ -153,8 +155,8 @@ def center_plot(data, x0=None, y0=None):
 
     fig, axs = plt.subplots(1, 2, figsize=(12, 6))
     cb = axs[0].imshow(data, cmap='gray', origin='lower')
-    axs[0].add_patch(Rectangle((x0 - dx, y0 - dy), 2 * dx, 2 * dy, lw=2, linestyle='--', ec='red', fc='none'))
-    divider = make_axes_locatable(axs[0])
+    axs[0].add_patch(patches.Rectangle((x0 - dx, y0 - dy), 2 * dx, 2 * dy, lw=2, linestyle='--', ec='red', fc='none'))
+    divider = axes_grid1.make_axes_locatable(axs[0])
     cax = divider.append_axes("right", size="5%", pad=0.05)
     fig.colorbar(cb, cax=cax)
     axs[1].imshow(data, cmap='gray', origin='lower')
@@ -261,7 +263,7 @@ def ring_plot(data, fax=None, block=True):
 
     cb = ax.imshow(data, cmap='Greys_r', origin='lower', interpolation=None)
     #cb = ax.imshow(data, cmap='Greys_r', interpolation=None)
-    divider = make_axes_locatable(ax)
+    divider = axes_grid1.make_axes_locatable(ax)
     cax = divider.append_axes('right', size='5%', pad=0.05)
     fig.colorbar(cb, cax=cax, extend='max')
     if fax is not None:
@@ -0,0 +1,121 @@
+"""numpy arrays in shared memory for process pools
+
+A SharedArray pickles as the name of its shared memory block, so data arrays handed to a
+ProcessPoolExecutor (as initializer arguments or inside a likelihood object) are attached by
+every worker instead of copied. Without multiprocessing.shared_memory (python < 3.8) it falls
+back to an ordinary array that pickles by value.
+
+Classes:
+    SharedArray: numpy array backed by a multiprocessing.shared_memory block
+"""
+from __future__ import print_function, division
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None
+
+
+class SharedArray(object):
+    """numpy array backed by a shared memory block
+
+    The process that creates the array owns the block and unlinks it with unlink() (or when
+    used as a context manager). Workers attach to it when unpickled.
+
+    Attributes:
+        shape (tuple): array shape
+        dtype (np.dtype): array data type
+        name (str): shared memory block name, None for the fallback
+    """
+
+    def __init__(self, shape, dtype=np.float64):
+        super(SharedArray, self).__init__()
+        self.shape = tuple(np.atleast_1d(shape).astype(int))
+        self.dtype = np.dtype(dtype)
+        self._owner = True
+        if shared_memory is None:
+            self._shm = None
+            self.name = None
+            self._array = np.zeros(self.shape, dtype=self.dtype)
+        else:
+            nbytes = max(1, int(np.prod(self.shape)) * self.dtype.itemsize)
+            self._shm = shared_memory.SharedMemory(create=True, size=nbytes)
+            self.name = self._shm.name
+            self._array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+            self._array[...] = 0
+
+    @classmethod
+    def from_array(cls, array):
+        """Creates a SharedArray holding a copy of array
+
+        Args:
+            array (np.ndarray): data to copy into shared memory
+
+        Returns:
+            SharedArray
+        """
+        array = np.asarray(array)
+        new = cls(array.shape, dtype=array.dtype)
+        new.array[...] = array
+        return new
+
+    def __repr__(self):
+        class_name = type(self).__name__
+        return "{}(shape={!r}, dtype={!r}, name={!r})".format(class_name, self.shape, self.dtype.str, self.name)
+
+    @property
+    def array(self):
+        """np.ndarray: view of the shared data"""
+        return self._array
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None:
+            return self._array
+        return self._array.astype(dtype, copy=False)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, item):
+        return self._array[item]
+
+    def __setitem__(self, item, value):
+        self._array[item] = value
+
+    def __getstate__(self):
+        if self._shm is None:
+            return {'shape': self.shape, 'dtype': self.dtype.str, 'name': None, 'array': self._array}
+        return {'shape': self.shape, 'dtype': self.dtype.str, 'name': self.name}
+
+    def __setstate__(self, state):
+        self.shape = tuple(state['shape'])
+        self.dtype = np.dtype(state['dtype'])
+        self.name = state['name']
+        self._owner = False
+        if self.name is None:
+            self._shm = None
+            self._array = state['array']
+        else:
+            self._shm = shared_memory.SharedMemory(name=self.name)
+            self._array = np.ndarray(self.shape, dtype=self.dtype, buffer=self._shm.buf)
+
+    def close(self):
+        """Detaches this process from the shared memory block"""
+        if self._shm is not None:
+            self._array = None
+            self._shm.close()
+            self._shm = None
+
+    def unlink(self):
+        """Detaches and, in the owning process, frees the shared memory block"""
+        shm = self._shm
+        self.close()
+        if shm is not None and self._owner:
+            shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.unlink()
@@ -0,0 +1,44 @@
+from __future__ import division, print_function
+import h5py
+import numpy as np
+import pytest
+from fabry.core.dataset import DatasetFactory, ParameterGrid, read_case
+
+base = {"sensor": {"nx": 64, "ny": 48, "px_size": 0.004},
+        "etalon": {"L": 150.0, "d": 0.88, "F": 21.0},
+        "light_source": {"temperature": 0.5, "wavelength": 487.98634, "mu": 39.948, "velocity": 0.0},
+        "camera": {"gain": 1.0, "read_noise": 5.0, "bit_depth": 16},
+        "peak_counts": 2000.0}
+grid = ParameterGrid({'etalon.F': [18.0, 22.0], 'light_source.temperature': [0.3, 1.0]})
+
+
+def test_resume_matches_uninterrupted_run(tmp_path):
+    reference = str(tmp_path / 'reference.h5')
+    resumed = str(tmp_path / 'resumed.h5')
+    assert DatasetFactory(base, grid, seed=7).run(reference, nworkers=1) == len(grid)
+    assert DatasetFactory(base, grid, seed=7).run(resumed, nworkers=1) == len(grid)
+
+    # an interrupted run leaves a case without the complete flag and never starts the later ones
+    with h5py.File(resumed, 'a') as h5:
+        h5['cases/000001'].attrs['complete'] = False
+        del h5['cases/000002']
+        del h5['cases/000003']
+
+    assert DatasetFactory(base, grid, seed=7).run(resumed, nworkers=1) == 3
+    assert DatasetFactory(base, grid, seed=7).run(resumed, nworkers=1) == 0
+
+    for index in range(len(grid)):
+        expected = read_case(reference, index)
+        case = read_case(resumed, index)
+        np.testing.assert_array_equal(case['image'], expected['image'])
+        assert case['truth'] == grid[index]
+        assert case['config'] == expected['config']
+
+
+def test_resume_rejects_a_different_design(tmp_path):
+    fname = str(tmp_path / 'store.h5')
+    DatasetFactory(base, grid, seed=7).run(fname, nworkers=1)
+    with pytest.raises(ValueError):
+        DatasetFactory(base, grid, seed=8).run(fname, nworkers=1)
+    with pytest.raises(ValueError):
+        DatasetFactory(base, ParameterGrid({'etalon.F': [18.0, 22.0]}), seed=7).run(fname, nworkers=1)
@@ -0,0 +1,45 @@
+from __future__ import division, print_function
+import numpy as np
+import pytest
+from fabry.core import instrument, models
+
+L = 150.0 / 0.004
+d = 0.88
+F = 20.7
+r = np.linspace(0.0, 900.0, 400)
+
+
+def test_ideal_etalon_matches_forward_model():
+    defects = instrument.EtalonDefects()
+    for w0, mu, amp, temp, v in [(487.98634, 39.948, 1.0, 0.5, 0.0),
+                                 (487.98634, 39.948, 3.0, 2.0, 2500.0),
+                                 ([487.873302, 487.98634], [232.03806, 39.948], [0.3, 1.0], [0.1, 0.8], [0.0, -1000.0])]:
+        model = instrument.instrument_forward_model(r, L, d, F, w0, mu, amp, temp, v, defects)
+        expected = models.forward_model(r, L, d, F, w0, mu, amp, temp, v)
+        np.testing.assert_allclose(model, expected, rtol=0.0, atol=1e-4 * expected.max())
+
+
+def test_scalar_line_parameters_are_broadcast():
+    defects = instrument.EtalonDefects()
+    w0 = [487.873302, 487.98634]
+    scalar = instrument.instrument_forward_model(r, L, d, F, w0, 39.948, 1.0, 0.5, 0.0, defects)
+    listed = instrument.instrument_forward_model(r, L, d, F, w0, [39.948, 39.948], [1.0, 1.0], [0.5, 0.5],
+                                                 [0.0, 0.0], defects)
+    np.testing.assert_allclose(scalar, listed, rtol=1e-12)
+
+    expected = models.forward_model(r, L, d, F, w0, 39.948, 1.0, 0.5, 0.0)
+    np.testing.assert_allclose(scalar, expected, rtol=0.0, atol=1e-4 * expected.max())
+
+
+def test_mismatched_line_parameters_raise():
+    with pytest.raises(ValueError):
+        instrument.instrument_forward_model(r, L, d, F, [487.873302, 487.98634], 39.948, [1.0, 2.0, 3.0], 0.5, 0.0,
+                                            instrument.EtalonDefects())
+
+
+def test_defects_conserve_the_fringe_area():
+    # the kernels are normalized, broadening spreads the fringe without changing its period average
+    phase, ideal = instrument.instrument_function(F, instrument.EtalonDefects(), 487.98634)
+    _, broad = instrument.instrument_function(F, instrument.EtalonDefects(gaussian=2.0, aperture=0.02), 487.98634)
+    np.testing.assert_allclose(np.mean(broad), np.mean(ideal), rtol=1e-10)
+    assert broad.max() < ideal.max()
@@ -0,0 +1,65 @@
+from __future__ import division, print_function
+import numpy as np
+import pytest
+from fabry.core.likelihood import CalibrationMarginalizer
+
+rng = np.random.RandomState(42)
+npost = 50
+Lpost = 37500.0 + 40.0 * rng.randn(npost)
+dpost = 0.88 + 1e-4 * rng.randn(npost)
+Fpost = 20.7 + 0.3 * rng.randn(npost)
+
+x = np.linspace(-1.0, 1.0, 25)
+sig = 1.0 + 0.5 * x
+error = 0.1 * np.ones_like(x)
+
+
+def model_func(L, d, F):
+    return (L - 37500.0) / 40.0 * x ** 2 + (d - 0.88) * 1e4 * x + F / 20.7
+
+
+def test_samples_match_brute_force():
+    # with nsamples >= len(posterior) every posterior sample is a node
+    marginalizer = CalibrationMarginalizer(Lpost, dpost, Fpost, method='samples', nsamples=2 * npost)
+    assert len(marginalizer) == npost
+
+    chisq = np.array([np.sum((model_func(L, d, F) - sig) ** 2 / error ** 2)
+                      for L, d, F in zip(Lpost, dpost, Fpost)])
+    expected = np.log(np.mean(np.exp(-chisq / 2.0)))
+
+    np.testing.assert_allclose(marginalizer.log_likelihood(model_func, sig, error), expected, rtol=1e-12)
+    loglike = lambda L, d, F: -0.5 * np.sum((model_func(L, d, F) - sig) ** 2 / error ** 2)
+    np.testing.assert_allclose(marginalizer.marginal_log_likelihood(loglike), expected, rtol=1e-12)
+
+
+def test_samples_are_fixed_posterior_draws():
+    first = CalibrationMarginalizer(Lpost, dpost, Fpost, nsamples=10, seed=3)
+    second = CalibrationMarginalizer(Lpost, dpost, Fpost, nsamples=10, seed=3)
+    np.testing.assert_array_equal(first.nodes, second.nodes)
+
+    posterior = np.vstack((Lpost, dpost, Fpost)).T
+    for node in first.nodes:
+        assert np.any(np.all(posterior == node, axis=1))
+
+
+def test_moment_matches_sample_moments_for_linear_model():
+    # sigma points reproduce the posterior mean and covariance, exact for a model linear in L, d, F
+    linear = lambda L, d, F: (L - 37500.0) / 40.0 * x ** 2 + (d - 0.88) * 1e4 * x + F / 20.7
+    marginalizer = CalibrationMarginalizer(Lpost, dpost, Fpost, method='moment')
+    assert len(marginalizer) == 7
+
+    vals = np.array([linear(L, d, F) for L, d, F in zip(Lpost, dpost, Fpost)])
+    variance = error ** 2 + np.var(vals, axis=0, ddof=1)
+    chisq = np.sum((np.mean(vals, axis=0) - sig) ** 2 / variance)
+    expected = -chisq / 2.0 - 0.5 * np.sum(np.log(variance / error ** 2))
+
+    np.testing.assert_allclose(marginalizer.log_likelihood(linear, sig, error), expected, rtol=1e-8)
+
+
+def test_missing_finesse_posterior():
+    marginalizer = CalibrationMarginalizer(Lpost, dpost, method='moment')
+    assert len(marginalizer) == 5
+    assert all(F is None for _, _, F in marginalizer)
+
+    with pytest.raises(ValueError):
+        marginalizer.marginal_log_likelihood(lambda L, d, F: 0.0)
@@ -0,0 +1,72 @@
+from __future__ import division, print_function
+import numpy as np
+from fabry.core import models
+
+r = np.linspace(0.0, 900.0, 300)
+params = {'L': 150.0 / 0.004, 'd': 0.88, 'F': 20.7, 'amp': 2.0, 'temp': 0.5, 'v': 1500.0}
+w0 = 487.98634
+mu = 39.948
+# the Airy phase is ~1e4 rad, so d needs a much smaller relative step than the other parameters
+rel_steps = {'L': 1e-6, 'd': 1e-9, 'F': 1e-6, 'amp': 1e-4, 'temp': 1e-4, 'v': 1e-4}
+
+
+def finite_difference(key, params):
+    # central difference on the same fixed wavelength grid that the jacobian is taken on
+    step = rel_steps[key] * abs(params[key])
+    wavelength = _wavelength_grid(params)
+    up = dict(params)
+    down = dict(params)
+    up[key] += step
+    down[key] -= step
+    return (_fixed_grid_model(up, wavelength) - _fixed_grid_model(down, wavelength)) / (2.0 * step)
+
+
+def _wavelength_grid(p, nlambda=1024):
+    sigma = models.doppler_broadening(w0, mu, p['temp'])
+    w = models.doppler_shift(w0, p['v'])
+    return np.linspace(w - 10. * sigma, w + 10. * sigma, nlambda)
+
+
+def _fixed_grid_model(p, wavelength):
+    emission = models.gaussian(wavelength, models.doppler_shift(w0, p['v']),
+                               models.doppler_broadening(w0, mu, p['temp']), amp=p['amp'])
+    return models.general_model(r, p['L'], p['d'], p['F'], wavelength, emission)
+
+
+def test_forward_model_jacobian_matches_forward_model():
+    model, _ = models.forward_model_jacobian(r, params['L'], params['d'], params['F'], w0, mu, params['amp'],
+                                             params['temp'], params['v'])
+    expected = models.forward_model(r, params['L'], params['d'], params['F'], w0, mu, params['amp'],
+                                    params['temp'], params['v'])
+    np.testing.assert_allclose(model, expected, rtol=1e-10, atol=1e-12 * expected.max())
+
+
+def test_forward_model_jacobian_matches_finite_differences():
+    _, jac = models.forward_model_jacobian(r, params['L'], params['d'], params['F'], w0, mu, params['amp'],
+                                           params['temp'], params['v'])
+    for key in ('L', 'd', 'F', 'amp', 'temp', 'v'):
+        fd = finite_difference(key, params)
+        np.testing.assert_allclose(jac[key], fd, rtol=0.0, atol=1e-5 * np.abs(fd).max(), err_msg=key)
+
+
+def test_general_model_jacobian_matches_finite_differences():
+    wavelength = _wavelength_grid(params)
+    emission = models.gaussian(wavelength, w0, models.doppler_broadening(w0, mu, 0.5), amp=2.0)
+    _, jac = models.general_model_jacobian(r, params['L'], params['d'], params['F'], wavelength, emission)
+    for key in ('L', 'd', 'F'):
+        step = rel_steps[key] * params[key]
+        args = {k: params[k] for k in ('L', 'd', 'F')}
+        up = dict(args, **{key: args[key] + step})
+        down = dict(args, **{key: args[key] - step})
+        fd = (models.general_model(r, wavelength=wavelength, emission=emission, **up) -
+              models.general_model(r, wavelength=wavelength, emission=emission, **down)) / (2.0 * step)
+        np.testing.assert_allclose(jac[key], fd, rtol=0.0, atol=1e-5 * np.abs(fd).max(), err_msg=key)
+
+
+def test_multiple_line_jacobian_shapes():
+    _, jac = models.forward_model_jacobian(r, params['L'], params['d'], params['F'], [487.873302, 487.98634],
+                                           [232.03806, 39.948], [0.3, 1.0], [0.1, 0.8], [0.0, -1000.0])
+    for key in ('L', 'd', 'F'):
+        assert jac[key].shape == r.shape
+    for key in ('amp', 'temp', 'v'):
+        assert jac[key].shape == (2, len(r))
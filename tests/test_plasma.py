@@ -0,0 +1,47 @@
+from __future__ import division, print_function
+import numpy as np
+from fabry.core import models
+from fabry.plasma import plasma
+
+w0 = 487.98634
+mu = 39.948
+
+
+def reference_chord_emission(impact_factor, Ti, Lnu, Vouter, rmax=40.0, nr=101, nlambda=2000, Lne=2.5, R_outer=35):
+    """calculate_pcx_chord_emission before ChordModel, with the full (nr, nlambda) spectrum matrix"""
+    r, theta, x = plasma.calculate_r_theta_x_from_impact_factor(impact_factor, rmax=rmax, npts=nr)
+    vel_adjusted = plasma.pcx_velocity_profile(r, Lnu, R_outer, Vouter) * np.cos(theta)
+
+    w_shifted_max = models.doppler_shift(w0, np.max(vel_adjusted))
+    sigma = models.doppler_broadening(w_shifted_max, mu, Ti)
+    wavelength = np.linspace(-1, 1, nlambda) * 10.0 * sigma + w_shifted_max
+
+    w_shifts = models.doppler_shift(w0, vel_adjusted)
+    full_spectrum = models.gaussian(wavelength[np.newaxis, :], w_shifts[:, np.newaxis], sigma, amp=1.0, norm=False)
+    full_spectrum *= plasma.density_profile(r, rmax, Lne)[:, np.newaxis] ** 2
+
+    return wavelength, np.trapz(full_spectrum, x=x, axis=0)
+
+
+def test_chord_model_matches_reference():
+    for impact_factor, Ti, Lnu, Vouter in [(5.0, 0.5, 20.0, 2000.0), (25.0, 1.5, 60.0, -4000.0), (33.0, 0.1, 3.0, 500.0)]:
+        chord = plasma.ChordModel(impact_factor, w0, mu, nr=201, nlambda=1000, Lne=4.0)
+        wavelength, spectrum = chord(Ti, Lnu, Vouter)
+        ref_wavelength, ref_spectrum = reference_chord_emission(impact_factor, Ti, Lnu, Vouter, nr=201,
+                                                                nlambda=1000, Lne=4.0)
+
+        np.testing.assert_allclose(wavelength, ref_wavelength, rtol=1e-12)
+        np.testing.assert_allclose(spectrum, ref_spectrum, rtol=1e-9, atol=1e-12 * ref_spectrum.max())
+
+
+def test_chord_model_is_reusable():
+    chord = plasma.ChordModel(15.0, w0, mu)
+    first = chord(0.5, 20.0, 2000.0)[1]
+    chord(2.0, 40.0, -1000.0)
+    np.testing.assert_array_equal(chord(0.5, 20.0, 2000.0)[1], first)
+
+
+def test_calculate_pcx_chord_emission_uses_chord_model():
+    wavelength, spectrum = plasma.calculate_pcx_chord_emission(15.0, 0.5, w0, mu, 20.0, 2000.0)
+    ref_wavelength, ref_spectrum = reference_chord_emission(15.0, 0.5, 20.0, 2000.0)
+    np.testing.assert_allclose(spectrum, ref_spectrum, rtol=1e-9, atol=1e-12 * ref_spectrum.max())
@@ -0,0 +1,65 @@
+from __future__ import division, print_function
+import numpy as np
+import pytest
+from fabry.core.predictive import StreamingQuantiles, PredictiveBands
+
+probabilities = [0.005, 0.025, 0.16, 0.5, 0.84, 0.975, 0.995]
+
+
+def random_streams(nsamples=20000, seed=0):
+    rng = np.random.RandomState(seed)
+    # differently shaped distributions in each stream
+    return np.column_stack((rng.randn(nsamples), 3.0 + 0.1 * rng.randn(nsamples), rng.uniform(-2.0, 5.0, nsamples),
+                            rng.exponential(2.0, nsamples), rng.gamma(2.0, 1.5, nsamples)))
+
+
+def test_streaming_quantiles_match_percentile():
+    samples = random_streams()
+    estimator = StreamingQuantiles(probabilities, samples.shape[1])
+    for batch in np.array_split(samples, 37):
+        estimator.update(batch)
+
+    assert estimator.count == len(samples)
+    estimates = estimator.quantiles()
+    expected = np.percentile(samples, 100.0 * np.array(probabilities), axis=0)
+    assert estimates.shape == expected.shape
+    assert np.all(np.abs(estimates - expected) < 0.02 * np.std(samples, axis=0))
+
+
+def test_streaming_quantiles_are_exact_for_few_samples():
+    samples = random_streams(nsamples=4)
+    estimator = StreamingQuantiles(probabilities, samples.shape[1])
+    estimator.update(samples)
+    np.testing.assert_allclose(estimator.quantiles(),
+                               np.percentile(samples, 100.0 * np.array(probabilities), axis=0), rtol=1e-12)
+
+
+def test_streaming_quantiles_bad_input():
+    with pytest.raises(ValueError):
+        StreamingQuantiles([0.0, 0.5], 3)
+    with pytest.raises(ValueError):
+        StreamingQuantiles([0.5], 3).quantiles()
+
+
+def test_predictive_bands():
+    samples = random_streams()
+    bands = PredictiveBands(samples.shape[1], levels=(68, 95))
+    for batch in np.array_split(samples, 11):
+        bands.update(batch)
+
+    np.testing.assert_allclose(bands.mean, np.mean(samples, axis=0), rtol=1e-10)
+    np.testing.assert_allclose(bands.std, np.std(samples, axis=0, ddof=1), rtol=1e-10)
+
+    spread = 0.02 * np.std(samples, axis=0)
+    assert np.all(np.abs(bands.median - np.median(samples, axis=0)) < spread)
+    for level, (lower, upper) in bands.percentiles.items():
+        expected = np.percentile(samples, [50.0 - level / 2.0, 50.0 + level / 2.0], axis=0)
+        assert np.all(np.abs(lower - expected[0]) < spread)
+        assert np.all(np.abs(upper - expected[1]) < spread)
+
+    restored = PredictiveBands.from_dict(bands.to_dict())
+    assert restored.count == bands.count
+    np.testing.assert_allclose(restored.std, bands.std, rtol=1e-12)
+    np.testing.assert_array_equal(restored.median, bands.median)
+    for level in bands.percentiles:
+        np.testing.assert_array_equal(restored.percentiles[level], bands.percentiles[level])
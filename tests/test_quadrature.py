@@ -0,0 +1,31 @@
+from __future__ import division, print_function
+import numpy as np
+from fabry.core import models, quadrature
+
+L = 150.0 / 0.004
+d = 0.88
+F = 20.7
+r = np.linspace(0.0, 1500.0, 500)
+
+
+def test_hermite_forward_model_matches_forward_model():
+    # the last case is broad enough in orders that no Hermite rule resolves it (Fourier fallback)
+    for w0, mu, amp, temp, v in [(487.98634, 39.948, 1.0, 0.5, 0.0),
+                                 (487.98634, 39.948, 2.0, 5.0, 3000.0),
+                                 ([487.873302, 487.98634], [232.03806, 39.948], [0.3, 1.0], [0.1, 0.8], [0.0, -1000.0]),
+                                 (468.564, 4.002, 1.0, 200.0, 0.0)]:
+        expected = models.forward_model(r, L, d, F, w0, mu, amp, temp, v, nlambda=8192)
+        model = quadrature.hermite_forward_model(r, L, d, F, w0, mu, amp, temp, v, rtol=1e-5)
+        np.testing.assert_allclose(model, expected, rtol=0.0, atol=1e-4 * expected.max())
+
+
+def test_unresolved_lines_are_not_cached_as_resolved():
+    assert quadrature.required_nodes(0.1, F) is not None
+    assert quadrature.required_nodes(20.0, F, max_nodes=16) is None
+    assert quadrature.required_nodes(20.0, F, max_nodes=16) is None
+
+
+def test_fourier_forward_model_matches_forward_model():
+    expected = models.forward_model(r, L, d, F, 487.98634, 39.948, 1.0, 0.5, 0.0, nlambda=8192)
+    model = quadrature.fourier_forward_model(r, L, d, F, 487.98634, 39.948, 1.0, 0.5, 0.0)
+    np.testing.assert_allclose(model, expected, rtol=0.0, atol=1e-4 * expected.max())